@@ -4,8 +4,10 @@ from collections import deque
 import aiohttp
 import asyncio
 import json
+import time
 import Sensors
 import Goals_BT
+import History
 
 import tkinter as tk
 from threading import Thread
@@ -45,6 +47,22 @@ class AAgent_interface:
         self.gui_root.mainloop()
 
 
+async def wait_any(*events):
+    """
+    Waits till at least one of the asyncio events is set, without consuming CPU in the meanwhile.
+    :param events: asyncio.Event objects to wait for.
+    """
+    for event in events:
+        if event.is_set():
+            return
+    waiters = [asyncio.create_task(event.wait()) for event in events]
+    try:
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
 class InternalState:
     """
     Internal state
@@ -121,6 +139,8 @@ class AAgent:
 
         # Agent internal state
         self.i_state = InternalState()
+        # Unwrapped heading of the agent, integrated on every frame (see History.YawTracker)
+        self.yaw = History.YawTracker()
 
         # Misc. variables
         # variables used for the websocket connection
@@ -132,6 +152,13 @@ class AAgent:
         self.exit_event = asyncio.Event()
         # Flag that confirms the connection with Unity is fully operative and that Unity is waiting for messages
         self.connection_ready = False
+        # Asyncio events that wake up the main loop only when there is something to do
+        # connection_ready_event -> set when Unity confirms the connection ("connection_ready")
+        # running_event -> set while the simulation is RUNNING, cleared when it is ON_HOLD
+        # work_event -> set every time a new action, goal or behaviour tree arrives through "agent_control"
+        self.connection_ready_event = asyncio.Event()
+        self.running_event = asyncio.Event()
+        self.work_event = asyncio.Event()
 
         # Reference to the possible goals the agent can execute
         self.goals = {
@@ -229,14 +256,18 @@ class AAgent:
             if msg_dict["Type"] == "sensor":
                 self.rc_sensor.set_perception(msg_dict["Content"][0])
                 self.i_state.update_internal_state(msg_dict["Content"][1])
+                self.yaw.update(time.monotonic(), self.i_state.rotation["y"])
             elif msg_dict["Type"] == "sim_control":
                 if msg_dict["Content"] == "connection_ready":
                     self.connection_ready = True
+                    self.connection_ready_event.set()
                 elif msg_dict["Content"] == "on_hold":
                     self.simulation_state = self.ON_HOLD
+                    self.running_event.clear()
                     print("ON HOLD")
                 elif msg_dict["Content"] == "start":
                     self.simulation_state = self.RUNNING
+                    self.running_event.set()
                     print("RUNNING")
                 elif msg_dict["Content"] == "error":
                     print("Error creating the agent in Unity.")
@@ -270,6 +301,9 @@ class AAgent:
                         self.currentBT = data
                     else:
                         print("Agent_control message with an unknown command: " + msg_dict["content"])
+                        return
+                    # Wake up the main loop, there is new work to do
+                    self.work_event.set()
                 except Exception as e:
                     print(f"Exception1: {e}")
                     print(f"Message: {msg_data}")
@@ -286,8 +320,8 @@ class AAgent:
         while not self.exit_event.is_set():
             # Control if we are on hold (simulation paused from Unity)
             if self.simulation_state == self.ON_HOLD:
-                # Just wait, but allow the other tasks keep running
-                await asyncio.sleep(0)
+                # Sleep till Unity starts the simulation (or we have to exit)
+                await wait_any(self.running_event, self.exit_event)
             else:
                 # Here is where we perform the agent actions
                 # It can be the case we are executing a single action, a simple goal or a behaviour tree
@@ -302,7 +336,9 @@ class AAgent:
                         # We are running a behaviour tree
                         await self.bts[self.currentBT].tick()
                     else:
-                        await asyncio.sleep(0)
+                        # Nothing to do. Sleep till a new action, goal or BT arrives (or we have to exit)
+                        self.work_event.clear()
+                        await wait_any(self.work_event, self.exit_event)
                 except Exception as e:
                     print("Execution failed.")
                     print(f"Exception3: {e}")
@@ -325,8 +361,9 @@ class AAgent:
                 asyncio.create_task(self.receive_messages())
                 # Wait for the flag "connection_ready" to be True. If it is true, it means we have received an ack
                 # from Unity saying that the connection is fully established and Unity is ready to receive messages
-                while not self.connection_ready:
-                    await asyncio.sleep(0)
+                await wait_any(self.connection_ready_event, self.exit_event)
+                if self.exit_event.is_set():
+                    return
                 print("Connection with Unity fully established")
 
                 # We are ready now  to start the main loop of the agent
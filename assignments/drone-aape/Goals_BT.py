@@ -63,6 +63,9 @@ class Turn:
     The Drone randomly selects a degree of turn between 10 and 360,
     along with a direction (left or right), and executes the turn accordingly.
     """
+    # Seconds to wait for the turn before giving up (the drone may be blocked)
+    TIMEOUT = 10.0
+
     def __init__(self, a_agent):
         self.a_agent = a_agent
         self.i_state = a_agent.i_state  # Access to the agent's state
@@ -78,58 +81,22 @@ class Turn:
             direction = random.choice(["tl", "tr"])  # "tl" for left, "tr" for right"
 
             print(f"🔄 Turning {turn_angle} degrees to the {'left' if direction == 'tl' else 'right'}")
-            
-            # Calculate the target rotation
-            if direction == "tl":  # Turning left (counter-clockwise)
-                target_rotation = (start_rotation - turn_angle + 360) % 360
-            else:  # Turning right (clockwise)
-                target_rotation = (start_rotation + turn_angle) % 360
-
-            print(f"Target rotation: {target_rotation}")
 
             # Send turn command
             await self.a_agent.send_message("action", direction)
 
-            # Keep track of how much we've turned so far
-            # Store initial rotation to compare against
-            initial_rotation = start_rotation
-            last_rotation = initial_rotation
-            total_turned = 0
-
-            # Continuously check rotation until we reach close to the target
-            while True:
-                current_rotation = self.i_state.rotation["y"]
-                
-                # Calculate how much we turned since last check
-                delta = 0
-                if direction == "tl":  # Left turn
-                    if current_rotation > last_rotation:  # We crossed from 0 to 359
-                        delta = -(last_rotation + (360 - current_rotation))
-                    else:
-                        delta = -(last_rotation - current_rotation)
-                else:  # Right turn
-                    if current_rotation < last_rotation:  # We crossed from 359 to 0
-                        delta = (360 - last_rotation) + current_rotation
-                    else:
-                        delta = current_rotation - last_rotation
-                
-                # Add to total amount turned
-                total_turned += delta
-                print(f"Current: {current_rotation:.2f}, Delta: {delta:.2f}, Total turned: {abs(total_turned):.2f}/{turn_angle}")
-                
-                # Check if we've turned enough (with small tolerance)
-                if abs(total_turned) >= turn_angle - 5:
-                    break
-                    
-                # Update last rotation for next iteration
-                last_rotation = current_rotation
-                
-                await asyncio.sleep(0.05)  # Small delay to prevent overloading
+            # Wait for the frame where we have turned enough (with small tolerance)
+            total_turned = await self.a_agent.yaw.turned(turn_angle - 5, direction, self.TIMEOUT)
+            current_rotation = self.i_state.rotation["y"]
 
             # Stop turning
             await self.a_agent.send_message("action", "nt")
 
-            print(f"✅ Turn complete! Started at {initial_rotation:.2f}°, ended at {current_rotation:.2f}°, turned {abs(total_turned):.2f}° towards the {'left' if direction == 'tl' else 'right'}")
+            if total_turned is None:
+                print(f"❌ Could not turn {turn_angle} degrees in {self.TIMEOUT} s")
+                return False
+
+            print(f"✅ Turn complete! Started at {start_rotation:.2f}°, ended at {current_rotation:.2f}°, turned {abs(total_turned):.2f}° towards the {'left' if direction == 'tl' else 'right'}")
             await asyncio.sleep(10)
             return True
 
@@ -178,7 +145,7 @@ class RandomRoam:
         # Tracking variables
         self.current_turn_angle = 0
         self.turned_so_far = 0
-        self.last_rotation = 0
+        self.turn_start_heading = 0  # Unwrapped heading of History.YawTracker
         self.state_start_time = time.time()
         self.state_duration = 0
 
@@ -246,13 +213,13 @@ class RandomRoam:
             action = "tl"
             self.current_turn_angle = random.randint(self.MIN_TURN_ANGLE, self.MAX_TURN_ANGLE)
             self.turned_so_far = 0
-            self.last_rotation = self.i_state.rotation["y"]
+            self.turn_start_heading = self.a_agent.yaw.heading
             self.state_duration = float('inf')  # Turn completes based on angle
         elif new_state == self.TURNING_RIGHT:
             action = "tr"
             self.current_turn_angle = random.randint(self.MIN_TURN_ANGLE, self.MAX_TURN_ANGLE)
             self.turned_so_far = 0
-            self.last_rotation = self.i_state.rotation["y"]
+            self.turn_start_heading = self.a_agent.yaw.heading
             self.state_duration = float('inf')
         
         if action:
@@ -263,23 +230,9 @@ class RandomRoam:
 
     async def update_turning_progress(self):
         """Update turning progress and return True if turn is complete"""
-        current_rotation = self.i_state.rotation["y"]
-        delta = 0
-        
-        if self.state == self.TURNING_LEFT:
-            if current_rotation > self.last_rotation:  # Crossed 0-359 boundary
-                delta = (360 - current_rotation) + self.last_rotation
-            else:
-                delta = self.last_rotation - current_rotation
-        else:  # Turning right
-            if current_rotation < self.last_rotation:  # Crossed 359-0 boundary
-                delta = (360 - self.last_rotation) + current_rotation
-            else:
-                delta = current_rotation - self.last_rotation
-        
-        self.turned_so_far += delta
-        self.last_rotation = current_rotation
-        
+        direction = "tl" if self.state == self.TURNING_LEFT else "tr"
+        self.turned_so_far = self.a_agent.yaw.turned_since(self.turn_start_heading, direction)
+
         if self.turned_so_far >= self.current_turn_angle:
             await self.a_agent.send_message("action", "nt")
             return True
@@ -313,7 +266,7 @@ class Avoid:
         self.REQUIRED_HITS = 1   # min sensors detecting obstacle
         
         # Turn tracking
-        self.turn_start_rot = 0
+        self.turn_start_heading = 0  # Unwrapped heading of History.YawTracker
         self.turn_direction = None
         self.turn_progress = 0
 
@@ -379,28 +332,16 @@ class Avoid:
         """Start a new turn sequence"""
         await self.a_agent.send_message("action", "stop")
         self.turn_direction = random.choice(["tl", "tr"])
-        self.turn_start_rot = self.i_state.rotation["y"]
+        self.turn_start_heading = self.a_agent.yaw.heading
         self.turn_progress = 0
         
-        print(f"Starting {self.turn_direction} turn from {self.turn_start_rot}°")
+        print(f"Starting {self.turn_direction} turn from {self.i_state.rotation['y']}°")
         await self.a_agent.send_message("action", self.turn_direction)
         self.state = self.TURNING
 
     async def update_turn(self):
         """Update turn progress and return True when complete"""
-        current_rot = self.i_state.rotation["y"]
-        
-        # Calculate turn progress
-        if self.turn_direction == "tl":  # Left turn
-            if current_rot > self.turn_start_rot:  # Crossed 0°
-                delta = (360 - current_rot) + self.turn_start_rot
-            else:
-                delta = self.turn_start_rot - current_rot
-        else:  # Right turn
-            if current_rot < self.turn_start_rot:  # Crossed 360°
-                delta = (360 - self.turn_start_rot) + current_rot
-            else:
-                delta = current_rot - self.turn_start_rot
+        delta = self.a_agent.yaw.turned_since(self.turn_start_heading, self.turn_direction)
         
         self.turn_progress = delta
         print(f"Turn progress: {delta:.1f}°/{self.TURN_ANGLE}°")
@@ -412,7 +353,7 @@ class Avoid:
 
     async def continue_turn(self):
         """Continue turning in same direction"""
-        self.turn_start_rot = self.i_state.rotation["y"]
+        self.turn_start_heading = self.a_agent.yaw.heading
         self.turn_progress = 0
         await self.a_agent.send_message("action", self.turn_direction)
         self.state = self.TURNING
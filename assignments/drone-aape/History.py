@@ -0,0 +1,80 @@
+# Copy of the YawTracker of assignments/flower-collector/History.py (each assignment is self-contained)
+import asyncio
+
+
+class YawTracker:
+    """
+    Integrates the yaw of the agent frame by frame, so the turns can be measured without worrying about the wrap
+    around 0/360 degrees. Updated by the agent on every sensor frame.
+    Assumes the agent turns less than 180 degrees between two frames (the shortest way is taken).
+        yaw: <float> Last yaw received, in [0, 360)
+        heading: <float> Unwrapped yaw relative to the first frame (0 till then): grows when turning right ("tr")
+                 and decreases when turning left ("tl")
+        angular_velocity: <float> Degrees per second between the last two frames (positive turning right)
+        waiters: <list> (start heading, direction, degrees, future) of the coroutines waiting in turned()
+    """
+    def __init__(self):
+        self.yaw = None
+        self.heading = 0.0
+        self.angular_velocity = 0.0
+        self.last_time = None
+        self.waiters = []
+
+    def update(self, timestamp, yaw):
+        """
+        Integrates the yaw of a new frame and wakes up the turned() waiters that reached their angle.
+        The first frame only sets the reference yaw: the heading does not move, so the starts captured before it
+        stay valid.
+        """
+        if self.yaw is None:
+            self.yaw = yaw
+            self.last_time = timestamp
+            return
+        delta = (yaw - self.yaw + 180.0) % 360.0 - 180.0
+        self.heading += delta
+        if timestamp > self.last_time:
+            self.angular_velocity = delta / (timestamp - self.last_time)
+        self.yaw = yaw
+        self.last_time = timestamp
+        if self.waiters:
+            pending = []
+            for waiter in self.waiters:
+                start, direction, degrees, future = waiter
+                if future.done():
+                    continue  # Cancelled or timed out
+                turned = self.turned_since(start, direction)
+                if turned >= degrees:
+                    future.set_result(turned)
+                else:
+                    pending.append(waiter)
+            self.waiters = pending
+
+    def turned_since(self, start, direction=None):
+        """
+        :param start: Heading at the beginning of the turn
+        :param direction: "tl", "tr" or None (any direction)
+        :return: Degrees turned since 'start' in 'direction' (negative if the agent turned the other way)
+        """
+        turned = self.heading - start
+        if direction == "tl":
+            return -turned
+        if direction == "tr":
+            return turned
+        return abs(turned)
+
+    async def turned(self, degrees, direction=None, timeout=None):
+        """
+        Waits till the agent turns 'degrees' from its current heading, and returns on the frame where it happens.
+        :param degrees: Angle to turn (returns right away if it is <= 0)
+        :param direction: "tl", "tr" or None (any direction)
+        :param timeout: Maximum time to wait in seconds (None waits forever)
+        :return: Degrees turned, or None if the timeout expired
+        """
+        if degrees <= 0:
+            return 0.0
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((self.heading, direction, degrees, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
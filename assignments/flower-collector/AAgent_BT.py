@@ -5,25 +5,54 @@ from collections import deque
 import aiohttp # type: ignore
 import asyncio
 import json
+import Codec
+import Recorder
+import Monitor
+import History
+import Events
 import Sensors
 import Goals_BT
 import BTRoam
 import BTAstronaut
 import BTCritter
 
+import time
 import tkinter as tk
 from threading import Thread
-import queue
-import copy
+import multiprocessing
 
 # Agent TK GUI
-gui_blackboard = queue.Queue()
+class GuiSnapshot:
+    """
+    Last sensor frame published for the Tk monitor, pulled by the GUI thread at its own pace.
+    The decoded messages are never modified once applied (the agent copies what it keeps), so publishing a frame
+    only replaces a reference to them, and the GUI thread can read the frame without locks or copies.
+        frame: <tuple> (version, i_state_dict, sensor_info) of the last frame, None till the first one arrives
+    """
+    def __init__(self):
+        self.frame = None
+
+    def publish(self, version, i_state_dict, sensor_info):
+        self.frame = (version, i_state_dict, sensor_info)
+
+    def latest(self):
+        return self.frame
+
+
+gui_blackboard = GuiSnapshot()
 exit_gui = False
 active_tk_gui = False
 
 
 # Agent TK GUI
 class AAgentInterface:
+    """
+    Tk window that shows the last frame received by the agent: one row per sensor ray and per internal state field.
+    The rows are fixed, so a new frame only rewrites the rows whose text changed, and nothing is rendered while the
+    version of the frame does not change.
+    """
+    INVENTORY_KEYS = ("myInventoryList", "nearbyContainerInventoryList")
+
     def __init__(self, aa_name):
         self.gui_root = tk.Tk()
         self.gui_root.title("AAGENT: " + aa_name)
@@ -32,28 +61,45 @@ class AAgentInterface:
         self.text.pack(expand=True, fill="both")
 
         self.gui_root.geometry("1200x600")
+        self.version = None  # Version of the frame on screen
+        self.rows = []  # Text of each row on screen
         self.update_values()
 
-    def update_values(self):
-        try:
-            i_state_data, sensor_data = gui_blackboard.get_nowait()
-            self.text.delete("1.0", tk.END)
-
-            # Sensor information
-            for s_data in sensor_data:
-                self.text.insert(tk.END, f"{s_data}\n")
+    @classmethod
+    def format_rows(cls, i_state_data, sensor_data):
+        """
+        :return: List with the text of each row: the sensor rays and then the internal state fields (the
+                 inventories take one row each)
+        """
+        rows = [f"{s_data}" for s_data in sensor_data]
+        for key, value in i_state_data.items():
+            if key in cls.INVENTORY_KEYS:
+                rows.append(f"{key}: " + ", ".join(f"{item['name']}={item['amount']}" for item in value))
+            else:
+                rows.append(f"{key}: {value}")
+        return rows
 
-            # internal_state information
-            for key, value in i_state_data.items():
-                if key == "nearbyContainerInventoryList" or key == "myInventoryList":
-                    self.text.insert(tk.END, f"{key}:\n")
-                    for item in value:
-                        self.text.insert(tk.END, f"{item}\n")
-                else:
-                    self.text.insert(tk.END, f"{key}: {value}\n")
+    def render(self, rows):
+        """
+        Shows 'rows', rewriting only the rows that changed (all of them if the number of rows changed).
+        """
+        if len(rows) != len(self.rows):
+            self.text.delete("1.0", tk.END)
+            self.text.insert("1.0", "\n".join(rows))
+        else:
+            for line, (old, new) in enumerate(zip(self.rows, rows), start=1):
+                if old != new:
+                    self.text.delete(f"{line}.0", f"{line}.end")
+                    self.text.insert(f"{line}.0", new)
+        self.rows = rows
 
-        except queue.Empty:
-            pass
+    def update_values(self):
+        try:
+            frame = gui_blackboard.latest()
+            if frame is None or frame[0] == self.version:
+                return  # Nothing new since the last update
+            self.version, i_state_data, sensor_data = frame
+            self.render(self.format_rows(i_state_data, sensor_data))
         finally:
             self.gui_root.after(100, self.update_values)
             if exit_gui:
@@ -63,25 +109,184 @@ class AAgentInterface:
         self.gui_root.mainloop()
 
 
+async def wait_any(*events):
+    """
+    Waits till at least one of the asyncio events is set, without consuming CPU in the meanwhile.
+    :param events: asyncio.Event objects to wait for.
+    """
+    for event in events:
+        if event.is_set():
+            return
+    waiters = [asyncio.create_task(event.wait()) for event in events]
+    try:
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+class TickScheduler:
+    """
+    Decides when the active behaviour tree is ticked, so the CPU used by an agent depends on its configuration and
+    the sensor rate instead of on the speed of the machine.
+        mode: <str> RATE -> ticks at most 'rate' times per second. A period is skipped when nothing the tree
+                            reacts to has changed since the last tick: no new sensor frame and no request_tick() (a
+                            goal finished, a subscribed event was published or a new command arrived)
+                    FRAME -> ticks when a new sensor frame arrives or when someone calls request_tick()
+                             (for example, when a goal finishes)
+        rate: <float> Ticks per second in RATE mode (0 ticks as fast as possible)
+    Statistics:
+        ticks: Number of ticks done
+        late_ticks: Ticks that started more than one period after their deadline (RATE mode)
+        skipped_ticks: Periods skipped because nothing had changed (RATE mode)
+        overruns: Ticks that lasted more than one period
+        max_tick_time, total_tick_time: Time spent inside the ticks (seconds)
+    """
+    RATE = "rate"
+    FRAME = "frame"
+
+    def __init__(self, a_agent, mode=RATE, rate=20.0):
+        if mode not in (self.RATE, self.FRAME):
+            raise ValueError(f"Unknown tick mode: {mode}")
+        self.a_agent = a_agent
+        self.mode = mode
+        self.rate = rate
+        self.period = 1.0 / rate if rate > 0 else 0.0
+        self.next_tick_time = 0.0
+        self.tick_event = asyncio.Event()
+        # Sensor frame seen by the last tick
+        self.ticked_frame = -1
+
+        self.ticks = 0
+        self.late_ticks = 0
+        self.skipped_ticks = 0
+        self.overruns = 0
+        self.max_tick_time = 0.0
+        self.total_tick_time = 0.0
+
+    def request_tick(self):
+        """
+        Asks for a tick as soon as possible (in RATE mode, without waiting for the end of the current period).
+        """
+        self.tick_event.set()
+
+    async def wait_next_tick(self):
+        """
+        Waits till the next tick has to be done.
+        """
+        if self.mode == self.FRAME:
+            await wait_any(self.a_agent.frame_event, self.tick_event, self.a_agent.exit_event)
+            self.tick_event.clear()
+            return
+        now = time.monotonic()
+        if self.next_tick_time > now:
+            try:
+                await asyncio.wait_for(self.tick_event.wait(), self.next_tick_time - now)
+            except asyncio.TimeoutError:
+                pass
+        elif self.next_tick_time > 0 and now - self.next_tick_time > self.period:
+            self.late_ticks += 1
+        if not self.tick_event.is_set() and self.a_agent.frame_count == self.ticked_frame:
+            # Nothing changed since the last tick: sleep till there is something new instead of ticking again
+            self.skipped_ticks += 1
+            await wait_any(self.a_agent.frame_event, self.tick_event, self.a_agent.exit_event)
+            self.next_tick_time = time.monotonic()
+        self.tick_event.clear()
+        self.ticked_frame = self.a_agent.frame_count
+        self.next_tick_time = max(self.next_tick_time + self.period, time.monotonic())
+
+    async def tick(self, bt):
+        """
+        Waits for the next tick and then ticks the behaviour tree 'bt'.
+        """
+        await self.wait_next_tick()
+        if self.a_agent.exit_event.is_set():
+            return
+        start = time.perf_counter()
+        await bt.tick()
+        tick_time = time.perf_counter() - start
+        self.ticks += 1
+        self.total_tick_time += tick_time
+        self.max_tick_time = max(self.max_tick_time, tick_time)
+        if self.period and tick_time > self.period:
+            self.overruns += 1
+
+
+class LazyRegistry(dict):
+    """
+    Dictionary of goals or behaviour trees that are built the first time they are used.
+        factories: <dict> name -> callable that receives the agent and returns the goal/BT
+    Looking up a name that has not been built yet calls its factory and keeps the result. Names without a factory
+    raise KeyError as in a plain dict.
+    """
+    def __init__(self, factories, a_agent):
+        super().__init__()
+        self.factories = factories
+        self.a_agent = a_agent
+
+    def __missing__(self, name):
+        if name not in self.factories:
+            raise KeyError(name)
+        value = self.factories[name](self.a_agent)
+        self[name] = value
+        return value
+
+
+class Vector3:
+    """
+    Mutable 3D vector, updated in place on every sensor frame.
+    Supports v["x"] as well as v.x, so the code written for the dicts of the JSON messages keeps working.
+    """
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"{{'x': {self.x}, 'y': {self.y}, 'z': {self.z}}}"
+
+    def set_from(self, values):
+        """
+        Copies the coordinates of the dict 'values' ({"x", "y", "z"}) into the vector.
+        """
+        self.x = values["x"]
+        self.y = values["y"]
+        self.z = values["z"]
+
+    def copy(self):
+        return Vector3(self.x, self.y, self.z)
+
+
 class InternalState:
     """
     Internal state
-        Stores the internal state of the agent.
+        Stores the internal state of the agent. The position, the rotation and the inventories are updated in place,
+        so they can be referenced safely but must be copied to keep the value of a given frame.
             isRotatingRight: <bool>
             isRotatingLeft: <bool>
             movingForwards: <bool>
             movingBackwards: <bool>
             isFrozen: <bool> Indicates if the agent is frozen due to a collision with an enemy
             speed: <float> Current speed of the agent
-            position: <dict { "x": <float>, "y": <float>, "z": <float> } Position using world coordinates
-            rotation: <dict { "x": <float>, "y": <float>, "z": <float> } Rotation y - Yaw, x - Pitch, z - Roll
+            position: <Vector3> Position using world coordinates
+            rotation: <Vector3> Rotation y - Yaw, x - Pitch, z - Roll
             currentNamedLoc: <str> Name of the current location (if the agent is in one)
             onRoute: <bool> Is the agent moving toward a target using the NavMesh system
             targetNamedLoc: <str> Name of the target location (if the agent is going to one using the NavMesh system)
-            myInventoryList: <list> My current inventory list. Has the form [{'name': '', 'amount': 0}, {'name': '', 'amount': 0}, ...]
+            inventory: <Events.Inventory> My current inventory (item name -> amount)
             nearbyContainerInventory: <bool> Is there a nearby container?
-            nearbyContainerInventoryList: <list> Nearby container inventory list. Has the form [{'name': '', 'amount': 0}, {'name': '', 'amount': 0}, ...]
+            containerInventory: <Events.Inventory> Nearby container inventory (item name -> amount)
+            version: <int> Number of the last frame applied (incremented on every update)
+            events: <Events.EventFeed> Changes detected when the frames are applied (see Events)
     """
+    __slots__ = ("isRotatingRight", "isRotatingLeft", "movingForwards", "movingBackwards", "isFrozen", "speed",
+                 "position", "rotation", "currentNamedLoc", "onRoute", "targetNamedLoc", "inventory",
+                 "nearbyContainerInventory", "containerInventory", "version", "events")
 
     def __init__(self):
         self.isRotatingRight = False
@@ -90,36 +295,99 @@ class InternalState:
         self.movingBackwards = False
         self.isFrozen = None
         self.speed = 0.0
-        self.position = {"x": 0, "y": 0, "z": 0}
-        self.rotation = {"x": 0, "y": 0, "z": 0}
+        self.position = Vector3()
+        self.rotation = Vector3()
         self.currentNamedLoc = ""
         self.onRoute = False
         self.targetNamedLoc = ""
-        self.myInventoryList = []
+        self.events = Events.EventFeed()
+        self.inventory = Events.Inventory(self.events)
         self.nearbyContainerInventory = False
-        self.nearbyContainerInventoryList = []
+        self.containerInventory = Events.Inventory(self.events, Events.CONTAINER_ITEM_ADDED,
+                                                   Events.CONTAINER_ITEM_REMOVED)
+        self.version = 0
+
+    @property
+    def myInventoryList(self):
+        """
+        My current inventory in the format of the messages: [{'name': '', 'amount': 0}, ...]
+        """
+        return [{"name": name, "amount": amount} for name, amount in self.inventory.items()]
+
+    @property
+    def nearbyContainerInventoryList(self):
+        """
+        Nearby container inventory in the format of the messages: [{'name': '', 'amount': 0}, ...]
+        """
+        return [{"name": name, "amount": amount} for name, amount in self.containerInventory.items()]
+
+    def detect_transitions(self, i_state_dict):
+        """
+        :return: List of (event_type, data) of the transitions between the current state and 'i_state_dict'
+        """
+        transitions = []
+        if bool(i_state_dict["isFrozen"]) != bool(self.isFrozen):
+            transitions.append((Events.FROZEN if i_state_dict["isFrozen"] else Events.UNFROZEN, None))
+        if i_state_dict["onRoute"] != self.onRoute:
+            if i_state_dict["onRoute"]:
+                transitions.append((Events.ROUTE_STARTED, i_state_dict["targetNamedLoc"]))
+            else:
+                transitions.append((Events.ROUTE_FINISHED, self.targetNamedLoc))
+        if i_state_dict["currentNamedLoc"] != self.currentNamedLoc:
+            if self.currentNamedLoc:
+                transitions.append((Events.LEFT_LOCATION, self.currentNamedLoc))
+            if i_state_dict["currentNamedLoc"]:
+                transitions.append((Events.ENTERED_LOCATION, i_state_dict["currentNamedLoc"]))
+        if i_state_dict["nearbyContainerInventory"] and not self.nearbyContainerInventory:
+            transitions.append((Events.CONTAINER_APPEARED, self.containerInventory))
+        return transitions
 
     def update_internal_state(self, sensor_info, i_state_dict):
+        # Transitions detected in this frame, published once the whole state is updated. The list is only built on
+        # the frames where one of the fields that trigger them changed
+        if ((not i_state_dict["isFrozen"]) != (not self.isFrozen) or i_state_dict["onRoute"] != self.onRoute
+                or i_state_dict["currentNamedLoc"] != self.currentNamedLoc
+                or (i_state_dict["nearbyContainerInventory"] and not self.nearbyContainerInventory)):
+            transitions = self.detect_transitions(i_state_dict)
+        else:
+            transitions = None
+
         self.isRotatingRight = i_state_dict["isRotatingRight"]
         self.isRotatingLeft = i_state_dict["isRotatingLeft"]
         self.movingForwards = i_state_dict["movingForwards"]
         self.movingBackwards = i_state_dict["movingBackwards"]
         self.isFrozen = i_state_dict["isFrozen"]
         self.speed = i_state_dict["speed"]
-        self.position = i_state_dict["position"]
-        self.rotation = i_state_dict["rotation"]
+        # Vector3.set_from() inlined: this runs on every frame
+        position = self.position
+        values = i_state_dict["position"]
+        position.x = values["x"]
+        position.y = values["y"]
+        position.z = values["z"]
+        rotation = self.rotation
+        values = i_state_dict["rotation"]
+        rotation.x = values["x"]
+        rotation.y = values["y"]
+        rotation.z = values["z"]
         self.currentNamedLoc = i_state_dict["currentNamedLoc"]
         self.onRoute = i_state_dict["onRoute"]
         self.targetNamedLoc = i_state_dict["targetNamedLoc"]
-        self.myInventoryList = i_state_dict["myInventoryList"]
         self.nearbyContainerInventory = i_state_dict["nearbyContainerInventory"]
-        self.nearbyContainerInventoryList = i_state_dict["nearbyContainerInventoryList"]
+        self.version += 1
+        # Nothing to diff if the list and the inventory are both empty
+        item_list = i_state_dict["myInventoryList"]
+        if item_list or self.inventory:
+            self.inventory.apply(item_list)
+        item_list = i_state_dict["nearbyContainerInventoryList"]
+        if item_list or self.containerInventory:
+            self.containerInventory.apply(item_list)
+        if transitions:
+            for event_type, data in transitions:
+                self.events.publish(event_type, data)
 
         # Agent TK GUI
         if active_tk_gui:
-            if gui_blackboard.empty():
-                total_info = (i_state_dict, sensor_info)
-                gui_blackboard.put(copy.deepcopy(total_info))
+            gui_blackboard.publish(self.version, i_state_dict, sensor_info)
 
 
 class AAgent:
@@ -127,7 +395,46 @@ class AAgent:
     ON_HOLD = 0
     RUNNING = 1
 
-    def __init__(self, config_file_path: str):
+    # Groups of actions that override each other. If an action is still waiting in the outbound queue when a later
+    # action of the same group is requested, the older one is dropped because it would be superseded anyway
+    ACTION_GROUPS = {
+        "mf": "translation", "mb": "translation", "stop": "translation", "ntm": "translation",
+        "tl": "rotation", "tr": "rotation", "nt": "rotation"
+    }
+    # Actions that stop a movement. They never drop a queued action that starts one: the movement has to reach
+    # Unity (even if it only lasts till the stop), or goals that start and stop in the same tick would never move
+    STOP_ACTIONS = {"stop", "ntm", "nt"}
+
+    # Goals and behaviour trees the agent can execute (name -> class/factory receiving the agent). They are only
+    # built when an agent_control message selects them, or in advance if the 'initial_task' of the agent names them
+    GOAL_FACTORIES = {
+        "DoNothing": Goals_BT.DoNothing,
+        "ForwardStop": Goals_BT.ForwardStop,
+        "Turn": Goals_BT.Turn,
+        "RandomRoam": Goals_BT.RandomRoam,
+        "Avoid": Goals_BT.Avoid,
+        "WalkToFlower": Goals_BT.WalkToFlower,
+        "CollectFlower": Goals_BT.CollectFlower,
+        "WalkToBase": Goals_BT.WalkToBase,
+        "LeaveFlowers": Goals_BT.LeaveFlowers,
+        "FaceAstronaut": Goals_BT.FaceAstronaut,
+        "WalkToAstronaut": Goals_BT.WalkToAstronaut,
+        "EvadeCritter": Goals_BT.EvadeCritter
+    }
+    BT_FACTORIES = {
+        "BTRoam": BTRoam.BTRoam,
+        "BTAstronautAlone": BTAstronaut.BTAstronaut,
+        "BTCritter": BTCritter.BTCritter
+    }
+
+    def __init__(self, config_file_path: str, session=None, connect_semaphore=None):
+        """
+        :param config_file_path: Path of the agent configuration file (json).
+        :param session: Optional aiohttp.ClientSession shared with other agents (see Spawner.py). If None, the agent
+                        creates its own session when connecting and closes it when finishing.
+        :param connect_semaphore: Optional asyncio.Semaphore that limits how many agents do the websocket handshake
+                                  with Unity at the same time.
+        """
         # Read the agent configuration file and put the info in the 'config' dictionary.
         with open(config_file_path, 'r') as file:
             config_data = file.read()
@@ -135,19 +442,42 @@ class AAgent:
         # Extract the parameters of the agent from the config dictionary
         self.AgentParameters = self.config['AgentParameters']
         self.python_gui_monitor = self.config['Misc']['python_gui_monitor']
+        # Run the monitor in a child process fed with binary snapshots (see Monitor) instead of in a thread
+        self.gui_monitor_process = self.config['Misc'].get('gui_monitor_process', False)
+        # Pipe to the monitor process, set by the code that starts it
+        self.monitor_conn = None
+        # Behaviour tree tick scheduler: "rate" (fixed rate of 'bt_tick_rate' ticks per second) or "frame" (one tick
+        # per sensor frame or finished goal). See TickScheduler
+        self.bt_tick_mode = self.config['Misc'].get('bt_tick_mode', TickScheduler.RATE)
+        self.bt_tick_rate = self.config['Misc'].get('bt_tick_rate', 20)
+        # Tick the behaviour trees with the flat evaluator of BTCompiler (same semantics, less overhead per tick)
+        self.bt_compiled = self.config['Misc'].get('bt_compiled', True)
+        # Optional file where all the messages exchanged with Unity are recorded (see Recorder.py)
+        self.record_session = self.config['Misc'].get('record_session')
+
+        # JSON codec used for the messages exchanged with Unity (orjson/msgspec if installed, json otherwise)
+        self.codec = Codec.default_codec
 
         # URL to connect with Unity
         self.url = f"ws://{self.config['Server']['host']}:{self.config['Server']['port']}/"
 
         # Agent sensors
-        self.rc_sensor = Sensors.RayCastSensor(self.AgentParameters['ray_perception_sensor_param'])
+        # NumPy-backed sensor (Sensors.ArrayRayCastSensor) if 'ray_sensor_arrays' is set, for high-resolution sensors
+        self.rc_sensor = Sensors.create_ray_sensor(self.AgentParameters['ray_perception_sensor_param'],
+                                                   self.config['Misc'].get('ray_sensor_arrays', False))
 
         # Agent internal state
         self.i_state = InternalState()
+        # Last frames received (pose, rotation, speed and rays), for velocity, stuck detection and smoothing
+        self.history = History.FrameHistory(self.config['Misc'].get('history_frames', 64), self.rc_sensor.num_rays)
+        # Unwrapped heading and angular velocity, integrated on every frame (see History.YawTracker)
+        self.yaw = History.YawTracker()
 
         # Misc. variables
         # Variables used for the websocket connection
-        self.session = None
+        self.session = session
+        self.own_session = session is None
+        self.connect_semaphore = connect_semaphore
         self.ws = None
         # State of the simulation: ON_HOLD | RUNNING
         self.simulation_state = self.ON_HOLD
@@ -155,49 +485,74 @@ class AAgent:
         self.exit_event = asyncio.Event()
         # Flag that confirms the connection with Unity is fully operative and that Unity is waiting for messages
         self.connection_ready = False
-
-        # Reference to the possible goals the agent can execute
-        self.goals = {
-            "DoNothing": Goals_BT.DoNothing(self),
-            "ForwardStop": Goals_BT.ForwardStop(self),
-            "Turn": Goals_BT.Turn(self),
-            "RandomRoam": Goals_BT.RandomRoam(self),
-            "Avoid": Goals_BT.Avoid(self),
-            "WalkToFlower": Goals_BT.WalkToFlower(self),
-            "CollectFlower": Goals_BT.CollectFlower(self),
-            "WalkToBase": Goals_BT.WalkToBase(self),
-            "LeaveFlowers": Goals_BT.LeaveFlowers(self),
-            "FaceAstronaut": Goals_BT.FaceAstronaut(self),
-            "WalkToAstronaut": Goals_BT.WalkToAstronaut(self),
-            "EvadeCritter": Goals_BT.EvadeCritter(self)
-        }
-        # Reference to the possible behaviour trees the agent can execute
-        self.bts = {
-            "BTRoam": BTRoam.BTRoam(self),
-            "BTAstronautAlone": BTAstronaut.BTAstronaut(self),
-            "BTCritter": BTCritter.BTCritter(self)
-        }
+        # Asyncio events that wake up the main loop only when there is something to do
+        # connection_ready_event -> set when Unity confirms the connection ("connection_ready")
+        # running_event -> set while the simulation is RUNNING, cleared when it is ON_HOLD
+        # work_event -> set every time a new action, goal or behaviour tree arrives through "agent_control"
+        self.connection_ready_event = asyncio.Event()
+        self.running_event = asyncio.Event()
+        self.work_event = asyncio.Event()
+        # Number of sensor frames received so far and event used to notify the arrival of a new frame.
+        # The event is replaced by a fresh one on each frame, so every waiter is woken up exactly once per frame
+        self.frame_count = 0
+        self.frame_event = asyncio.Event()
+
+        # Mailbox of received messages waiting to be processed. Only the newest sensor frame is kept (older ones are
+        # dropped if the agent falls behind), while sim_control and agent_control messages are always kept in order
+        self.sensor_mailbox = None
+        self.control_mailbox = deque()
+        self.mailbox_event = asyncio.Event()
+        # Statistics of the mailbox: sensor frames received, dropped because a newer one arrived, and applied
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_applied = 0
+
+        # Session recorder, created when connecting if 'record_session' is set in the configuration file
+        self.recorder = None
+
+        # Reference to the possible goals and behaviour trees the agent can execute (built on first use)
+        self.goals = LazyRegistry(self.GOAL_FACTORIES, self)
+        self.bts = LazyRegistry(self.BT_FACTORIES, self)
 
         # Active goal
         self.currentGoal = None
 
         # Active behaviour tree
         self.currentBT = None
+        self.bt_scheduler = TickScheduler(self, self.bt_tick_mode, self.bt_tick_rate)
 
         # Individual actions pending execution
         self.pendingActions = deque()
 
+        # Outbound queue of actions waiting to be sent to Unity by the writer task, and the event that wakes it up
+        self.outboundActions = deque()
+        self.outbound_event = asyncio.Event()
+        # Statistics of the outbound queue: actions requested by the goals, dropped and really sent to Unity
+        self.actions_requested = 0
+        self.actions_dropped = 0
+        self.actions_sent = 0
+
+        # Build in advance the goal or BT Unity will select first
+        self.prepare_task(self.AgentParameters.get("initial_task", ""))
+
     async def open_websocket(self):
         """
         Establishes the connection with Unity using a websocket. After that, it sends the initial parameters of the
         agent, obtained previously from the configuration file.
         """
         try:
-            self.session = aiohttp.ClientSession()
+            if self.own_session:
+                self.session = aiohttp.ClientSession()
+            if self.record_session and self.recorder is None:
+                self.recorder = Recorder.SessionRecorder(self.record_session)
             print("Connecting to: " + self.url)
-            self.ws = await self.session.ws_connect(self.url)
+            if self.connect_semaphore:
+                async with self.connect_semaphore:
+                    self.ws = await self.session.ws_connect(self.url)
+            else:
+                self.ws = await self.session.ws_connect(self.url)
             print("Connected to WebSocket server")
-            param_json = json.dumps(self.AgentParameters)
+            param_json = self.codec.dumps(self.AgentParameters)
             print("Sending the initial parameters: " + param_json)
             await self.send_message("initial_params", param_json)
         except:
@@ -210,26 +565,82 @@ class AAgent:
         """
         if self.ws:
             await self.ws.close()
-        if self.session:
+        if self.recorder:
+            self.recorder.close()
+        # A shared session belongs to the spawner, that will close it when all the agents have finished
+        if self.session and self.own_session:
             await self.session.close()
         print("WebSocket connection properly closed")
 
     async def send_message(self, msg_type: str, msg_content: str):
         """
-        Sends a message in json format of type 'msg_type' and with content 'msg_content' to Unity
+        Sends a message in json format of type 'msg_type' and with content 'msg_content' to Unity.
+        Actions are not sent right away: they are put in the outbound queue and sent by the writer task.
         :param msg_type: General type of the message.
         :param msg_content: Content of the message
         """
-        msg = {"type": msg_type, "content": msg_content}
-        msg_json = json.dumps(msg)
-        # if msg_type == "action":
-        #     print(msg_content)
+        if msg_type == "action":
+            self.queue_action(msg_content)
+            return
+        msg_json = self.codec.encode_message(msg_type, msg_content)
+        if self.recorder:
+            self.recorder.record_outbound(msg_json)
         await self.ws.send_str(msg_json)
 
+    def queue_action(self, action: str):
+        """
+        Puts 'action' in the outbound queue. Any older action of the same group (see ACTION_GROUPS) still in the
+        queue is dropped, as long as there is no other kind of action (walk_to, collect, leave...) between them.
+        A stop (see STOP_ACTIONS) only drops older stops, never the start of a movement.
+        :param action: Action to send, for example "mf" or "tl,0.5"
+        """
+        self.actions_requested += 1
+        command = action.split(",")[0]
+        group = self.ACTION_GROUPS.get(command)
+        if group:
+            is_stop = command in self.STOP_ACTIONS
+            for i in range(len(self.outboundActions) - 1, -1, -1):
+                queued_command = self.outboundActions[i].split(",")[0]
+                queued_group = self.ACTION_GROUPS.get(queued_command)
+                if queued_group is None:
+                    break
+                if queued_group == group:
+                    if is_stop and queued_command not in self.STOP_ACTIONS:
+                        break  # Keep the start, and the actions queued before it
+                    del self.outboundActions[i]
+                    self.actions_dropped += 1
+        self.outboundActions.append(action)
+        self.outbound_event.set()
+
+    async def send_actions(self):
+        """
+        Writer task. Wakes up when there are actions in the outbound queue and sends them to Unity, one websocket
+        frame per action: Unity reads a single command from each "action" message, so they cannot be batched into
+        one frame. What the queue saves are the frames of the actions superseded before the writer runs (see
+        queue_action()).
+        """
+        try:
+            while not self.exit_event.is_set():
+                await wait_any(self.outbound_event, self.exit_event)
+                self.outbound_event.clear()
+                while self.outboundActions:
+                    action = self.outboundActions.popleft()
+                    # print(action)
+                    msg_json = self.codec.encode_message("action", action)
+                    if self.recorder:
+                        self.recorder.record_outbound(msg_json)
+                    await self.ws.send_str(msg_json)
+                    self.actions_sent += 1
+        except Exception as e:
+            print(f"Failed sending actions: {e}")
+            self.exit_event.set()
+        finally:
+            print("Finishing send_actions")
+
     async def receive_messages(self):
         """
         Gets the messages that arrive from Unity through the websocket. If the message is not a 'close' message or
-        an error, it calls the function 'process_incoming_message() to process it.
+        an error, it calls the function 'post_message()' to leave it in the mailbox.
         """
         try:
             # With this loop, we will repeatedly await the next value produced by iterating over self.ws.
@@ -238,7 +649,9 @@ class AAgent:
             async for msg in self.ws:
                 if msg.type == aiohttp.WSMsgType.TEXT:
                     # print(f"MESSAGE: {msg}")
-                    self.process_incoming_message(msg.data)
+                    if self.recorder:
+                        self.recorder.record_inbound(msg.data)
+                    self.post_message(msg.data)
                 elif msg.type == aiohttp.WSMsgType.CLOSED:
                     print("Connection closed by Unity")
                     break
@@ -251,36 +664,102 @@ class AAgent:
             print("Finishing receive_messages")
             self.exit_event.set()
 
+    def post_message(self, msg_data: str):
+        """
+        Decodes the message 'msg_data' received from Unity and leaves it in the mailbox, where it waits for the
+        'process_messages()' task. If there is already a sensor frame waiting, it is replaced by the new one.
+        :param msg_data: Message received in json format.
+        """
+        try:
+            msg_type, content = self.codec.decode_message(msg_data)
+        except Codec.Codec.DECODE_ERRORS:
+            print(f"Failed JSON decoding of the received message: {msg_data}")
+            return
+
+        if msg_type == "sensor":
+            self.frames_received += 1
+            if self.sensor_mailbox is not None:
+                self.frames_dropped += 1
+            self.sensor_mailbox = content
+        else:
+            self.control_mailbox.append((msg_type, content))
+        self.mailbox_event.set()
+
+    async def process_messages(self):
+        """
+        Processes the messages waiting in the mailbox: first the control messages, in order, and then the newest
+        sensor frame.
+        """
+        try:
+            while not self.exit_event.is_set():
+                await wait_any(self.mailbox_event, self.exit_event)
+                self.mailbox_event.clear()
+                while self.control_mailbox:
+                    msg_type, content = self.control_mailbox.popleft()
+                    self.dispatch_message(msg_type, content)
+                if self.sensor_mailbox is not None:
+                    content = self.sensor_mailbox
+                    self.sensor_mailbox = None
+                    self.dispatch_message("sensor", content)
+        except Exception as e:
+            print(f"Failed processing messages: {e}")
+        finally:
+            print("Finishing process_messages")
+            self.exit_event.set()
+
     def process_incoming_message(self, msg_data: str):
         """
-        Processes the message 'msg_data' received from Unity. It is expected to be in json format.
+        Processes the message 'msg_data' received from Unity right away, without going through the mailbox.
+        It is expected to be in json format.
         :param msg_data: Message received in json format.
         """
         try:
-            msg_dict = json.loads(msg_data)
+            msg_type, content = self.codec.decode_message(msg_data)
+        except Codec.Codec.DECODE_ERRORS:
+            print(f"Failed JSON decoding of the received message: {msg_data}")
+            return
+        self.dispatch_message(msg_type, content)
 
-            if msg_dict["Type"] == "sensor":
-                self.rc_sensor.set_perception(msg_dict["Content"][0])
-                self.i_state.update_internal_state(msg_dict["Content"][0], msg_dict["Content"][1])
-            elif msg_dict["Type"] == "sim_control":
-                if msg_dict["Content"] == "connection_ready":
+    def dispatch_message(self, msg_type: str, content):
+        """
+        Applies a decoded message received from Unity.
+        :param msg_type: Type of the message ("sensor", "sim_control" or "agent_control")
+        :param content: Content of the message, as returned by Codec.decode_message()
+        """
+        try:
+            if msg_type == "sensor":
+                rays, i_state_dict = content
+                self.rc_sensor.set_perception(rays)
+                self.i_state.update_internal_state(rays, i_state_dict)
+                now = time.monotonic()
+                hits, distances = self.rc_sensor.ray_buffers()
+                self.history.append(now, self.i_state.position, self.i_state.rotation, self.i_state.speed,
+                                    hits, distances)
+                self.yaw.update(now, self.i_state.rotation.y)
+                self.frames_applied += 1
+                self.notify_new_frame()
+            elif msg_type == "sim_control":
+                if content == "connection_ready":
                     self.connection_ready = True
-                elif msg_dict["Content"] == "on_hold":
+                    self.connection_ready_event.set()
+                elif content == "on_hold":
                     self.simulation_state = self.ON_HOLD
+                    self.running_event.clear()
                     # print("ON HOLD")
-                elif msg_dict["Content"] == "start":
+                elif content == "start":
                     self.simulation_state = self.RUNNING
+                    self.running_event.set()
                     # print("RUNNING")
-                elif msg_dict["Content"] == "error":
+                elif content == "error":
                     print("Error creating the agent in Unity.")
                     self.exit_event.set()
                 else:
-                    print("Received unknown message - Type: " + msg_dict["Type"] + "- Content: " + msg_dict["Content"])
-            elif msg_dict["Type"] == "agent_control":
+                    print("Received unknown message - Type: " + msg_type + "- Content: " + content)
+            elif msg_type == "agent_control":
                 # These kind of messages have the format
                 # command:data
                 try:
-                    command, data = msg_dict["Content"].split(":")
+                    command, data = content.split(":")
                     if command == "action":
                         if self.currentBT:  # If there is a BT running
                             self.bts[self.currentBT].stop_behaviour_tree()
@@ -302,25 +781,72 @@ class AAgent:
                             self.currentGoal = None
                         self.currentBT = data
                     else:
-                        print("Agent_control message with an unknown command: " + msg_dict["content"])
+                        print("Agent_control message with an unknown command: " + content)
+                        return
+                    # Wake up the main loop, there is new work to do
+                    self.work_event.set()
+                    self.bt_scheduler.request_tick()
                 except Exception as e:
                     print(f"Exception1: {e}")
-                    print(f"Message: {msg_data}")
+                    print(f"Message: {content}")
             else:
-                print("Received unknown message - Type: " + msg_dict["Type"] + "- Content: " + msg_dict["Content"])
-        except json.JSONDecodeError as e:
-            print(f"Failed JSON decoding of the received message: {msg_data}")
+                print("Received unknown message - Type: " + msg_type + "- Content: " + content)
         except Exception as e:
             print(f"Exception2: {e}")
             raise e
 
+    def prepare_task(self, task):
+        """
+        Builds in advance the goal or behaviour tree named by 'task' ("goal:<name>" or "bt:<name>"), so the first
+        agent_control message that selects it does not have to wait for its construction.
+        """
+        command, _, name = task.partition(":")
+        if command == "goal" and name in self.goals.factories:
+            self.goals[name]
+        elif command == "bt" and name in self.bts.factories:
+            self.bts[name]
+
+    def notify_new_frame(self):
+        """
+        Increments the frame counter and wakes up everyone waiting for a new sensor frame.
+        """
+        self.frame_count += 1
+        frame_event = self.frame_event
+        self.frame_event = asyncio.Event()
+        frame_event.set()
+
+    async def next_frame(self):
+        """
+        Waits till the next sensor frame arrives.
+        :return: The number of the new frame.
+        """
+        await self.frame_event.wait()
+        return self.frame_count
+
+    async def wait_until(self, predicate, timeout=None):
+        """
+        Waits till 'predicate()' is True. The predicate is evaluated now and then once per new sensor frame.
+        :param predicate: Function without parameters that returns a bool.
+        :param timeout: Maximum time to wait in seconds (None waits forever).
+        :return: True if the predicate became True, False if the timeout expired.
+        """
+        async def wait_predicate():
+            while not predicate():
+                await self.next_frame()
+
+        try:
+            await asyncio.wait_for(wait_predicate(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
     async def main_loop(self):
         # Keep going while there is not an event to exit
         while not self.exit_event.is_set():
             # Control if we are on hold (simulation paused from Unity)
             if self.simulation_state == self.ON_HOLD:
-                # Just wait, but allow the other tasks keep running
-                await asyncio.sleep(0)
+                # Sleep till Unity starts the simulation (or we have to exit)
+                await wait_any(self.running_event, self.exit_event)
             else:
                 # Here is where we perform the agent actions
                 # It can be the case we are executing a single action, a simple goal or a behaviour tree
@@ -333,9 +859,11 @@ class AAgent:
                         await self.goals[self.currentGoal].run()
                     elif self.currentBT:
                         # We are running a behaviour tree
-                        await self.bts[self.currentBT].tick()
+                        await self.bt_scheduler.tick(self.bts[self.currentBT])
                     else:
-                        await asyncio.sleep(0)
+                        # Nothing to do. Sleep till a new action, goal or BT arrives (or we have to exit)
+                        self.work_event.clear()
+                        await wait_any(self.work_event, self.exit_event)
                 except Exception as e:
                     print("Execution failed.")
                     print(f"Exception3: {e}")
@@ -356,10 +884,18 @@ class AAgent:
                 # Now that the connection is established, create the task to start receiving messages from Unity
                 # We are not awaiting this task because it has to run forever till the main loop finishes
                 asyncio.create_task(self.receive_messages())
+                # The messages received are processed by another task, so stale sensor frames can be dropped
+                asyncio.create_task(self.process_messages())
+                # Same for the writer task, that sends to Unity the actions requested by goals and behaviours
+                asyncio.create_task(self.send_actions())
+                # And for the monitor process, if there is one
+                if self.monitor_conn:
+                    asyncio.create_task(Monitor.feed_monitor(gui_blackboard, self.monitor_conn, self.exit_event))
                 # Wait for the flag "connection_ready" to be True. If it is true, it means we have received an ack
                 # from Unity saying that the connection is fully established and Unity is ready to receive messages
-                while not self.connection_ready:
-                    await asyncio.sleep(0)
+                await wait_any(self.connection_ready_event, self.exit_event)
+                if self.exit_event.is_set():
+                    return
                 print("Connection with Unity fully established")
 
                 # We are ready now  to start the main loop of the agent
@@ -396,8 +932,16 @@ if __name__ == "__main__":
         if my_AAgent.python_gui_monitor:
             agent_name = my_AAgent.AgentParameters["name"]
             active_tk_gui = True
-            tk_thread = Thread(target=run_tk, args=(agent_name,))
-            tk_thread.start()
+            if my_AAgent.gui_monitor_process:
+                # The monitor renders in its own process, so it doesn't compete for the GIL with the agent
+                my_AAgent.monitor_conn, monitor_conn = multiprocessing.Pipe()
+                tk_process = multiprocessing.Process(target=Monitor.run_monitor_process,
+                                                     args=(agent_name, monitor_conn), daemon=True)
+                tk_process.start()
+                monitor_conn.close()
+            else:
+                tk_thread = Thread(target=run_tk, args=(agent_name,))
+                tk_thread.start()
 
         # Run the AAgent. It creates a new event loop, runs the my_AAgent.run()
         # coroutine in that event loop, and then closes the event loop when the coroutine completes.
@@ -406,7 +950,11 @@ if __name__ == "__main__":
         # Close the agent TK GUI
         if my_AAgent.python_gui_monitor:
             active_tk_gui = False
-            exit_gui = True
-            tk_thread.join()
+            if my_AAgent.gui_monitor_process:
+                my_AAgent.monitor_conn.close()  # The monitor process finishes when the pipe is closed
+                tk_process.join(2.0)
+            else:
+                exit_gui = True
+                tk_thread.join()
 
         print("Bye!!!")
@@ -4,517 +4,239 @@ import py_trees
 import py_trees as pt
 from py_trees import common
 import Goals_BT
-import Sensors
+import BTBase
+import BTCompiler
+import Events
 import time
 
 # ===========================
 # BEHAVIOUR: Do Nothing
 # ===========================
-class BN_DoNothing(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_DoNothing(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
         """
         Initializes the DoNothing behaviour.
         """
-        self.my_agent = aagent
-        self.my_goal = None
-        super(BN_DoNothing, self).__init__("BN_DoNothing")
-
-    def initialise(self):
-        """
-        Starts the DoNothing goal as an asyncio task.
-        """
-        print("[BN_DoNothing] Initializing...")
-        self.my_goal = asyncio.create_task(Goals_BT.DoNothing(self.my_agent).run())
-
-    def update(self):
-        """
-        Updates the status of the DoNothing behaviour.
-        """
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            if self.my_goal.result():
-                print("[BN_DoNothing] Completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("[BN_DoNothing] Completed with FAILURE")
-                return pt.common.Status.FAILURE
+        super(BN_DoNothing, self).__init__("BN_DoNothing", aagent, verbose=True)
 
-    def terminate(self, new_status: common.Status):
+    def create_goal(self, aagent):
         """
-        Cancels the associated task when the behaviour terminates.
+        Creates the DoNothing goal.
         """
-        print(f"[BN_DoNothing] Terminating with status: {new_status}")
-        self.my_goal.cancel()
+        return Goals_BT.DoNothing(aagent)
 
 
 # ===========================
 # BEHAVIOUR: Forward Random
 # ===========================
-class BN_ForwardRandom(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_ForwardRandom(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
         """
         Initializes the ForwardRandom behaviour.
         """
-        self.my_goal = None
-        super(BN_ForwardRandom, self).__init__("BN_ForwardRandom")
-        self.my_agent = aagent
-
-    def initialise(self):
-        """
-        Starts the ForwardDist goal as an asyncio task.
-        """
-        print("[BN_ForwardRandom] Initializing...")
-        self.my_goal = asyncio.create_task(Goals_BT.ForwardDist(self.my_agent, -1, 1, 5).run())
+        super(BN_ForwardRandom, self).__init__("BN_ForwardRandom", aagent, verbose=True)
 
-    def update(self):
+    def create_goal(self, aagent):
         """
-        Updates the status of the ForwardRandom behaviour.
+        Creates the ForwardDist goal.
         """
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            if self.my_goal.result():
-                print("[BN_ForwardRandom] Completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("[BN_ForwardRandom] Completed with FAILURE")
-                return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        """
-        Cancels the associated task when the behaviour terminates.
-        """
-        print(f"[BN_ForwardRandom] Terminating with status: {new_status}")
-        self.my_goal.cancel()
+        return Goals_BT.ForwardDist(aagent, -1, 1, 5)
 
 
 # ===========================
 # BEHAVIOUR: Turn Random
 # ===========================
-class BN_TurnRandom(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_TurnRandom(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
         """
         Initializes the TurnRandom behaviour.
         """
-        self.my_goal = None
-        super(BN_TurnRandom, self).__init__("BN_TurnRandom")
-        self.my_agent = aagent
-
-    def initialise(self):
-        """
-        Starts the Turn goal as an asyncio task.
-        """
-        print("[BN_TurnRandom] Initializing...")
-        self.my_goal = asyncio.create_task(Goals_BT.Turn(self.my_agent).run())
-
-    def update(self):
-        """
-        Updates the status of the TurnRandom behaviour.
-        """
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                print("[BN_TurnRandom] Completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("[BN_TurnRandom] Completed with FAILURE")
-                return pt.common.Status.FAILURE
+        super(BN_TurnRandom, self).__init__("BN_TurnRandom", aagent, verbose=True)
 
-    def terminate(self, new_status: common.Status):
+    def create_goal(self, aagent):
         """
-        Cancels the associated task when the behaviour terminates.
+        Creates the Turn goal.
         """
-        print(f"[BN_TurnRandom] Terminating with status: {new_status}")
-        self.my_goal.cancel()
+        return Goals_BT.Turn(aagent)
 
 
 # ===========================
 # BEHAVIOUR: Avoid Obstacles
 # ===========================
-class BN_Avoid(pt.behaviour.Behaviour):
-    """
-    Behaviour-tree node wrapping our Goals_BT.Avoid obstacle-avoider.
-    """
-    def __init__(self, aagent):
-        super(BN_Avoid, self).__init__("BN_Avoid")
-        self.my_agent = aagent
-        self._task = None
-
-    def initialise(self):
+class BN_Avoid(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
         """
-        Starts the Avoid.run() coroutine.
+        Initializes the Avoid behaviour.
         """
-        print("[BN_Avoid] Initializing...")
-        self._task = asyncio.create_task(Goals_BT.Avoid(self.my_agent).run())
+        super(BN_Avoid, self).__init__("BN_Avoid", aagent, verbose=True)
 
-    def update(self):
+    def create_goal(self, aagent):
         """
-        Updates the status of the Avoid behaviour.
+        Creates the Avoid goal.
         """
-        if not self._task.done():
-            return pt.common.Status.RUNNING
-        print("[BN_Avoid] Running...")
-        return pt.common.Status.SUCCESS  # Avoid never “fails”
+        return Goals_BT.Avoid(aagent)
 
-    def terminate(self, new_status):
+    def status_from_result(self, result):
         """
-        Cancels the associated task when the behaviour terminates.
+        Avoid never "fails".
         """
-        print(f"[BN_Avoid] Terminating with status: {new_status}")
-        if self._task:
-            self._task.cancel()
+        return common.Status.SUCCESS
 
 
 # ===========================
 # BEHAVIOUR: Detect Flower
 # ===========================
-class BN_DetectFlower(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_DetectFlower(BTBase.BN_Condition):
+    def __init__(self, aagent=None):
         """
         Initializes the DetectFlower behaviour.
         """
-        self.my_goal = None
-        super(BN_DetectFlower, self).__init__("BN_DetectFlower")
-        self.my_agent = aagent
-
-    def initialise(self):
-        """
-        No initialization needed for this behaviour.
-        """
-        # print("[BN_DetectFlower] Initializing...")
-        pass
+        super(BN_DetectFlower, self).__init__("BN_DetectFlower", aagent)
 
-    def update(self):
+    def condition(self, aagent):
         """
         Checks if a flower is detected.
         """
-        sensor_obj_info = self.my_agent.rc_sensor.sensor_rays[Sensors.RayCastSensor.OBJECT_INFO]
-        for index, value in enumerate(sensor_obj_info):
-            if value:  # there is a hit with an object
-                if value["tag"] == "AlienFlower":  # If it is a flower
-                    print("[BN_DetectFlower] Flower detected!")
-                    return pt.common.Status.SUCCESS
+        if aagent.rc_sensor.sees("AlienFlower"):
+            print("[BN_DetectFlower] Flower detected!")
+            return True
         # print("[BN_DetectFlower] No flower detected.")
-        return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        """
-        No termination logic needed for this behaviour.
-        """
-        # print(f"[BN_DetectFlower] Terminating with status: {new_status}")
-        pass
+        return False
 
 # ===========================
 # BEHAVIOUR: Face Flower
 # ===========================
-class BN_FaceFlower(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_FaceFlower(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
         """
         Initializes the FaceFlower behaviour.
         """
-        self.my_goal = None
-        super(BN_FaceFlower, self).__init__("BN_FaceFlower")
-        self.my_agent = aagent
-
-    def initialise(self):
-        """
-        Starts the FaceFlower goal as an asyncio task.
-        """
-        print("[BN_FaceFlower] Initializing...")
-        self.my_goal = asyncio.create_task(Goals_BT.FaceFlower(self.my_agent).run())
-
-    def update(self):
-        """
-        Updates the status of the FaceFlower behaviour.
-        """
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                print("[BN_FaceFlower] Completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("[BN_FaceFlower] Completed with FAILURE")
-                return pt.common.Status.FAILURE
+        super(BN_FaceFlower, self).__init__("BN_FaceFlower", aagent, verbose=True)
 
-    def terminate(self, new_status: common.Status):
+    def create_goal(self, aagent):
         """
-        Cancels the associated task when the behaviour terminates.
+        Creates the FaceFlower goal.
         """
-        print(f"[BN_FaceFlower] Terminating with status: {new_status}")
-        self.my_goal.cancel()
+        return Goals_BT.FaceFlower(aagent)
 
 
 # ===========================
 # BEHAVIOUR: Walk to Flower
 # ===========================
-class BN_WalkToFlower(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_WalkToFlower(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
         """
         Initializes the WalkToFlower behaviour.
         """
-        self.my_goal = None
-        super(BN_WalkToFlower, self).__init__("BN_WalkToFlower")
-        self.my_agent = aagent
-
-    def initialise(self):
-        """
-        Starts the WalkToFlower goal as an asyncio task.
-        """
-        # print("[BN_WalkToFlower] Initializing...")
-        self.my_goal = asyncio.create_task(Goals_BT.WalkToFlower(self.my_agent).run())
-
-    def update(self):
-        """
-        Updates the status of the WalkToFlower behaviour.
-        """
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                print("[BN_WalkToFlower] Completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("[BN_WalkToFlower] Completed with FAILURE")
-                return pt.common.Status.FAILURE
+        super(BN_WalkToFlower, self).__init__("BN_WalkToFlower", aagent, verbose=True)
 
-    def terminate(self, new_status: common.Status):
+    def create_goal(self, aagent):
         """
-        Cancels the associated task when the behaviour terminates.
+        Creates the WalkToFlower goal.
         """
-        print(f"[BN_WalkToFlower] Terminating with status: {new_status}")
-        self.my_goal.cancel()
+        return Goals_BT.WalkToFlower(aagent)
 
 
 # ===========================
 # BEHAVIOUR: Walk to Base
 # ===========================
-class BN_WalkToBase(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_WalkToBase(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
         """
         Initializes the WalkToBase behaviour.
         """
-        self.my_goal = None
-        super(BN_WalkToBase, self).__init__("BN_WalkToBase")
-        self.my_agent = aagent
-
-    def initialise(self):
-        """
-        Starts the WalkToBase goal as an asyncio task.
-        """
-        print("[BN_WalkToBase] Initializing...")
-        self.my_goal = asyncio.create_task(Goals_BT.WalkToBase(self.my_agent).run())
-
-    def update(self):
-        """
-        Updates the status of the WalkToBase behaviour.
-        """
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                print("[BN_WalkToBase] Completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("[BN_WalkToBase] Completed with FAILURE")
-                return pt.common.Status.FAILURE
+        super(BN_WalkToBase, self).__init__("BN_WalkToBase", aagent, verbose=True)
 
-    def terminate(self, new_status: common.Status):
+    def create_goal(self, aagent):
         """
-        Cancels the associated task when the behaviour terminates.
+        Creates the WalkToBase goal.
         """
-        print(f"[BN_WalkToBase] Terminating with status: {new_status}")
-        self.my_goal.cancel()
+        return Goals_BT.WalkToBase(aagent)
 
 
 # ===========================
 # BEHAVIOUR: Inventory Full
 # ===========================
-class BN_InventoryFull(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_InventoryFull(BTBase.BN_Condition):
+    def __init__(self, aagent=None):
         """
         Initializes the InventoryFull behaviour.
         """
-        self.my_goal = None
-        super(BN_InventoryFull, self).__init__("BN_InventoryFull")
-        self.my_agent = aagent
-
-    def initialise(self):
-        """
-        No initialization needed for this behaviour.
-        """
-        # print("[BN_InventoryFull] Initializing...")
-        pass
+        super(BN_InventoryFull, self).__init__("BN_InventoryFull", aagent)
 
-    def update(self):
+    def condition(self, aagent):
         """
         Checks if the inventory is full.
         """
-        flowers = 0
-        for item in self.my_agent.i_state.myInventoryList:
-            if item["name"] == "AlienFlower":
-                flowers = item["amount"]
-                break
-
-        if flowers >= 2:
-            # print("[BN_InventoryFull] Inventory is full.")
-            return pt.common.Status.SUCCESS
-        else:
-            # print("[BN_InventoryFull] Inventory is not full.")
-            return pt.common.Status.FAILURE
+        flowers = aagent.i_state.inventory.get("AlienFlower", 0)
 
-    def terminate(self, new_status: common.Status):
-        """
-        No termination logic needed for this behaviour.
-        """
-        # print(f"[BN_InventoryFull] Terminating with status: {new_status}")
-        pass
+        # print(f"[BN_InventoryFull] {flowers} flowers in the inventory.")
+        return flowers >= 2
 
 # ===========================
 # BEHAVIOUR: Leave Flowers
 # ===========================
-class BN_LeaveFlowers(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_LeaveFlowers(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
         """
         Initializes the LeaveFlowers behaviour.
         """
-        self.my_goal = None
-        super(BN_LeaveFlowers, self).__init__("BN_LeaveFlowers")
-        self.my_agent = aagent
-
-    def initialise(self):
-        """
-        Starts the LeaveFlowers goal as an asyncio task.
-        """
-        print("[BN_LeaveFlowers] Initializing...")
-        self.my_goal = asyncio.create_task(Goals_BT.LeaveFlowers(self.my_agent).run())
-
-    def update(self):
-        """
-        Updates the status of the LeaveFlowers behaviour.
-        """
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                print("[BN_LeaveFlowers] Completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("[BN_LeaveFlowers] Completed with FAILURE")
-                return pt.common.Status.FAILURE
+        super(BN_LeaveFlowers, self).__init__("BN_LeaveFlowers", aagent, verbose=True)
 
-    def terminate(self, new_status: common.Status):
+    def create_goal(self, aagent):
         """
-        Cancels the associated task when the behaviour terminates.
+        Creates the LeaveFlowers goal.
         """
-        print(f"[BN_LeaveFlowers] Terminating with status: {new_status}")
-        self.my_goal.cancel()
+        return Goals_BT.LeaveFlowers(aagent)
 
 
 # ===========================
 # BEHAVIOUR: Detect Critter
 # ===========================
-class BN_DetectCritter(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_DetectCritter(BTBase.BN_Condition):
+    def __init__(self, aagent=None):
         """
         Initializes the DetectCritter behaviour.
         """
-        self.my_goal = None
-        super(BN_DetectCritter, self).__init__("BN_DetectCritter")
-        self.my_agent = aagent
-
-    def initialise(self):
-        """
-        No initialization needed for this behaviour.
-        """
-        # print("[BN_DetectCritter] Initializing...")
-        pass
+        super(BN_DetectCritter, self).__init__("BN_DetectCritter", aagent)
 
-    def update(self):
+    def condition(self, aagent):
         """
         Checks if a critter is detected.
         """
-        sensor_obj_info = self.my_agent.rc_sensor.sensor_rays[Sensors.RayCastSensor.OBJECT_INFO]
-        for index, value in enumerate(sensor_obj_info):
-            if value:  # there is a hit with an object
-                if value["tag"] == "CritterMantaRay":  # Detect critter
-                    print("[BN_DetectCritter] Critter detected!")
-                    return pt.common.Status.SUCCESS
+        if aagent.rc_sensor.sees("CritterMantaRay"):
+            print("[BN_DetectCritter] Critter detected!")
+            return True
         # print("[BN_DetectCritter] No critter detected.")
-        return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        """
-        No termination logic needed for this behaviour.
-        """
-        # print(f"[BN_DetectCritter] Terminating with status: {new_status}")
-        pass
+        return False
 
 # ===========================
 # BEHAVIOUR: Evade Critter
 # ===========================
-class BN_EvadeCritter(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
+class BN_EvadeCritter(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
         """
         Initializes the EvadeCritter behaviour.
         """
-        super().__init__("BN_EvadeCritter")
-        self.my_agent = aagent
-        self.task = None
-
-    def initialise(self):
-        """
-        Starts the EvadeCritter goal as an asyncio task.
-        """
-        print("[BN_EvadeCritter] Initializing...")
-        self.task = asyncio.create_task(Goals_BT.EvadeCritter(self.my_agent).run())
+        super(BN_EvadeCritter, self).__init__("BN_EvadeCritter", aagent, verbose=True)
 
-    def update(self):
+    def create_goal(self, aagent):
         """
-        Updates the status of the EvadeCritter behaviour.
+        Creates the EvadeCritter goal.
         """
-        if not self.task.done():
-            return pt.common.Status.RUNNING
-        if self.task.result():
-            print("[BN_EvadeCritter] Completed with SUCCESS")
-            return pt.common.Status.SUCCESS
-        else:
-            print("[BN_EvadeCritter] Completed with FAILURE")
-            return pt.common.Status.FAILURE
-
-    def terminate(self, new_status):
-        """
-        Cancels the associated task when the behaviour terminates.
-        """
-        print(f"[BN_EvadeCritter] Terminating with status: {new_status}")
-        if self.task and not self.task.done():
-            self.task.cancel()
+        return Goals_BT.EvadeCritter(aagent)
 
 # ===========================
 # BEHAVIOUR: Check if Frozen
 # ===========================
-class BN_DetectFrozen(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
-        self.my_goal = None
-        # print("Initializing BN_DetectInventoryFull")
-        super(BN_DetectFrozen, self).__init__("BN_DetectFrozen")
-        self.my_agent = aagent
-        self.i_state = aagent.i_state
-    def initialise(self):
-        pass
-    def update(self):
-        if self.i_state.isFrozen:
-            return pt.common.Status.SUCCESS
-        return pt.common.Status.FAILURE
-    def terminate(self, new_status: common.Status):
-        pass
+class BN_DetectFrozen(BTBase.BN_Condition):
+    WAKE_EVENTS = (Events.FROZEN, Events.UNFROZEN)
+
+    def __init__(self, aagent=None):
+        super(BN_DetectFrozen, self).__init__("BN_DetectFrozen", aagent)
+
+    def condition(self, aagent):
+        return bool(aagent.i_state.isFrozen)
 
 
 
@@ -529,6 +251,21 @@ class BTAstronaut:
         py_trees.logging.level = py_trees.logging.Level.DEBUG
         self.aagent = aagent
 
+        if aagent.bt_compiled:
+            # Tree definition shared by all the astronauts, only the state of the nodes is kept per agent
+            definition = BTCompiler.shared_definition("BTAstronaut", BTAstronaut.create_root)
+            self.root = definition.root
+            self.behaviour_tree = BTCompiler.CompiledTree(definition, aagent)
+        else:
+            self.root = BTAstronaut.create_root(aagent)
+            self.behaviour_tree = pt.trees.BehaviourTree(self.root)
+        BTBase.wake_on_events(aagent, self.root)
+
+    @staticmethod
+    def create_root(aagent=None):
+        """
+        Builds the nodes of the tree. With aagent=None, the nodes can be shared by all the astronauts.
+        """
         # Frozen logic (highest priority)
         frozen = pt.composites.Sequence(name="Frozen", memory=True)
         frozen.add_children([BN_DetectFrozen(aagent), BN_DoNothing(aagent)])
@@ -554,8 +291,8 @@ class BTAstronaut:
         detectCritter.add_child(BN_DetectCritter(aagent))
 
         # Selector node
-        self.root = pt.composites.Selector(name="Selector", memory=False)
-        self.root.add_children([
+        root = pt.composites.Selector(name="Selector", memory=False)
+        root.add_children([
             frozen,        # 🔝 Highest priority: stay still if frozen
             evade,
             retreat,
@@ -564,7 +301,7 @@ class BTAstronaut:
             detectCritter
         ])
 
-        self.behaviour_tree = pt.trees.BehaviourTree(self.root)
+        return root
 
     def set_invalid_state(self, node):
         """
@@ -576,9 +313,15 @@ class BTAstronaut:
 
     def stop_behaviour_tree(self):
         """
-        Stops the behaviour tree by setting all nodes to INVALID.
+        Stops the behaviour tree: the running nodes are terminated (cancelling the tasks of their goals) and all
+        the nodes are set to INVALID.
         """
-        self.set_invalid_state(self.root)
+        if isinstance(self.behaviour_tree, BTCompiler.CompiledTree):
+            self.behaviour_tree.stop()
+            self.behaviour_tree.invalidate()
+        else:
+            self.root.stop(pt.common.Status.INVALID)
+            self.set_invalid_state(self.root)
 
     async def tick(self):
         """
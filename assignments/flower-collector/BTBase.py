@@ -0,0 +1,178 @@
+import asyncio
+import functools
+import py_trees as pt
+from py_trees import common
+
+
+def wake_on_events(aagent, root):
+    """
+    Subscribes the tick scheduler of the agent to the events listed in the WAKE_EVENTS of the nodes of the tree
+    'root', so the tree is ticked right away on the frame where one of them happens.
+    """
+    event_types = set()
+    for node in root.iterate():
+        event_types.update(getattr(node, "WAKE_EVENTS", ()))
+    for event_type in sorted(event_types):
+        aagent.i_state.events.subscribe(event_type, lambda data: aagent.bt_scheduler.request_tick())
+
+
+# ===========================
+# BEHAVIOUR: Shared (base class)
+# ===========================
+class BN_Shared(pt.behaviour.Behaviour):
+    """
+    Base class of the behaviours that keep their per-agent state in a memory block instead of in the behaviour.
+    One instance can then be shared by the compiled trees of all the agents of the same type (see
+    BTCompiler.TreeDefinition), which call the *_agent() methods with the agent and its memory block. The py_trees
+    interface (initialise, update, terminate) still works, using the agent given in the constructor.
+    WAKE_EVENTS lists the types of the events (see Events) that may change the result of the behaviour. The trees
+    that contain it are ticked as soon as one of them is published (see wake_on_events()).
+    """
+    WAKE_EVENTS = ()
+
+    def __init__(self, name, aagent=None):
+        """
+        :param name: Name of the behaviour
+        :param aagent: Agent used by the py_trees interface (None if the behaviour is shared)
+        """
+        super(BN_Shared, self).__init__(name)
+        self.my_agent = aagent
+        self.memory = self.create_memory()
+
+    def create_memory(self):
+        """
+        :return: New per-agent memory block of this behaviour (None if it does not need one)
+        """
+        return None
+
+    def initialise_agent(self, aagent, memory):
+        pass
+
+    def update_agent(self, aagent, memory):
+        raise NotImplementedError
+
+    def terminate_agent(self, aagent, memory, new_status):
+        pass
+
+    def initialise(self):
+        self.initialise_agent(self.my_agent, self.memory)
+
+    def update(self):
+        return self.update_agent(self.my_agent, self.memory)
+
+    def terminate(self, new_status: common.Status):
+        self.terminate_agent(self.my_agent, self.memory, new_status)
+
+
+# ===========================
+# BEHAVIOUR: Condition (base class)
+# ===========================
+class BN_Condition(BN_Shared):
+    """
+    Base class of the behaviours that check a condition on the agent: SUCCESS iff condition() is True.
+    """
+    def condition(self, aagent):
+        raise NotImplementedError
+
+    def update_agent(self, aagent, memory):
+        return common.Status.SUCCESS if self.condition(aagent) else common.Status.FAILURE
+
+
+class GoalMemory:
+    """
+    Per-agent memory of a BN_AsyncGoal.
+        goal: <asyncio.Task> Task running the goal
+        status: <common.Status> Status of the goal, cached by the done-callback
+        exception: <Exception> Exception raised by the goal, if any
+    """
+    __slots__ = ("goal", "status", "exception")
+
+    def __init__(self):
+        self.goal = None
+        self.status = common.Status.INVALID
+        self.exception = None
+
+
+# ===========================
+# BEHAVIOUR: Async Goal (base class)
+# ===========================
+class BN_AsyncGoal(BN_Shared):
+    """
+    Base class of the behaviours that run a goal of Goals_BT as an asyncio task.
+    The subclasses only have to implement create_goal(). The task is started in initialise() and, instead of
+    polling it on every tick, a done-callback caches the final status and asks the agent's tick scheduler for a
+    new tick, so the tree reacts as soon as the goal finishes.
+    """
+    def __init__(self, name, aagent=None, verbose=False):
+        """
+        :param name: Name of the behaviour
+        :param aagent: Agent that runs the behaviour tree (None if the behaviour is shared)
+        :param verbose: Print when the behaviour starts, completes and terminates
+        """
+        super(BN_AsyncGoal, self).__init__(name, aagent)
+        self.verbose = verbose
+
+    def create_memory(self):
+        return GoalMemory()
+
+    def create_goal(self, aagent):
+        """
+        :return: The goal (an object with an async run() method that returns True/False) this behaviour executes
+                 for the agent 'aagent'.
+        """
+        raise NotImplementedError
+
+    def status_from_result(self, result):
+        """
+        Translates the value returned by the goal into the status of the behaviour.
+        """
+        return common.Status.SUCCESS if result else common.Status.FAILURE
+
+    def initialise_agent(self, aagent, memory):
+        """
+        Starts the goal as an asyncio task.
+        """
+        if self.verbose:
+            print(f"[{self.name}] Initializing...")
+        memory.status = common.Status.RUNNING
+        memory.exception = None
+        memory.goal = asyncio.create_task(self.create_goal(aagent).run())
+        memory.goal.add_done_callback(functools.partial(self.goal_done, aagent, memory))
+
+    def goal_done(self, aagent, memory, task):
+        """
+        Called by asyncio when the goal task finishes. Caches its status and asks for a new tick.
+        """
+        if task is not memory.goal:
+            return  # Task of a previous execution of this behaviour
+        if task.cancelled():
+            memory.status = common.Status.FAILURE
+        elif task.exception() is not None:
+            memory.exception = task.exception()
+            memory.status = common.Status.FAILURE
+        else:
+            memory.status = self.status_from_result(task.result())
+        scheduler = getattr(aagent, "bt_scheduler", None)
+        if scheduler:
+            scheduler.request_tick()
+
+    def update_agent(self, aagent, memory):
+        """
+        Returns the cached status of the goal: RUNNING till the task finishes.
+        """
+        if memory.status == common.Status.RUNNING:
+            return common.Status.RUNNING
+        if memory.exception is not None:
+            raise memory.exception
+        if self.verbose:
+            print(f"[{self.name}] Completed with {memory.status.name}")
+        return memory.status
+
+    def terminate_agent(self, aagent, memory, new_status):
+        """
+        Cancels the associated task when the behaviour terminates.
+        """
+        if self.verbose:
+            print(f"[{self.name}] Terminating with status: {new_status}")
+        if memory.goal and not memory.goal.done():
+            memory.goal.cancel()
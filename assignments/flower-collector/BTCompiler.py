@@ -0,0 +1,356 @@
+import py_trees as pt
+from py_trees import common
+import BTBase
+
+# Kinds of nodes in the compiled tree
+LEAF = 0
+SEQUENCE = 1
+SELECTOR = 2
+PARALLEL = 3
+
+RUNNING = common.Status.RUNNING
+SUCCESS = common.Status.SUCCESS
+FAILURE = common.Status.FAILURE
+INVALID = common.Status.INVALID
+VALID_STATUS = frozenset(common.Status)
+
+# Parallel policies
+SUCCESS_ON_ALL = 0
+SUCCESS_ON_ONE = 1
+SUCCESS_ON_SELECTED = 2
+
+
+# Tree definitions shared by all the agents (see shared_definition)
+DEFINITIONS = {}
+
+
+class TreeDefinition:
+    """
+    Flat, read-only structure of a py_trees behaviour tree. The nodes are numbered in depth-first order and their
+    structure is kept in flat arrays, so a tick is a plain recursive walk over integers instead of py_trees' chain
+    of generators. The runtime state lives in each CompiledTree, so one definition can be shared by every agent that
+    runs the same tree as long as its leaves are BTBase.BN_Shared behaviours.
+        nodes: <list> Behaviour objects, indexed by node number (0 is the root)
+        kind: <list> LEAF | SEQUENCE | SELECTOR | PARALLEL
+        children: <list> Tuple with the node numbers of the children of each node
+        memory: <list> Memory flag of the Sequence/Selector nodes
+        shared: <list> True for the leaves that keep their state in a per-agent memory block (BTBase.BN_Shared)
+    """
+    def __init__(self, root):
+        self.root = root
+        self.nodes = []
+        self.kind = []
+        self.children = []
+        self.memory = []
+        self.policy = []
+        self.synchronise = []
+        self.selected = []
+        self.shared = []
+        self._compile(root)
+        self.index_of = {id(node): i for i, node in enumerate(self.nodes)}
+        self.shareable = all(self.shared[i] for i in range(len(self.nodes)) if self.kind[i] == LEAF)
+
+    def _compile(self, node):
+        """
+        Adds 'node' and its subtree to the flat arrays.
+        :return: Number of the node
+        """
+        i = len(self.nodes)
+        self.nodes.append(node)
+        self.kind.append(LEAF)
+        self.children.append(())
+        self.memory.append(False)
+        self.policy.append(None)
+        self.synchronise.append(False)
+        self.selected.append(())
+        self.shared.append(isinstance(node, BTBase.BN_Shared))
+        if isinstance(node, pt.composites.Sequence):
+            self.kind[i] = SEQUENCE
+            self.memory[i] = node.memory
+        elif isinstance(node, pt.composites.Selector):
+            self.kind[i] = SELECTOR
+            self.memory[i] = node.memory
+        elif isinstance(node, pt.composites.Parallel):
+            node.validate_policy_configuration()
+            self.kind[i] = PARALLEL
+            self.synchronise[i] = node.policy.synchronise
+            if isinstance(node.policy, common.ParallelPolicy.SuccessOnAll):
+                self.policy[i] = SUCCESS_ON_ALL
+            elif isinstance(node.policy, common.ParallelPolicy.SuccessOnOne):
+                self.policy[i] = SUCCESS_ON_ONE
+            else:
+                self.policy[i] = SUCCESS_ON_SELECTED
+        elif isinstance(node, pt.composites.Composite):
+            raise TypeError(f"Composite not supported by the compiler: {type(node).__name__}")
+        if self.kind[i] != LEAF:
+            self.children[i] = tuple(self._compile(child) for child in node.children)
+            if self.policy[i] == SUCCESS_ON_SELECTED:
+                selected = [self.nodes.index(child) for child in node.policy.children]
+                self.selected[i] = tuple(selected)
+        return i
+
+
+def shared_definition(name, create_root):
+    """
+    :param name: Name of the tree
+    :param create_root: Function that builds the root of the tree with shared behaviours (no agent)
+    :return: The TreeDefinition called 'name', built the first time it is requested
+    """
+    definition = DEFINITIONS.get(name)
+    if definition is None:
+        definition = TreeDefinition(create_root())
+        if not definition.shareable:
+            raise TypeError(f"Tree {name} has leaves that are not BTBase.BN_Shared behaviours")
+        DEFINITIONS[name] = definition
+    return definition
+
+
+class CompiledTree:
+    """
+    Runtime of a compiled behaviour tree for one agent, used as a drop-in replacement of
+    py_trees.trees.BehaviourTree. Selector, Sequence and Parallel keep exactly the same semantics as in py_trees
+    (memory flags, priority interrupts and stop/terminate calls). Shared leaves get the agent and their memory block,
+    the other leaves are called through the py_trees interface.
+    Only the per-agent state is stored here:
+        status: <list> Current status of each node (the status of the Behaviour objects is not updated)
+        current: <list> Index (in children) of the current child of each composite, -1 if None
+        blocks: <list> Memory block of each shared leaf (None for the other nodes)
+    """
+    __slots__ = ("definition", "root", "aagent", "nodes", "kind", "children", "is_shared", "status", "current",
+                 "blocks", "count")
+
+    def __init__(self, definition, aagent=None):
+        """
+        :param definition: TreeDefinition (or the root of a py_trees tree, which is compiled for this tree only)
+        :param aagent: Agent passed to the shared leaves
+        """
+        if not isinstance(definition, TreeDefinition):
+            definition = TreeDefinition(definition)
+        self.definition = definition
+        self.root = definition.root
+        self.aagent = aagent
+        self.nodes = definition.nodes
+        self.kind = definition.kind
+        self.children = definition.children
+        self.is_shared = definition.shared
+        num_nodes = len(self.nodes)
+        self.status = [INVALID] * num_nodes
+        self.current = [-1] * num_nodes
+        self.blocks = [node.create_memory() if shared else None for node, shared in zip(self.nodes, self.is_shared)]
+        self.count = 0
+
+    # ---------------------------------------------------------------- py_trees BehaviourTree interface
+    def tick(self):
+        """
+        Ticks the whole tree once.
+        """
+        self._tick(0)
+        self.count += 1
+
+    def stop(self):
+        """
+        Stops the tree, terminating the running behaviours (same as root.stop(INVALID) in py_trees).
+        """
+        self._stop(0, INVALID)
+
+    def invalidate(self):
+        """
+        Sets every node to INVALID without calling terminate(), so the next tick initialises them again.
+        """
+        for i in range(len(self.status)):
+            self.status[i] = INVALID
+            self.current[i] = -1
+
+    def status_of(self, node):
+        """
+        :return: Status of the Behaviour 'node' in this compiled tree
+        """
+        return self.status[self.definition.index_of[id(node)]]
+
+    def tip(self):
+        """
+        :return: Deepest node that is RUNNING (or the last one ticked), like Behaviour.tip() in py_trees.
+        """
+        i = 0
+        while self.kind[i] != LEAF and self.status[i] != INVALID and self.current[i] != -1:
+            i = self.children[i][self.current[i]]
+        return self.nodes[i]
+
+    # ---------------------------------------------------------------- Evaluator
+    def _stop(self, i, new_status):
+        status = self.status
+        if self.kind[i] == PARALLEL:
+            for c in self.children[i]:
+                if status[c] == RUNNING:
+                    self._stop(c, INVALID)
+        if self.kind[i] != LEAF and new_status == INVALID:
+            self.current[i] = -1
+            for c in self.children[i]:
+                if status[c] != INVALID:
+                    self._stop(c, INVALID)
+        if self.is_shared[i]:
+            self.nodes[i].terminate_agent(self.aagent, self.blocks[i], new_status)
+        else:
+            self.nodes[i].terminate(new_status)
+        status[i] = new_status
+
+    def _tick(self, i):
+        kind = self.kind[i]
+        status = self.status
+        if kind == LEAF:
+            node = self.nodes[i]
+            if self.is_shared[i]:
+                aagent = self.aagent
+                memory = self.blocks[i]
+                if status[i] != RUNNING:
+                    node.initialise_agent(aagent, memory)
+                new_status = node.update_agent(aagent, memory)
+                if new_status not in VALID_STATUS:
+                    new_status = INVALID
+                if new_status != RUNNING:
+                    node.terminate_agent(aagent, memory, new_status)
+            else:
+                if status[i] != RUNNING:
+                    node.initialise()
+                new_status = node.update()
+                if new_status not in VALID_STATUS:
+                    new_status = INVALID
+                if new_status != RUNNING:
+                    node.terminate(new_status)
+            status[i] = new_status
+            return new_status
+        if kind == SELECTOR:
+            return self._tick_selector(i)
+        if kind == SEQUENCE:
+            return self._tick_sequence(i)
+        return self._tick_parallel(i)
+
+    def _tick_selector(self, i):
+        status = self.status
+        children = self.children[i]
+        num_children = len(children)
+        if status[i] != RUNNING:
+            self.current[i] = 0 if num_children else -1
+            self.nodes[i].initialise()
+        if not num_children:
+            self.current[i] = -1
+            self._stop(i, FAILURE)
+            return FAILURE
+
+        if self.definition.memory[i]:
+            index = self.current[i]
+            for k in range(index):
+                if status[children[k]] != INVALID:
+                    self._stop(children[k], INVALID)
+        else:
+            index = 0
+
+        previous = self.current[i]
+        for k in range(index, num_children):
+            child_status = self._tick(children[k])
+            if child_status == RUNNING or child_status == SUCCESS:
+                self.current[i] = k
+                if previous != k:
+                    # Higher priority child took over: stop the lower priority ones
+                    for c in children[k + 1:]:
+                        if status[c] != INVALID:
+                            self._stop(c, INVALID)
+                if child_status == SUCCESS:
+                    self._stop(i, SUCCESS)
+                else:
+                    status[i] = RUNNING
+                return child_status
+
+        self._stop(i, FAILURE)
+        self.current[i] = num_children - 1
+        return FAILURE
+
+    def _tick_sequence(self, i):
+        status = self.status
+        children = self.children[i]
+        num_children = len(children)
+        index = 0
+        if status[i] != RUNNING:
+            self.current[i] = 0 if num_children else -1
+            for c in children:
+                if status[c] != INVALID:
+                    self._stop(c, INVALID)
+            self.nodes[i].initialise()
+        elif self.definition.memory[i] and self.current[i] != -1:
+            index = self.current[i]
+        else:
+            self.current[i] = 0 if num_children else -1
+
+        if not num_children:
+            self.current[i] = -1
+            self._stop(i, SUCCESS)
+            return SUCCESS
+
+        for k in range(index, num_children):
+            child_status = self._tick(children[k])
+            if child_status != SUCCESS:
+                if not self.definition.memory[i]:
+                    for c in children[k + 1:]:
+                        if status[c] != INVALID:
+                            self._stop(c, INVALID)
+                if child_status != RUNNING:
+                    self._stop(i, child_status)
+                else:
+                    status[i] = RUNNING
+                return child_status
+            if k + 1 < num_children:
+                self.current[i] = k + 1
+
+        self._stop(i, SUCCESS)
+        return SUCCESS
+
+    def _tick_parallel(self, i):
+        status = self.status
+        children = self.children[i]
+        if status[i] != RUNNING:
+            for c in children:
+                if status[c] != INVALID:
+                    self._stop(c, INVALID)
+            self.current[i] = -1
+            self.nodes[i].initialise()
+        if not children:
+            self.current[i] = -1
+            self._stop(i, SUCCESS)
+            return SUCCESS
+
+        synchronise = self.definition.synchronise[i]
+        for c in children:
+            if synchronise and status[c] == SUCCESS:
+                continue
+            self._tick(c)
+
+        new_status = RUNNING
+        self.current[i] = len(children) - 1
+        failed = -1
+        for k in range(len(children)):
+            if status[children[k]] == FAILURE:
+                failed = k
+                break
+        if failed != -1:
+            self.current[i] = failed
+            new_status = FAILURE
+        else:
+            policy = self.definition.policy[i]
+            if policy == SUCCESS_ON_ALL:
+                if all(status[c] == SUCCESS for c in children):
+                    new_status = SUCCESS
+            elif policy == SUCCESS_ON_ONE:
+                for k in range(len(children) - 1, -1, -1):
+                    if status[children[k]] == SUCCESS:
+                        new_status = SUCCESS
+                        self.current[i] = k
+                        break
+            else:
+                selected = self.definition.selected[i]
+                if all(status[c] == SUCCESS for c in selected):
+                    new_status = SUCCESS
+                    self.current[i] = children.index(selected[-1])
+        if new_status != RUNNING:
+            self._stop(i, new_status)
+        status[i] = new_status
+        return new_status
@@ -4,245 +4,126 @@ import py_trees
 import py_trees as pt
 from py_trees import common
 import Goals_BT
-import Sensors
+import BTBase
+import BTCompiler
 
 # ===========================
 # BEHAVIOUR: Agent will avoid obstacles
 # ===========================
-class BN_Avoid(pt.behaviour.Behaviour):
+class BN_Avoid(BTBase.BN_AsyncGoal):
     """
     Behaviour‐tree node wrapping our Goals_BT.Avoid obstacle‐avoider.
     """
-    def __init__(self, aagent):
-        super(BN_Avoid, self).__init__("BN_Avoid")
-        self.my_agent = aagent
-        self._task = None
+    def __init__(self, aagent=None):
+        super(BN_Avoid, self).__init__("BN_Avoid", aagent)
 
-    def initialise(self):
-        self._task = asyncio.create_task(Goals_BT.Avoid(self.my_agent).run())
+    def create_goal(self, aagent):
+        return Goals_BT.Avoid(aagent)
 
-    def update(self):
-        if not self._task.done():
-            return pt.common.Status.RUNNING
-        return pt.common.Status.SUCCESS  # Avoid never “fails”
-    
-    def terminate(self, new_status):
-        if self._task:
-            self._task.cancel()
+    def status_from_result(self, result):
+        return common.Status.SUCCESS  # Avoid never "fails"
 
 # ===========================
 # BEHAVIOUR: Detecting Flowers
 # ===========================
-class BN_DetectFlower(pt.behaviour.Behaviour):
+class BN_DetectFlower(BTBase.BN_Condition):
     """
     Agent will return SUCCESS iff it has a flower in sight
     """
-    def __init__(self, aagent):
-        self.my_goal = None
-        super(BN_DetectFlower, self).__init__("BN_DetectFlower")
-        self.my_agent = aagent
-
-    def initialise(self):
-        pass
+    def __init__(self, aagent=None):
+        super(BN_DetectFlower, self).__init__("BN_DetectFlower", aagent)
 
-    def update(self):
-        sensor_obj_info = self.my_agent.rc_sensor.sensor_rays[Sensors.RayCastSensor.OBJECT_INFO]
-        for index, value in enumerate(sensor_obj_info):
-            if value:  # there is a hit with an object
-                if value["tag"] == "AlienFlower":  # If it is a flower
-                    # print("Flower detected!")
-                    # print("BN_DetectFlower completed with SUCCESS")
-                    return pt.common.Status.SUCCESS
+    def condition(self, aagent):
+        if aagent.rc_sensor.sees("AlienFlower"):
+            # print("Flower detected!")
+            # print("BN_DetectFlower completed with SUCCESS")
+            return True
         # print("No flower...")
         # print("BN_DetectFlower completed with FAILURE")
-        return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        pass
+        return False
 
 # ===========================
 # BEHAVIOUR: Facing the flower
 # ===========================
-class BN_FaceFlower(pt.behaviour.Behaviour):
+class BN_FaceFlower(BTBase.BN_AsyncGoal):
     """
     The agent will rotate until it's facing a flower
     """
-    def __init__(self, aagent):
-        self.my_goal = None
-        # print("Initializing BN_FaceFlower")
-        super(BN_FaceFlower, self).__init__("BN_FaceFlower")
-        self.my_agent = aagent
+    def __init__(self, aagent=None):
+        super(BN_FaceFlower, self).__init__("BN_FaceFlower", aagent, verbose=True)
 
-    def initialise(self):
-        self.my_goal = asyncio.create_task(Goals_BT.FaceFlower(self.my_agent).run())
-
-    def update(self):
-        if not self.my_goal.done():
-            # print("BN_FaceFlower completed with RUNNING")
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                print("BN_FaceFlower completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("BN_FaceFlower completed with FAILURE")
-                return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        self.my_goal.cancel()    
+    def create_goal(self, aagent):
+        return Goals_BT.FaceFlower(aagent)
 
 # ===========================
 # BEHAVIOUR: Walking to the flower
 # ===========================
-class BN_WalkToFlower(pt.behaviour.Behaviour):
+class BN_WalkToFlower(BTBase.BN_AsyncGoal):
     """
     Agent walks towards the flower (Agent has to already be facing the right direction)
     """
-    def __init__(self, aagent):
-        self.my_goal = None
-        super(BN_WalkToFlower, self).__init__("BN_WalkToFlower")
-        self.my_agent = aagent
+    def __init__(self, aagent=None):
+        super(BN_WalkToFlower, self).__init__("BN_WalkToFlower", aagent, verbose=True)
 
-    def initialise(self):
-        self.my_goal = asyncio.create_task(Goals_BT.WalkToFlower(self.my_agent).run())
-
-    def update(self):
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                print("BN_WalkToFlower completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("BN_WalkToFlower completed with FAILURE")
-                return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        self.my_goal.cancel()
+    def create_goal(self, aagent):
+        return Goals_BT.WalkToFlower(aagent)
 
 # ===========================
 # BEHAVIOUR: Detecting astronaut
 # ===========================
-class BN_DetectAstronaut(pt.behaviour.Behaviour):
+class BN_DetectAstronaut(BTBase.BN_Condition):
     """
     Agent will return SUCCESS iff it has an astronaut in sight
     """
-    def __init__(self, aagent):
-        self.my_goal = None
-        # print("Initializing BN_DetectAstronaut")
-        super(BN_DetectAstronaut, self).__init__("BN_DetectAstronaut")
-        self.my_agent = aagent
+    def __init__(self, aagent=None):
+        super(BN_DetectAstronaut, self).__init__("BN_DetectAstronaut", aagent)
 
-    def initialise(self):
-        pass
+    def condition(self, aagent):
+        if aagent.rc_sensor.sees("Astronaut"):
+            # print("Astronaut detected!")
+            print("BN_DetectAstronaut completed with SUCCESS")
+            return True
 
-    def update(self):
-        sensor_obj_info = self.my_agent.rc_sensor.sensor_rays[Sensors.RayCastSensor.OBJECT_INFO]
-        for index, value in enumerate(sensor_obj_info):
-            if value:  # there is a hit with an object
-                if value["tag"] == "Astronaut":  # If it is an Astronaut
-                    # print("Astronaut detected!")
-                    print("BN_DetectAstronaut completed with SUCCESS")
-                    return pt.common.Status.SUCCESS
-
-        return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        pass
+        return False
 
 # ===========================
 # BEHAVIOUR: Facing the astronaut
 # ===========================
-class BN_FaceAstronaut(pt.behaviour.Behaviour):
+class BN_FaceAstronaut(BTBase.BN_AsyncGoal):
     """
     The agent will rotate until it's facing a flower
     """
-    def __init__(self, aagent):
-        self.my_goal = None
-        super(BN_FaceAstronaut, self).__init__("BN_FaceAstronaut")
-        self.my_agent = aagent
-        self.last_astronaut_idx = None
+    def __init__(self, aagent=None):
+        super(BN_FaceAstronaut, self).__init__("BN_FaceAstronaut", aagent, verbose=True)
 
-    def initialise(self):
-        self.my_goal = asyncio.create_task(Goals_BT.FaceAstronaut(self.my_agent).run())
-
-    def update(self):
-        if not self.my_goal.done():
-            # print("BN_FaceAstronaut completed with RUNNING")
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                print("BN_FaceAstronaut completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("BN_FaceAstronaut completed with FAILURE")
-                return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        self.my_goal.cancel()  
+    def create_goal(self, aagent):
+        return Goals_BT.FaceAstronaut(aagent)
 
 # ===========================
 # BEHAVIOUR: Chasing the astronaut
 # ===========================
-class BN_ChaseAstronaut(pt.behaviour.Behaviour):
+class BN_ChaseAstronaut(BTBase.BN_AsyncGoal):
     """
     Walk towards the astronaut (Agent has to already be facing the right direction)
     """
-    def __init__(self, aagent):
-        self.my_goal = None
-        super(BN_ChaseAstronaut, self).__init__("BN_ChaseAstronaut")
-        self.my_agent = aagent
-
-    def initialise(self):
-        self.my_goal = asyncio.create_task(Goals_BT.WalkToAstronaut(self.my_agent).run())
+    def __init__(self, aagent=None):
+        super(BN_ChaseAstronaut, self).__init__("BN_ChaseAstronaut", aagent, verbose=True)
 
-    def update(self):
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                print("BN_ChaseAstronaut completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("BN_ChaseAstronaut completed with FAILURE")
-                return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        self.my_goal.cancel()
+    def create_goal(self, aagent):
+        return Goals_BT.WalkToAstronaut(aagent)
 
 # ===========================
 # BEHAVIOUR: Retreat from the astronaut
 # ===========================
-class BN_Retreat(pt.behaviour.Behaviour):
+class BN_Retreat(BTBase.BN_AsyncGoal):
     """
     Agent will retreat from the astronaut so that it is able to go back to picking flowers
     """
-    def __init__(self, aagent):
-        self.my_goal = None
-        super(BN_Retreat, self).__init__("BN_Retreat")
-        self.my_agent = aagent
-
-    def initialise(self):
-        self.my_goal = asyncio.create_task(Goals_BT.Retreat(self.my_agent).run())
+    def __init__(self, aagent=None):
+        super(BN_Retreat, self).__init__("BN_Retreat", aagent, verbose=True)
 
-    def update(self):
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                print("BN_Retreat completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                print("BN_Retreat completed with FAILURE") # Cannot Fail
-                return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        self.my_goal.cancel()
+    def create_goal(self, aagent):
+        return Goals_BT.Retreat(aagent)
 
 
 # ===========================
@@ -258,6 +139,21 @@ class BTCritter:
         """
         self.aagent = aagent
 
+        if aagent.bt_compiled:
+            # Tree definition shared by all the critters, only the state of the nodes is kept per agent
+            definition = BTCompiler.shared_definition("BTCritter", BTCritter.create_root)
+            self.root = definition.root
+            self.behaviour_tree = BTCompiler.CompiledTree(definition, aagent)
+        else:
+            self.root = BTCritter.create_root(aagent)
+            self.behaviour_tree = pt.trees.BehaviourTree(self.root)
+        BTBase.wake_on_events(aagent, self.root)
+
+    @staticmethod
+    def create_root(aagent=None):
+        """
+        Builds the nodes of the tree. With aagent=None, the nodes can be shared by all the critters.
+        """
         # Chase astronaut logic
         chase = pt.composites.Sequence(name="DetectFlower", memory=True)
         chase.add_children([BN_DetectAstronaut(aagent), BN_FaceAstronaut(aagent), BN_ChaseAstronaut(aagent), BN_Retreat(aagent)])
@@ -268,10 +164,9 @@ class BTCritter:
         roaming.add_child(BN_Avoid(aagent))
         
         # Selector node
-        self.root = pt.composites.Selector(name="Selector", memory=False)
-        self.root.add_children([chase, roaming])
-
-        self.behaviour_tree = pt.trees.BehaviourTree(self.root)
+        root = pt.composites.Selector(name="Selector", memory=False)
+        root.add_children([chase, roaming])
+        return root
 
     def set_invalid_state(self, node):
         """
@@ -283,9 +178,15 @@ class BTCritter:
 
     def stop_behaviour_tree(self):
         """
-        Stops the behaviour tree by setting all nodes to INVALID.
+        Stops the behaviour tree: the running nodes are terminated (cancelling the tasks of their goals) and all
+        the nodes are set to INVALID.
         """
-        self.set_invalid_state(self.root)
+        if isinstance(self.behaviour_tree, BTCompiler.CompiledTree):
+            self.behaviour_tree.stop()
+            self.behaviour_tree.invalidate()
+        else:
+            self.root.stop(pt.common.Status.INVALID)
+            self.set_invalid_state(self.root)
 
     async def tick(self):
         """
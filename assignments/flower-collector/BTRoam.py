@@ -4,117 +4,46 @@ import py_trees
 import py_trees as pt
 from py_trees import common
 import Goals_BT
-import Sensors
+import BTBase
+import BTCompiler
 
 
-class BN_DoNothing(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
-        self.my_agent = aagent
-        self.my_goal = None
-        super(BN_DoNothing, self).__init__("BN_DoNothing")
+class BN_DoNothing(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
+        super(BN_DoNothing, self).__init__("BN_DoNothing", aagent)
 
-    def initialise(self):
-        self.my_goal = asyncio.create_task(Goals_BT.DoNothing(self.my_agent).run())
+    def create_goal(self, aagent):
+        return Goals_BT.DoNothing(aagent)
 
-    def update(self):
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            if self.my_goal.result():
-                # print("BN_DoNothing completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                # print("BN_DoNothing completed with FAILURE")
-                return pt.common.Status.FAILURE
 
-    def terminate(self, new_status: common.Status):
-        # Finishing the behaviour, therefore we have to stop the associated task
-        self.my_goal.cancel()
+class BN_ForwardRandom(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
+        super(BN_ForwardRandom, self).__init__("BN_ForwardRandom", aagent)
 
+    def create_goal(self, aagent):
+        return Goals_BT.ForwardDist(aagent, -1, 1, 5)
 
-class BN_ForwardRandom(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
-        self.my_goal = None
-        # print("Initializing BN_ForwardRandom")
-        super(BN_ForwardRandom, self).__init__("BN_ForwardRandom")
-        self.logger.debug("Initializing BN_ForwardRandom")
-        self.my_agent = aagent
-
-    def initialise(self):
-        self.logger.debug("Create Goals_BT.ForwardDist task")
-        self.my_goal = asyncio.create_task(Goals_BT.ForwardDist(self.my_agent, -1, 1, 5).run())
-
-    def update(self):
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            if self.my_goal.result():
-                self.logger.debug("BN_ForwardRandom completed with SUCCESS")
-                # print("BN_ForwardRandom completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                self.logger.debug("BN_ForwardRandom completed with FAILURE")
-                # print("BN_ForwardRandom completed with FAILURE")
-                return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        # Finishing the behaviour, therefore we have to stop the associated task
-        self.logger.debug("Terminate BN_ForwardRandom")
-        self.my_goal.cancel()
-
-
-class BN_TurnRandom(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
-        self.my_goal = None
-        # print("Initializing BN_TurnRandom")
-        super(BN_TurnRandom, self).__init__("BN_TurnRandom")
-        self.my_agent = aagent
 
-    def initialise(self):
-        self.my_goal = asyncio.create_task(Goals_BT.Turn(self.my_agent).run())
+class BN_TurnRandom(BTBase.BN_AsyncGoal):
+    def __init__(self, aagent=None):
+        super(BN_TurnRandom, self).__init__("BN_TurnRandom", aagent)
 
-    def update(self):
-        if not self.my_goal.done():
-            return pt.common.Status.RUNNING
-        else:
-            res = self.my_goal.result()
-            if res:
-                # print("BN_Turn completed with SUCCESS")
-                return pt.common.Status.SUCCESS
-            else:
-                # print("BN_Turn completed with FAILURE")
-                return pt.common.Status.FAILURE
+    def create_goal(self, aagent):
+        return Goals_BT.Turn(aagent)
 
-    def terminate(self, new_status: common.Status):
-        # Finishing the behaviour, therefore we have to stop the associated task
-        self.logger.debug("Terminate BN_TurnRandom")
-        self.my_goal.cancel()
 
+class BN_DetectFlower(BTBase.BN_Condition):
+    def __init__(self, aagent=None):
+        super(BN_DetectFlower, self).__init__("BN_DetectFlower", aagent)
 
-class BN_DetectFlower(pt.behaviour.Behaviour):
-    def __init__(self, aagent):
-        self.my_goal = None
-        # print("Initializing BN_DetectFlower")
-        super(BN_DetectFlower, self).__init__("BN_DetectFlower")
-        self.my_agent = aagent
-
-    def initialise(self):
-        pass
-
-    def update(self):
-        sensor_obj_info = self.my_agent.rc_sensor.sensor_rays[Sensors.RayCastSensor.OBJECT_INFO]
-        for index, value in enumerate(sensor_obj_info):
-            if value:  # there is a hit with an object
-                if value["tag"] == "AlienFlower":  # If it is a flower
-                    # print("Flower detected!")
-                    # print("BN_DetectFlower completed with SUCCESS")
-                    return pt.common.Status.SUCCESS
+    def condition(self, aagent):
+        if aagent.rc_sensor.sees("AlienFlower"):
+            # print("Flower detected!")
+            # print("BN_DetectFlower completed with SUCCESS")
+            return True
         # print("No flower...")
         # print("BN_DetectFlower completed with FAILURE")
-        return pt.common.Status.FAILURE
-
-    def terminate(self, new_status: common.Status):
-        pass
+        return False
 
 
 class BTRoam:
@@ -123,10 +52,21 @@ class BTRoam:
 
         self.aagent = aagent
 
-        self.root = pt.composites.Parallel("Parallel", policy=py_trees.common.ParallelPolicy.SuccessOnAll())
-        self.root.add_children([BN_ForwardRandom(aagent), BN_TurnRandom(aagent)])
+        if aagent.bt_compiled:
+            # Tree definition shared by all the agents, only the state of the nodes is kept per agent
+            definition = BTCompiler.shared_definition("BTRoam", BTRoam.create_root)
+            self.root = definition.root
+            self.behaviour_tree = BTCompiler.CompiledTree(definition, aagent)
+        else:
+            self.root = BTRoam.create_root(aagent)
+            self.behaviour_tree = pt.trees.BehaviourTree(self.root)
+        BTBase.wake_on_events(aagent, self.root)
 
-        self.behaviour_tree = pt.trees.BehaviourTree(self.root)
+    @staticmethod
+    def create_root(aagent=None):
+        root = pt.composites.Parallel("Parallel", policy=py_trees.common.ParallelPolicy.SuccessOnAll())
+        root.add_children([BN_ForwardRandom(aagent), BN_TurnRandom(aagent)])
+        return root
 
     # Function to set invalid state for a node and its children recursively
     def set_invalid_state(self, node):
@@ -135,8 +75,13 @@ class BTRoam:
             self.set_invalid_state(child)
 
     def stop_behaviour_tree(self):
-        # Setting all the nodes to invalid, we force the associated asyncio tasks to be cancelled
-        self.set_invalid_state(self.root)
+        # Stopping the running nodes cancels the asyncio tasks of their goals; then all the nodes are set to invalid
+        if isinstance(self.behaviour_tree, BTCompiler.CompiledTree):
+            self.behaviour_tree.stop()
+            self.behaviour_tree.invalidate()
+        else:
+            self.root.stop(pt.common.Status.INVALID)
+            self.set_invalid_state(self.root)
 
     async def tick(self):
         self.behaviour_tree.tick()
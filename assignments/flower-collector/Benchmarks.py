@@ -0,0 +1,594 @@
+import io
+import copy
+import sys
+import time
+import json
+import asyncio
+import tracemalloc
+import contextlib
+import py_trees as pt
+import Codec
+import Sensors
+import History
+import Recorder
+import Monitor
+import BTBase
+import BTRoam
+import BTCritter
+import BTAstronaut
+import BTCompiler
+import AAgent_BT
+from AAgent_BT import AAgent, InternalState, TickScheduler, Vector3
+
+
+# ================================
+# Sample data
+# ================================
+def sample_i_state_dict(num_items=3):
+    """
+    Internal state dictionary with the same format Unity sends inside the "sensor" messages.
+    """
+    return {
+        "isRotatingRight": False, "isRotatingLeft": True, "movingForwards": True, "movingBackwards": False,
+        "isFrozen": False, "speed": 1.5,
+        "position": {"x": 12.3, "y": 0.0, "z": -4.2}, "rotation": {"x": 0.0, "y": 187.4, "z": 0.0},
+        "currentNamedLoc": "", "onRoute": False, "targetNamedLoc": "",
+        "myInventoryList": [{"name": f"Item{i}", "amount": i} for i in range(num_items)],
+        "nearbyContainerInventory": False, "nearbyContainerInventoryList": []
+    }
+
+
+def sample_rays(rays_per_direction=2):
+    """
+    Ray perception with the format expected by RayCastSensor.set_perception(). One of every three rays hits something.
+    """
+    tags = ["AlienFlower", "Rock", "Astronaut", "CritterMantaRay"]
+    rays = []
+    for i in range(rays_per_direction * 2 + 1):
+        if i % 3 == 0:
+            rays.append([i, 1, {"name": f"Object{i}", "tag": tags[i % len(tags)], "distance": 1.0 + i * 0.1}])
+        else:
+            rays.append([i, 0, None])
+    return rays
+
+
+def sample_sensor_message(rays_per_direction=2, num_items=3):
+    """
+    Complete "sensor" message in json format, as it arrives from Unity.
+    """
+    return json.dumps({"Type": "sensor",
+                       "Content": [sample_rays(rays_per_direction), sample_i_state_dict(num_items)]})
+
+
+def measure(function, min_time=1.0):
+    """
+    Calls 'function' repeatedly during at least 'min_time' seconds.
+    :return: Calls per second
+    """
+    calls = 0
+    batch = 100
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            function()
+        calls += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls / elapsed
+
+
+# ================================
+# BENCHMARK: JSON codec
+# ================================
+def bench_codec():
+    """
+    Frames per second that one core can decode and apply to the agent structures, and actions per second it can
+    encode, for every JSON backend available.
+    """
+    for rays_per_direction in (2, 50):
+        msg = sample_sensor_message(rays_per_direction)
+        print(f"--- Sensor frame with {rays_per_direction * 2 + 1} rays ({len(msg)} bytes)")
+        for backend in Codec.Codec.BACKENDS:
+            if not Codec.Codec.available(backend):
+                print(f"{backend:>8}: not installed")
+                continue
+            codec = Codec.Codec(backend)
+            rc_sensor = Sensors.RayCastSensor([rays_per_direction, 45, 0, 10])
+            i_state = InternalState()
+
+            def decode_and_apply():
+                msg_type, (rays, i_state_dict) = codec.decode_message(msg)
+                rc_sensor.set_perception(rays)
+                i_state.update_internal_state(rays, i_state_dict)
+
+            frames = measure(decode_and_apply)
+            actions = measure(lambda: codec.encode_message("action", "mf"))
+            print(f"{backend:>8}: {frames:12.0f} frames/s  {actions:12.0f} actions/s")
+
+
+# ================================
+# BENCHMARK: Internal state
+# ================================
+class DictInternalState:
+    """
+    Internal state as it was before the slotted InternalState: every frame replaces the attributes with the dicts and
+    lists of the decoded message.
+    """
+    def __init__(self):
+        self.isRotatingRight = False
+        self.isRotatingLeft = False
+        self.movingForwards = False
+        self.movingBackwards = False
+        self.isFrozen = None
+        self.speed = 0.0
+        self.position = {"x": 0, "y": 0, "z": 0}
+        self.rotation = {"x": 0, "y": 0, "z": 0}
+        self.currentNamedLoc = ""
+        self.onRoute = False
+        self.targetNamedLoc = ""
+        self.myInventoryList = []
+        self.nearbyContainerInventory = False
+        self.nearbyContainerInventoryList = []
+
+    def update_internal_state(self, sensor_info, i_state_dict):
+        self.isRotatingRight = i_state_dict["isRotatingRight"]
+        self.isRotatingLeft = i_state_dict["isRotatingLeft"]
+        self.movingForwards = i_state_dict["movingForwards"]
+        self.movingBackwards = i_state_dict["movingBackwards"]
+        self.isFrozen = i_state_dict["isFrozen"]
+        self.speed = i_state_dict["speed"]
+        self.position = i_state_dict["position"]
+        self.rotation = i_state_dict["rotation"]
+        self.currentNamedLoc = i_state_dict["currentNamedLoc"]
+        self.onRoute = i_state_dict["onRoute"]
+        self.targetNamedLoc = i_state_dict["targetNamedLoc"]
+        self.myInventoryList = i_state_dict["myInventoryList"]
+        self.nearbyContainerInventory = i_state_dict["nearbyContainerInventory"]
+        self.nearbyContainerInventoryList = i_state_dict["nearbyContainerInventoryList"]
+
+
+def bench_i_state(num_agents=1000):
+    """
+    Cost of applying a frame to the internal state and memory kept per agent between frames, with the dict based
+    state and with the slotted InternalState. The memory includes whatever the state keeps of the decoded message.
+    """
+    for num_items in (1, 5):
+        msg = json.dumps(sample_i_state_dict(num_items))
+        print(f"--- {num_items} inventory items")
+        for state_class in (DictInternalState, InternalState):
+            i_state = state_class()
+            i_state_dict = json.loads(msg)
+            updates = measure(lambda: i_state.update_internal_state(None, i_state_dict))
+
+            tracemalloc.start()
+            states = [state_class() for _ in range(num_agents)]
+            for state in states:
+                state.update_internal_state(None, json.loads(msg))
+            memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del states
+            print(f"{state_class.__name__:>17}: update {1e6 / updates:6.2f} us  {memory / num_agents:8.0f} bytes/agent")
+
+
+def bench_gui():
+    """
+    Cost of applying a sensor frame on the receive path with the Tk monitor off, with the monitor on (the frame is
+    published as a snapshot reference) and with the deepcopy the monitor used to take of every frame it received.
+    """
+    for rays_per_direction in (2, 50):
+        msg = sample_sensor_message(rays_per_direction)
+        agent = quiet_agent()
+        agent.rc_sensor = Sensors.RayCastSensor([rays_per_direction, 45, 0, 10])
+        agent.history = History.FrameHistory(64, agent.rc_sensor.num_rays)
+        msg_type, content = agent.codec.decode_message(msg)
+        print(f"--- Sensor frame with {rays_per_direction * 2 + 1} rays")
+        results = {}
+        for name in ("off", "on", "deepcopy"):
+            AAgent_BT.active_tk_gui = name == "on"
+
+            def receive():
+                agent.dispatch_message(msg_type, content)
+                if name == "deepcopy":
+                    copy.deepcopy((content[1], content[0]))
+
+            results[name] = 1e6 / measure(receive)
+        AAgent_BT.active_tk_gui = False
+        print(f"GUI off {results['off']:6.2f} us  GUI on (snapshot) {results['on']:6.2f} us  "
+              f"GUI on (deepcopy) {results['deepcopy']:7.2f} us")
+
+
+# ================================
+# BENCHMARK: Perception queries
+# ================================
+def scan_tag(rc_sensor, tag):
+    """
+    Linear scan of the rays looking for 'tag', as the BN_Detect* conditions did before the perception index.
+    """
+    for value in rc_sensor.sensor_rays[Sensors.RayCastSensor.OBJECT_INFO]:
+        if value and value["tag"] == tag:
+            return True
+    return False
+
+
+def bench_perception():
+    """
+    Cost of the tag conditions evaluated on every tick of the astronaut and critter trees (DetectFrozen aside), with
+    linear scans and with the per-frame index of RayCastSensor, and cost of set_perception() with the index build.
+    """
+    tags = ("AlienFlower", "CritterMantaRay", "Astronaut", "CritterMantaRay")
+    for rays_per_direction in (2, 10, 50):
+        rc_sensor = Sensors.RayCastSensor([rays_per_direction, 45, 0, 10])
+        rays = sample_rays(rays_per_direction)
+        # Only rocks in sight: the conditions fail, which is the common (and worst) case for the scans
+        for ray in rays:
+            if ray[2]:
+                ray[2]["tag"] = "Rock"
+        rc_sensor.set_perception(rays)
+
+        def scan_conditions():
+            for tag in tags:
+                scan_tag(rc_sensor, tag)
+
+        def index_conditions():
+            for tag in tags:
+                rc_sensor.sees(tag)
+
+        scan = measure(scan_conditions)
+        index = measure(index_conditions)
+        frames = measure(lambda: rc_sensor.set_perception(rays))
+        print(f"{rays_per_direction * 2 + 1:4d} rays: scan {1e6 / scan:7.2f} us/tick  index {1e6 / index:7.2f} us/tick  "
+              f"set_perception {1e6 / frames:7.2f} us/frame")
+
+
+def bench_sensor():
+    """
+    Cost of set_perception() and of the sector/threshold queries with the plain RayCastSensor and with the NumPy
+    ArrayRayCastSensor, for growing sensor resolutions.
+    """
+    if Sensors.np is None:
+        print("NumPy is not installed")
+        return
+    for rays_per_direction in (2, 50, 200):
+        rays = sample_rays(rays_per_direction)
+        print(f"--- {rays_per_direction * 2 + 1} rays")
+        for sensor_class in (Sensors.RayCastSensor, Sensors.ArrayRayCastSensor):
+            rc_sensor = sensor_class([rays_per_direction, 45, 0, 10])
+            rc_sensor.set_perception(rays)
+
+            def queries():
+                rc_sensor.count_hits_closer_than(2.0)
+                rc_sensor.hits_on_left()
+                rc_sensor.min_distance_in_sector(-15.0, 15.0)
+                rc_sensor.bearing("AlienFlower")
+
+            frames = measure(lambda: rc_sensor.set_perception(rays))
+            calls = measure(queries)
+            print(f"{sensor_class.__name__:>19}: set_perception {1e6 / frames:8.2f} us  queries {1e6 / calls:8.2f} us")
+
+
+def bench_history():
+    """
+    Cost of appending a frame to the FrameHistory ring buffer, with the rays as the lists of RayCastSensor and as the
+    NumPy arrays of ArrayRayCastSensor, and of the windowed queries, for growing sensor resolutions.
+    """
+    position = Vector3(1.0, 0.0, 2.0)
+    rotation = Vector3(0.0, 90.0, 0.0)
+    for rays_per_direction in (2, 50, 200):
+        num_rays = rays_per_direction * 2 + 1
+        rc_sensor = Sensors.create_ray_sensor([rays_per_direction, 45, 0, 10], arrays=True)
+        history = History.FrameHistory(64, num_rays)
+        frame = [0.0]
+        ray_lists = ([1] * num_rays, [3.5] * num_rays)
+
+        def append(rays):
+            frame[0] += 0.05
+            history.append(frame[0], position, rotation, 1.0, *rays)
+
+        def queries():
+            history.is_stuck(0.5)
+            history.velocity(10)
+            history.mean("yaw", 5)
+            history.ray_window(10)
+
+        from_lists = measure(lambda: append(ray_lists))
+        from_arrays = measure(lambda: append(rc_sensor.ray_buffers()))
+        calls = measure(queries)
+        print(f"{num_rays:4d} rays: append {1e6 / from_lists:6.2f} us (lists) {1e6 / from_arrays:6.2f} us (arrays)  "
+              f"queries {1e6 / calls:6.2f} us")
+
+
+# ================================
+# BENCHMARK: Behaviour tree ticks
+# ================================
+class PollingGoalNode(pt.behaviour.Behaviour):
+    """
+    Leaf that polls its goal task on every update, as the BN_ nodes did before BTBase.BN_AsyncGoal.
+    """
+    def __init__(self, aagent):
+        super(PollingGoalNode, self).__init__("PollingGoalNode")
+        self.my_agent = aagent
+        self.my_goal = None
+
+    def initialise(self):
+        self.my_goal = asyncio.create_task(asyncio.Event().wait())
+
+    def update(self):
+        if not self.my_goal.done():
+            return pt.common.Status.RUNNING
+        return pt.common.Status.SUCCESS if self.my_goal.result() else pt.common.Status.FAILURE
+
+    def terminate(self, new_status):
+        self.my_goal.cancel()
+
+
+class NeverEndingGoal:
+    async def run(self):
+        await asyncio.Event().wait()
+
+
+class CallbackGoalNode(BTBase.BN_AsyncGoal):
+    """
+    Same leaf using the done-callback base class.
+    """
+    def __init__(self, aagent):
+        super(CallbackGoalNode, self).__init__("CallbackGoalNode", aagent)
+
+    def create_goal(self, aagent):
+        return NeverEndingGoal()
+
+
+def quiet_agent(config_file="AAgent-1.json"):
+    """
+    Agent without connection, ready to run its main loop against a ReplaySocket.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = AAgent(config_file)
+    pt.logging.level = pt.logging.Level.WARN
+    agent.ws = Recorder.ReplaySocket()
+    return agent
+
+
+async def cancel_pending_tasks():
+    """
+    Cancels every task of the event loop except the current one and waits till they finish, so no task is left
+    pending (and destroyed) when the benchmark returns.
+    """
+    pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def ticks_with_scheduler(bt_name, mode, rate, seconds=1.0, frame_rate=20):
+    """
+    Runs the main loop of an agent with the behaviour tree 'bt_name' during 'seconds', feeding it 'frame_rate'
+    sensor frames per second.
+    :return: Ticks done
+    """
+    agent = quiet_agent("AAgent-1.json" if bt_name != "BTCritter" else "AAgent-2.json")
+    agent.bt_scheduler = TickScheduler(agent, mode, rate)
+    msg = sample_sensor_message()
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent.process_incoming_message(json.dumps({"Type": "sim_control", "Content": "start"}))
+        agent.process_incoming_message(json.dumps({"Type": "agent_control", "Content": "bt:" + bt_name}))
+        tasks = [asyncio.create_task(agent.main_loop()), asyncio.create_task(agent.send_actions())]
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            agent.process_incoming_message(msg)
+            await asyncio.sleep(1.0 / frame_rate)
+        agent.exit_event.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await cancel_pending_tasks()
+    return agent.bt_scheduler.ticks
+
+
+async def bench_bt_async():
+    agent = quiet_agent()
+    for node_class in (PollingGoalNode, CallbackGoalNode):
+        root = pt.composites.Selector(name="Selector", memory=False)
+        for i in range(4):
+            root.add_child(pt.behaviours.Failure(name=f"Condition{i}"))
+        root.add_child(node_class(agent))
+        tree = pt.trees.BehaviourTree(root)
+        tree.tick()
+        print(f"{node_class.__name__:>17}: {measure(tree.tick):10.0f} ticks/s (leaf RUNNING)")
+        tree.interrupt()
+        # The goal tasks of the leaves never end on their own
+        await cancel_pending_tasks()
+
+    print("--- Ticks done in 1 s with 20 sensor frames/s")
+    for bt_name in ("BTAstronautAlone", "BTCritter", "BTRoam"):
+        rate = await ticks_with_scheduler(bt_name, TickScheduler.RATE, 0)
+        frame = await ticks_with_scheduler(bt_name, TickScheduler.FRAME, 0)
+        print(f"{bt_name:>17}: {rate:4d} ticks in rate mode (rate 0)  {frame:4d} ticks in frame mode")
+
+
+def bench_bt():
+    """
+    Ticks per second of a tree whose leaf polls its goal task (old BN_ nodes) against the done-callback leaf, and
+    ticks done by the real behaviour trees with the rate scheduler without a rate limit (it skips the periods where
+    nothing changed) and with the frame-driven scheduler.
+    """
+    asyncio.run(bench_bt_async())
+
+
+async def bench_compiled_async():
+    trees = (("BTAstronautAlone", BTAstronaut.BTAstronaut, "AAgent-1.json"),
+             ("BTCritter", BTCritter.BTCritter, "AAgent-2.json"),
+             ("BTRoam", BTRoam.BTRoam, "AAgent-1.json"))
+    for bt_name, bt_class, config_file in trees:
+        results = []
+        for compiled in (False, True):
+            agent = quiet_agent(config_file)
+            agent.bt_compiled = compiled
+            agent.process_incoming_message(sample_sensor_message())
+            with contextlib.redirect_stdout(io.StringIO()):
+                bt = bt_class(agent)
+                pt.logging.level = pt.logging.Level.WARN
+                bt.behaviour_tree.tick()
+                results.append(measure(bt.behaviour_tree.tick))
+                bt.stop_behaviour_tree()
+                pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        print(f"{bt_name:>17}: py_trees {results[0]:10.0f} ticks/s  compiled {results[1]:10.0f} ticks/s  "
+              f"(x{results[1] / results[0]:.1f})")
+
+    # Deeper tree: priorities of condition sequences in front of a running leaf
+    agent = quiet_agent()
+    for compiled in (False, True):
+        root = pt.composites.Selector(name="Selector", memory=False)
+        for i in range(8):
+            branch = pt.composites.Sequence(name=f"Branch{i}", memory=True)
+            branch.add_children([pt.behaviours.Success(name=f"Check{i}"), pt.behaviours.Failure(name=f"Condition{i}")])
+            root.add_child(branch)
+        root.add_child(CallbackGoalNode(agent))
+        tree = BTCompiler.CompiledTree(root) if compiled else pt.trees.BehaviourTree(root)
+        tree.tick()
+        name = "compiled" if compiled else "py_trees"
+        print(f"{'9 branches':>17}: {name} {measure(tree.tick):10.0f} ticks/s")
+        if compiled:
+            tree.stop()
+        else:
+            root.stop(pt.common.Status.INVALID)
+
+
+def bench_compiled():
+    """
+    Ticks per second of the behaviour trees of the agents (with a sample sensor frame and the goals RUNNING) using
+    py_trees and using the flat evaluator of BTCompiler.
+    """
+    asyncio.run(bench_compiled_async())
+
+
+def build_agents(config_file, num_agents, eager):
+    """
+    Builds 'num_agents' agents. If 'eager', also builds all their goals and behaviour trees (as the agents did
+    before the lazy registries).
+    """
+    agents = []
+    for _ in range(num_agents):
+        agent = AAgent(config_file)
+        if eager:
+            for name in agent.goals.factories:
+                agent.goals[name]
+            for name in agent.bts.factories:
+                agent.bts[name]
+        agents.append(agent)
+    return agents
+
+
+async def bench_construction_async(num_agents=200):
+    for config_file in ("AAgent-1.json", "AAgent-2.json"):
+        for eager in (True, False):
+            with contextlib.redirect_stdout(io.StringIO()):
+                build_agents(config_file, 1, eager)  # Warm up imports and caches
+                tracemalloc.start()
+                start = time.perf_counter()
+                agents = build_agents(config_file, num_agents, eager)
+                elapsed = time.perf_counter() - start
+                memory, _ = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            built = len(agents[0].goals) + len(agents[0].bts)
+            name = "eager" if eager else "lazy"
+            print(f"{config_file:>13} {name:>5}: {elapsed / num_agents * 1e6:8.1f} us/agent  "
+                  f"{memory / num_agents / 1024:7.1f} KiB/agent  ({built} goals/BTs built)")
+            del agents
+
+
+async def bench_flyweight_async(num_agents=200):
+    trees = (("BTAstronautAlone", BTAstronaut.BTAstronaut, "AAgent-1.json"),
+             ("BTCritter", BTCritter.BTCritter, "AAgent-2.json"),
+             ("BTRoam", BTRoam.BTRoam, "AAgent-1.json"))
+    for bt_name, bt_class, config_file in trees:
+        agents = [quiet_agent(config_file) for _ in range(num_agents)]
+        results = []
+        for compiled in (False, True):
+            with contextlib.redirect_stdout(io.StringIO()):
+                for agent in agents:
+                    agent.bt_compiled = compiled
+                bt_class(agents[0])  # The shared definition is built once, out of the measure
+                tracemalloc.start()
+                bts = [bt_class(agent) for agent in agents]
+                memory, _ = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            results.append(memory / num_agents / 1024)
+            del bts
+        print(f"{bt_name:>17}: py_trees {results[0]:6.1f} KiB/agent  shared definition {results[1]:6.1f} KiB/agent")
+
+
+def bench_flyweight():
+    """
+    Memory used by the behaviour tree of each agent when every agent builds its own py_trees tree and when the
+    compiled trees share one definition per tree type.
+    """
+    asyncio.run(bench_flyweight_async())
+
+
+async def bench_pack_monitor_async():
+    for num_agents in (20, 200):
+        with contextlib.redirect_stdout(io.StringIO()):
+            agents = build_agents("AAgent-1.json", num_agents, False)
+            for agent in agents:
+                agent.process_incoming_message(sample_sensor_message())
+                agent.currentBT = "BTAstronautAlone"
+                agent.bts[agent.currentBT].behaviour_tree.tick()
+            pt.logging.level = pt.logging.Level.WARN
+        sampler = Monitor.PackSampler(agents)
+        now = [0.0]
+
+        def step():
+            now[0] += Monitor.PACK_SAMPLE_STEP
+            sampler.step(now[0])
+
+        steps = measure(step)
+        renders = measure(lambda: Monitor.encode_rows(sampler.rows))
+        # Time spent monitoring per second: 1 / PACK_SAMPLE_STEP steps and 1 / PACK_RENDER_PERIOD renders
+        busy = 1.0 / Monitor.PACK_SAMPLE_STEP / steps + 1.0 / Monitor.PACK_RENDER_PERIOD / renders
+        print(f"{num_agents:4d} agents: step {1e6 / steps:7.1f} us  table {1e6 / renders:7.1f} us  "
+              f"{busy * 100:.3f}% of a core")
+        for agent in agents:
+            agent.bts[agent.currentBT].stop_behaviour_tree()
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def bench_pack_monitor():
+    """
+    Cost of the pack monitor on the spawner side (sampling the agents and encoding the table) for 20 and 200
+    agents. The rendering runs in the monitor process.
+    """
+    asyncio.run(bench_pack_monitor_async())
+
+
+def bench_construction():
+    """
+    Construction time and memory per agent building all the goals and BTs (old behaviour) and building only the
+    one named by 'initial_task' (lazy registries).
+    """
+    asyncio.run(bench_construction_async())
+
+
+BENCHMARKS = {
+    "codec": bench_codec,
+    "bt": bench_bt,
+    "compiled": bench_compiled,
+    "construction": bench_construction,
+    "flyweight": bench_flyweight,
+    "gui": bench_gui,
+    "history": bench_history,
+    "pack_monitor": bench_pack_monitor,
+    "i_state": bench_i_state,
+    "perception": bench_perception,
+    "sensor": bench_sensor,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("Usage: python Benchmarks.py <" + "|".join(BENCHMARKS) + ">")
+    else:
+        BENCHMARKS[sys.argv[1]]()
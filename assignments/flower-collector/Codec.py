@@ -0,0 +1,152 @@
+import json
+import os
+from typing import List, Optional, Tuple, TypedDict, Union
+
+# Optional fast JSON libraries. If none of them is installed, the standard json module is used
+try:
+    import orjson # type: ignore
+except ImportError:
+    orjson = None
+try:
+    import msgspec # type: ignore
+except ImportError:
+    msgspec = None
+
+
+# Schema of the "sensor" messages, used by the msgspec backend to decode them with a typed decoder.
+# They are TypedDicts, so the decoded content is still made of plain dicts and lists: the consumers
+# (RayCastSensor.set_perception() and InternalState.update_internal_state()) do not change.
+class HitInfo(TypedDict):
+    name: str
+    tag: str
+    distance: float
+
+
+class Vector(TypedDict):
+    x: float
+    y: float
+    z: float
+
+
+class InventoryItem(TypedDict):
+    name: str
+    amount: int
+
+
+class SensorState(TypedDict):
+    isRotatingRight: bool
+    isRotatingLeft: bool
+    movingForwards: bool
+    movingBackwards: bool
+    isFrozen: bool
+    speed: float
+    position: Vector
+    rotation: Vector
+    currentNamedLoc: str
+    onRoute: bool
+    targetNamedLoc: str
+    myInventoryList: List[InventoryItem]
+    nearbyContainerInventory: bool
+    nearbyContainerInventoryList: List[InventoryItem]
+
+
+# [<num_ray_cast>, <hit: 1/0 or true/false>, <hit_object_info or None>]
+Ray = Tuple[int, Union[int, bool], Optional[HitInfo]]
+SensorContent = Tuple[List[Ray], SensorState]
+
+if msgspec:
+    class RawMessage(msgspec.Struct):
+        """
+        Envelope of a message from Unity, with the content left undecoded till its type is known.
+        """
+        Type: str
+        Content: msgspec.Raw
+
+
+class Codec:
+    """
+    JSON codec used to decode the messages that arrive from Unity and to encode the ones we send.
+        backend: <str> Name of the library in use: "orjson", "msgspec" or "json"
+    Preference order: orjson, msgspec and json. A backend can be forced with the environment
+    variable AAGENT_JSON_BACKEND or with the parameter 'backend'.
+    """
+    BACKENDS = ("orjson", "msgspec", "json")
+
+    # Exceptions raised by the backends when the message is not valid json
+    DECODE_ERRORS = (ValueError,) + ((msgspec.DecodeError,) if msgspec else ())
+
+    def __init__(self, backend=None):
+        backend = backend or os.environ.get("AAGENT_JSON_BACKEND")
+        if backend is None:
+            backend = next(name for name in self.BACKENDS if self.available(name))
+        elif not self.available(backend):
+            raise ValueError(f"JSON backend not available: {backend}")
+        self.backend = backend
+
+        if backend == "orjson":
+            self.loads = orjson.loads
+            self.dumps = lambda obj: orjson.dumps(obj).decode()
+        elif backend == "msgspec":
+            decoder = msgspec.json.Decoder()
+            encoder = msgspec.json.Encoder()
+            self.loads = decoder.decode
+            self.dumps = lambda obj: encoder.encode(obj).decode()
+            # Typed path of decode_message(): the envelope first, then the content with its schema
+            self.envelope_decoder = msgspec.json.Decoder(RawMessage)
+            # Not strict, so flags sent as 0/1 in the bool fields are accepted as with the other backends
+            self.sensor_decoder = msgspec.json.Decoder(SensorContent, strict=False)
+            self.decode_message = self.decode_message_typed
+        else:
+            self.loads = json.loads
+            self.dumps = json.dumps
+
+    @staticmethod
+    def available(backend):
+        """
+        :param backend: Name of the backend
+        :return: True if the backend can be used in this python environment
+        """
+        if backend == "orjson":
+            return orjson is not None
+        if backend == "msgspec":
+            return msgspec is not None
+        return backend == "json"
+
+    def decode_message(self, msg_data):
+        """
+        Decodes a message received from Unity.
+        :param msg_data: Message in json format (str or bytes)
+        :return: (msg_type, content). For "sensor" messages, content is the tuple (rays, i_state_dict) where rays has
+                 the format expected by RayCastSensor.set_perception() and i_state_dict the one expected by
+                 InternalState.update_internal_state()
+        """
+        msg_dict = self.loads(msg_data)
+        msg_type = msg_dict["Type"]
+        content = msg_dict["Content"]
+        if msg_type == "sensor":
+            return msg_type, (content[0], content[1])
+        return msg_type, content
+
+    def decode_message_typed(self, msg_data):
+        """
+        decode_message() of the msgspec backend. The "sensor" messages are decoded with the schema SensorContent, so
+        a message that does not follow it raises msgspec.ValidationError (one of DECODE_ERRORS) instead of failing
+        later in the agent. The content of the other messages is decoded without a schema.
+        """
+        message = self.envelope_decoder.decode(msg_data)
+        if message.Type == "sensor":
+            return message.Type, self.sensor_decoder.decode(message.Content)
+        return message.Type, self.loads(message.Content)
+
+    def encode_message(self, msg_type, msg_content):
+        """
+        Encodes a message to be sent to Unity.
+        :param msg_type: General type of the message.
+        :param msg_content: Content of the message
+        :return: Message in json format (str)
+        """
+        return self.dumps({"type": msg_type, "content": msg_content})
+
+
+# Codec shared by all the agents of the process
+default_codec = Codec()
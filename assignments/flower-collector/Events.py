@@ -0,0 +1,147 @@
+import asyncio
+from collections import namedtuple
+
+# Types of the events published in the feed of the internal state
+#   ITEM_ADDED / ITEM_REMOVED -> the amount of an item of the agent's inventory went up / down (InventoryChange)
+#   CONTAINER_ITEM_ADDED / CONTAINER_ITEM_REMOVED -> same for the inventory of the nearby container
+#   FROZEN / UNFROZEN -> the agent was frozen by a collision with an enemy / can move again (no data)
+#   ROUTE_STARTED / ROUTE_FINISHED -> the agent started / stopped moving with the NavMesh (name of the target)
+#   ENTERED_LOCATION / LEFT_LOCATION -> the agent entered / left a named location (name of the location)
+#   CONTAINER_APPEARED -> there is a container nearby (its inventory)
+ITEM_ADDED = "item_added"
+ITEM_REMOVED = "item_removed"
+CONTAINER_ITEM_ADDED = "container_item_added"
+CONTAINER_ITEM_REMOVED = "container_item_removed"
+FROZEN = "frozen"
+UNFROZEN = "unfrozen"
+ROUTE_STARTED = "route_started"
+ROUTE_FINISHED = "route_finished"
+ENTERED_LOCATION = "entered_location"
+LEFT_LOCATION = "left_location"
+CONTAINER_APPEARED = "container_appeared"
+
+# Change of the amount of one item: old and new amounts (0 if the item was not / is not in the inventory)
+InventoryChange = namedtuple("InventoryChange", ("name", "old", "new"))
+NO_CHANGES = ()
+
+
+class EventFeed:
+    """
+    Publishes the changes detected in the internal state of an agent, as (event_type, data) pairs.
+    The behaviour tree nodes can subscribe callbacks, which are called synchronously when the frame that contains
+    the change is applied, and the goals can await the next event of a type instead of polling on every frame.
+        subscribers: <dict> event_type -> list of callbacks(data)
+        waiters: <list> (event_type, match, future) of the coroutines waiting in wait()
+    """
+    def __init__(self):
+        self.subscribers = {}
+        self.waiters = []
+
+    def subscribe(self, event_type, callback):
+        """
+        Calls 'callback(data)' every time an event of type 'event_type' is published.
+        """
+        self.subscribers.setdefault(event_type, []).append(callback)
+
+    def unsubscribe(self, event_type, callback):
+        callbacks = self.subscribers.get(event_type)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+
+    def publish(self, event_type, data=None):
+        """
+        Notifies the event to the subscribers and wakes up the coroutines waiting for it.
+        """
+        for callback in tuple(self.subscribers.get(event_type, ())):
+            try:
+                callback(data)
+            except Exception as e:
+                print(f"Failed notifying the event {event_type}: {e}")
+        if self.waiters:
+            pending = []
+            for waiter in self.waiters:
+                waiter_type, match, future = waiter
+                if future.done():
+                    continue  # Cancelled or timed out
+                if waiter_type == event_type and (match is None or match(data)):
+                    future.set_result(data)
+                else:
+                    pending.append(waiter)
+            self.waiters = pending
+
+    async def wait(self, event_type, match=None, timeout=None):
+        """
+        Waits till the next event of type 'event_type' whose data satisfies 'match(data)' (any data if None).
+        :param timeout: Maximum time to wait in seconds (None waits forever).
+        :return: Data of the event, or None if the timeout expired.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((event_type, match, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Inventory(dict):
+    """
+    Inventory indexed by item name (name -> amount), updated by diffing the item lists of the sensor messages.
+    Each change of amount is published in 'feed' as an InventoryChange, with the type 'added_type' if the amount
+    went up or 'removed_type' if it went down. Only the items with a positive amount are stored.
+    """
+    def __init__(self, feed, added_type=ITEM_ADDED, removed_type=ITEM_REMOVED):
+        super(Inventory, self).__init__()
+        self.feed = feed
+        self.added_type = added_type
+        self.removed_type = removed_type
+
+    def apply(self, item_list):
+        """
+        Updates the inventory with the list of a message [{'name': '', 'amount': 0}, ...] and publishes the changes.
+        :return: List of InventoryChange (NO_CHANGES if nothing changed)
+        """
+        stored = 0
+        get = self.get
+        for item in item_list:
+            amount = item["amount"]
+            if get(item["name"], 0) != amount:
+                break
+            if amount:
+                stored += 1
+        else:
+            if stored == len(self):
+                return NO_CHANGES  # Same items and amounts as the inventory: the usual case on most frames
+        changes = []
+        names = set()
+        for item in item_list:
+            name = item["name"]
+            amount = item["amount"]
+            if not amount:
+                continue  # Same as not being in the list: the inventory only stores positive amounts
+            names.add(name)
+            old = self.get(name, 0)
+            if old != amount:
+                changes.append(InventoryChange(name, old, amount))
+                self[name] = amount
+        for name in [name for name in self if name not in names]:
+            # No longer in the list (or listed with amount 0)
+            changes.append(InventoryChange(name, self.pop(name), 0))
+        for change in changes:
+            self.feed.publish(self.added_type if change.new > change.old else self.removed_type, change)
+        return changes
+
+    async def wait_added(self, name=None, timeout=None):
+        """
+        Waits till the amount of the item 'name' (any item if None) goes up.
+        :return: The InventoryChange, or None if the timeout expired.
+        """
+        return await self.feed.wait(self.added_type, None if name is None else lambda change: change.name == name,
+                                    timeout)
+
+    async def wait_removed(self, name=None, timeout=None):
+        """
+        Waits till the amount of the item 'name' (any item if None) goes down.
+        :return: The InventoryChange, or None if the timeout expired.
+        """
+        return await self.feed.wait(self.removed_type, None if name is None else lambda change: change.name == name,
+                                    timeout)
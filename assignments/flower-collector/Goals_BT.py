@@ -2,7 +2,7 @@ import math
 import random
 import asyncio
 import time
-import Sensors
+import Events
 from collections import Counter
 
 # ================================
@@ -55,31 +55,31 @@ class ForwardDist:
         self.target_dist = dist
         self.d_min = d_min
         self.d_max = d_max
-        self.starting_pos = a_agent.i_state.position
+        self.starting_pos = a_agent.i_state.position.copy()
         self.state = self.STOPPED
 
     async def run(self):
         try:
-            previous_dist = 0.0
+            start_time = time.monotonic()
             while True:
                 if self.state == self.STOPPED:
-                    self.starting_pos = self.a_agent.i_state.position
+                    self.starting_pos = self.a_agent.i_state.position.copy()
                     self.target_dist = random.randint(self.d_min, self.d_max) if self.original_dist < 0 else self.original_dist
                     await self.a_agent.send_message("action", "mf")
                     self.state = self.MOVING
 
                 elif self.state == self.MOVING:
-                    await asyncio.sleep(0.5) # Small delay to allow for movement
+                    await self.a_agent.next_frame()  # React to every new position
                     current_dist = calculate_distance(self.starting_pos, self.i_state.position)
                     if current_dist >= self.target_dist:
                         await self.a_agent.send_message("action", "ntm")
                         self.state = self.STOPPED
                         return True
-                    elif previous_dist == current_dist:
+                    # Check that we have moved in the last 0.5 seconds
+                    if time.monotonic() - start_time >= 0.5 and self.a_agent.history.is_stuck(0.5):
                         await self.a_agent.send_message("action", "ntm")
                         self.state = self.STOPPED
                         return False
-                    previous_dist = current_dist
                 else:
                     print("[ForwardDist]: Unknown state: " + str(self.state))
                     return False
@@ -112,12 +112,11 @@ class ForwardStop:
                     await self.a_agent.send_message("action", "mf")
                     self.state = self.MOVING
                 elif self.state == self.MOVING:
-                    sensor_hits = self.rc_sensor.sensor_rays[Sensors.RayCastSensor.HIT]
-                    if any(ray_hit == 1 for ray_hit in sensor_hits):
+                    if self.rc_sensor.any_hit():
                         self.state = self.END
                         await self.a_agent.send_message("action", "stop")
                     else:
-                        await asyncio.sleep(0)
+                        await self.a_agent.next_frame()
                 elif self.state == self.END:
                     break
                 else:
@@ -135,6 +134,9 @@ class Turn:
     """
     Rotates agent randomly between 10 and 360 degrees in the random direction.
     """
+    # Seconds to wait for the turn before giving up (the agent may be frozen or blocked)
+    TIMEOUT = 10.0
+
     def __init__(self, a_agent):
         self.a_agent = a_agent
         self.i_state = a_agent.i_state
@@ -142,60 +144,29 @@ class Turn:
     async def run(self):
         try:
             # Getting Y rotation
-            start_rotation = self.i_state.rotation["y"]
+            start_rotation = self.i_state.rotation.y
             print(f"[Turn]: start rotation: {start_rotation}")
 
             # Choosing angle and direction
             turn_angle = random.randint(10, 360)
             direction = random.choice(["tl", "tr"])
             print(f"[Turn]: 🔄 Turning {turn_angle} degrees to the {'left' if direction == 'tl' else 'right'}")
-            
-            # Calculate the target rotation
-            target_rotation = (start_rotation - turn_angle + 360) % 360 if direction == "tl" else (start_rotation + turn_angle) % 360
-            print(f"[Turn]: Target rotation: {target_rotation}")
 
             # Making the movement
             await self.a_agent.send_message("action", direction)
 
-            # Keeping track of how much we've turned so far
-            initial_rotation = start_rotation
-            last_rotation = initial_rotation
-            total_turned = 0
-
-            # Continuously checking rotation until we reach close to the target
-            while True:
-                current_rotation = self.i_state.rotation["y"]
-                
-                # Calculate how much we turned since last check
-                delta = 0
-                if direction == "tl":
-                    if current_rotation > last_rotation:  # Crossing from 0 to 359
-                        delta = -(last_rotation + (360 - current_rotation))
-                    else:
-                        delta = -(last_rotation - current_rotation)
-                else:  
-                    if current_rotation < last_rotation:  # Crossing 359 to 0
-                        delta = (360 - last_rotation) + current_rotation
-                    else:
-                        delta = current_rotation - last_rotation
-                
-                # Adding to total amount turned
-                total_turned += delta
-                print(f"[Turn]: Current: {current_rotation:.2f}, Delta: {delta:.2f}, Total turned: {abs(total_turned):.2f}/{turn_angle}")
-                
-                # Checking if we've turned enough
-                if abs(total_turned) >= turn_angle - 5:
-                    break
-                    
-                # Update last rotation
-                last_rotation = current_rotation
-            
-                await asyncio.sleep(0.05)  # Small delay
+            # Wait for the frame where we have turned enough (small tolerance)
+            total_turned = await self.a_agent.yaw.turned(turn_angle - 5, direction, self.TIMEOUT)
+            current_rotation = self.i_state.rotation.y
 
             # Stop turning
             await self.a_agent.send_message("action", "nt")
 
-            print(f"[Turn]: ✅ Turn complete! Started at {initial_rotation:.2f}°, ended at {current_rotation:.2f}°, turned {abs(total_turned):.2f}° towards the {'left' if direction == 'tl' else 'right'}")
+            if total_turned is None:
+                print(f"[Turn]: ❌ Could not turn {turn_angle} degrees in {self.TIMEOUT} s")
+                return False
+
+            print(f"[Turn]: ✅ Turn complete! Started at {start_rotation:.2f}°, ended at {current_rotation:.2f}°, turned {abs(total_turned):.2f}° towards the {'left' if direction == 'tl' else 'right'}")
             await asyncio.sleep(2)
             return True
 
@@ -363,8 +334,8 @@ class Avoid:
         self.MIN_DISTANCE = 2  # meters to object
         self.REQUIRED_HITS = 1   # min sensors detecting obstacle
         
-        # Turn tracking
-        self.turn_start_rot = 0
+        # Turn tracking (turn_start_heading is the unwrapped heading of History.YawTracker)
+        self.turn_start_heading = 0
         self.turn_direction = None
         self.turn_progress = 0
 
@@ -375,8 +346,7 @@ class Avoid:
             
             while True:
                 # Get fresh sensor data every iteration
-                hits, distances = await self.get_sensor_data()
-                obstacle_count, direction = self.count_obstacles(hits, distances)
+                obstacle_count, direction = self.count_obstacles()
                 
                 if self.state == self.MOVING:
                     if time.time() - self.move_start_time > 3.0:
@@ -397,8 +367,7 @@ class Avoid:
                         # print("Turn complete, checking path...")
                 
                 elif self.state == self.CHECKING:
-                    hits, distances = await self.get_sensor_data()
-                    obstacle_count, direction = self.count_obstacles(hits, distances)
+                    obstacle_count, direction = self.count_obstacles()
                     
                     if obstacle_count < self.REQUIRED_HITS:
                         # print("Path clear - resuming movement")
@@ -407,37 +376,20 @@ class Avoid:
                         # print("Path still blocked - turning more")
                         await self.continue_turn()
                 
-                await asyncio.sleep(0.05)
+                await self.a_agent.next_frame()
                 
         except Exception as e:
             print(f"Avoid error: {e}")
             await self.cleanup()
 
-    async def get_sensor_data(self):
-        """Return fresh sensor data with debug info"""
-        hits = self.rc_sensor.sensor_rays[Sensors.RayCastSensor.HIT]
-        distances = self.rc_sensor.sensor_rays[Sensors.RayCastSensor.DISTANCE]
-        
-        # Debug print sensor data
-        debug_info = [
-            f"Sensor {i}: {'HIT' if h == 1 else 'clear'} {d:.2f}m"
-            for i, (h, d) in enumerate(zip(hits, distances))
-        ]
-        # print(" | ".join(debug_info))
-        
-        return hits, distances
-
-    def count_obstacles(self, hits, distances):
+    def count_obstacles(self):
         """
             This serves two purposes:
                 - Counting sensors detecting obstacles within min distance
-                - Deciding what direction it should turn
+                - Deciding what direction it should turn (away from the left side if something is there)
         """
-        count = sum(
-            1 for h, d in zip(hits, distances)
-            if h == 1 and d is not None and d < self.MIN_DISTANCE
-            )
-        if (hits[0] != 0) or (hits[1] != 0): direction = "tr"
+        count = self.rc_sensor.count_hits_closer_than(self.MIN_DISTANCE)
+        if self.rc_sensor.hits_on_left(): direction = "tr"
         else: direction = "tl"
         return count, direction
 
@@ -445,30 +397,17 @@ class Avoid:
         """Start a new turn sequence"""
         await self.a_agent.send_message("action", "stop")
         self.turn_direction = direction
-        self.turn_start_rot = self.i_state.rotation["y"]
+        self.turn_start_heading = self.a_agent.yaw.heading
         self.turn_progress = 0
         
-        #  {self.turn_direction} turn from {self.turn_start_rot}°")
+        #  {self.turn_direction} turn from {self.turn_start_heading}°")
         await self.a_agent.send_message("action", self.turn_direction)
         self.state = self.TURNING
 
     async def update_turn(self):
         """Update turn progress and return True when complete"""
-        current_rot = self.i_state.rotation["y"]
-        direction = self.turn_direction
-        
-        # Calculate turn progress
-        if direction == "tl":  # Left turn
-            if current_rot > self.turn_start_rot:  # Crossed 0°
-                delta = (360 - current_rot) + self.turn_start_rot
-            else:
-                delta = self.turn_start_rot - current_rot
-        else:  # Right turn
-            if current_rot < self.turn_start_rot:  # Crossed 360°
-                delta = (360 - self.turn_start_rot) + current_rot
-            else:
-                delta = current_rot - self.turn_start_rot
-        
+        # Calculate turn progress in the direction of the turn
+        delta = self.a_agent.yaw.turned_since(self.turn_start_heading, self.turn_direction)
         self.turn_progress = delta
         # print(f"Turn progress: {delta:.1f}°/{self.TURN_ANGLE}°")
         
@@ -479,7 +418,7 @@ class Avoid:
 
     async def continue_turn(self):
         """Continue turning in same direction"""
-        self.turn_start_rot = self.i_state.rotation["y"]
+        self.turn_start_heading = self.a_agent.yaw.heading
         self.turn_progress = 0
         await self.a_agent.send_message("action", self.turn_direction)
         self.state = self.TURNING
@@ -521,6 +460,11 @@ class DirectedTurn:
     The agent randomly selects a degree of turn between 10 and 360,
     along with a direction (left or right), and executes the turn accordingly.
     """
+    # Degrees of each turn
+    STEP = 1
+    # Seconds to wait for the step before giving up (the agent may be frozen or blocked)
+    TIMEOUT = 1.0
+
     def __init__(self, a_agent, direction):
         self.a_agent = a_agent
         self.i_state = a_agent.i_state
@@ -528,48 +472,18 @@ class DirectedTurn:
 
     async def run(self):
         try:
-            start_rotation = self.i_state.rotation["y"]
-            turn_angle = 1
-            
-            # Calculate the target rotation
-            target_rotation = (start_rotation - turn_angle + 360) % 360 if self.direction == "tl" else (start_rotation + turn_angle) % 360
+            turn_angle = self.STEP
 
             # Send turn command
             await self.a_agent.send_message("action", self.direction)
 
-            # Keep track of how much we've turned so far
-            initial_rotation = start_rotation
-            last_rotation = initial_rotation
-            total_turned = 0
-
-            # Continuously check rotation until we reach close to the target
-            while True:
-                current_rotation = self.i_state.rotation["y"]
-                delta = 0
-                
-                if self.direction == "tl":
-                    if current_rotation > last_rotation:  # We crossed from 0 to 359
-                        delta = -(last_rotation + (360 - current_rotation))
-                    else:
-                        delta = -(last_rotation - current_rotation)
-                else:  # Right turn
-                    if current_rotation < last_rotation:  # We crossed from 359 to 0
-                        delta = (360 - last_rotation) + current_rotation
-                    else:
-                        delta = current_rotation - last_rotation
-                
-                # Add to total amount turned
-                total_turned += delta
-                
-                # Check if we've turned enough (with small tolerance)
-                if abs(total_turned) >= turn_angle - 5:
-                    break
-                    
-                # Update last rotation for next iteration
-                last_rotation = current_rotation
-                await asyncio.sleep(0.05)  # Small delay to prevent overloading
+            # Wait for the frame where we have turned the angle
+            turned = await self.a_agent.yaw.turned(turn_angle, self.direction, self.TIMEOUT)
 
             await self.a_agent.send_message("action", "nt")
+            if turned is None:
+                print(f"[DirectedTurn]: ❌ Could not turn in {self.TIMEOUT} s")
+                return False
             await asyncio.sleep(0.05)
             return True
 
@@ -582,6 +496,15 @@ class DirectedTurn:
             await self.a_agent.send_message("action", "nt")
             return False
         
+def center_tolerance(rc_sensor):
+    """
+    Degrees from the center at which a target counts as centered: half the angle between two rays (so with the usual
+    sensors only the center ray counts), but at least two DirectedTurn steps. A step then always lands inside the
+    window, and high-resolution sensors do not oscillate around the center ray.
+    """
+    return max(rc_sensor.angle_between_rays / 2, 2 * DirectedTurn.STEP)
+
+
 # =======================
 # GOAL: Face Flower
 # =======================
@@ -592,41 +515,32 @@ class FaceFlower:
     def __init__(self, a_agent):
         self.a_agent = a_agent
         self.rc_sensor = a_agent.rc_sensor
+        self.center_tolerance = center_tolerance(self.rc_sensor)
 
     def turn_direction(self, flower_idx):
         """
-        Decide turn direction based on where the flower is relative to sensor index 2 (center).
+        Decide turn direction based on where the flower is relative to the center ray.
         """
-        if flower_idx < 2:
-            return "tl"
-        elif flower_idx > 2:
-            return "tr"
-        else:
-            return None  # Already centered
+        return self.rc_sensor.turn_towards(flower_idx)  # None if already centered
 
     async def run(self):
         while True:
-            sensor_obj_info = self.rc_sensor.sensor_rays[Sensors.RayCastSensor.OBJECT_INFO]
-            flower_idx = None
-
             # Find the flower's current position
-            for i, obj in enumerate(sensor_obj_info):
-                if obj and obj["tag"] == "AlienFlower":
-                    flower_idx = i
-                    break
+            flower_idx = self.rc_sensor.first_ray("AlienFlower")
 
             if flower_idx is None:
                 print("No flower detected")
                 return False
 
-            if flower_idx == 2:
+            if self.rc_sensor.is_centered(flower_idx, self.center_tolerance):
                 print("Looking towards flower")
                 return True
 
             direction = self.turn_direction(flower_idx)
 
-            await DirectedTurn(self.a_agent, direction).run()
-            await asyncio.sleep(0.01)
+            if not await DirectedTurn(self.a_agent, direction).run():
+                return False  # The turn was cancelled or failed
+            await self.a_agent.next_frame()
 
 # =======================
 # GOAL: Approach and Collect Flower
@@ -640,26 +554,20 @@ class WalkToFlower:
         self.i_state = a_agent.i_state
 
     def get_flower_count(self):
-        for item in self.i_state.myInventoryList:
-            if item["name"] == "AlienFlower":
-                return item["amount"]
-        return 0
+        return self.i_state.inventory.get("AlienFlower", 0)
 
     async def run(self):
         try:
             start_count = self.get_flower_count()
 
             await self.a_agent.send_message("action", "mf")
-            await asyncio.sleep(0.05)
 
-            while True:
-                current_count = self.get_flower_count()
-                
-                if current_count > start_count:
-                    print("[WalkToFlower]: ✅ New flower added to inventory!")
-                    await self.a_agent.send_message("action", "ntm")  # Stop moving
-                    return True
-                await asyncio.sleep(0.1)  # Small delay between checks
+            # Wait for the frame where the inventory shows the new flower
+            if self.get_flower_count() <= start_count:
+                await self.i_state.inventory.wait_added("AlienFlower")
+            print("[WalkToFlower]: ✅ New flower added to inventory!")
+            await self.a_agent.send_message("action", "ntm")  # Stop moving
+            return True
 
         except asyncio.CancelledError:
             print("***** TASK WalkToFlower CANCELLED")
@@ -707,13 +615,17 @@ class WalkToBase:
             print("[WalkToBase]: Initiating base navigation...")
             await self.a_agent.send_message("action", "walk_to,Base")
             
-            # Give initial movement time to start
-            await asyncio.sleep(0.5)
-            
-            # Check every 0.5 seconds until we're no longer on route
-            while self.a_agent.i_state.onRoute:
+            # Give initial movement time to start (at most 0.5 seconds)
+            i_state = self.a_agent.i_state
+            if not i_state.onRoute:
+                if await i_state.events.wait(Events.ROUTE_STARTED, timeout=0.5) is None:
+                    print("Still navigating to base...")
+
+            # Wait for the frame where the route finishes, reporting every 0.5 seconds while it does not
+            while i_state.onRoute:
+                if await i_state.events.wait(Events.ROUTE_FINISHED, timeout=0.5) is not None:
+                    break
                 print("Still navigating to base...")
-                await asyncio.sleep(0.5)
             
             print("[WalkToBase]: Confirmed arrival at base!")
             return True
@@ -757,41 +669,32 @@ class FaceAstronaut:
     def __init__(self, a_agent):
         self.a_agent = a_agent
         self.rc_sensor = a_agent.rc_sensor
+        self.center_tolerance = center_tolerance(self.rc_sensor)
 
     def turn_direction(self, astronaut_idx):
         """
-        Decide turn direction based on where the flower is relative to sensor index 2 (center).
+        Decide turn direction based on where the astronaut is relative to the center ray.
         """
-        if astronaut_idx < 2:
-            return "tl"
-        elif astronaut_idx > 2:
-            return "tr"
-        else:
-            return None
+        return self.rc_sensor.turn_towards(astronaut_idx)
 
     async def run(self):
         while True:
-            sensor_obj_info = self.rc_sensor.sensor_rays[Sensors.RayCastSensor.OBJECT_INFO]
-            astronaut_idx = None
-
             # Find the astronaut's current position
-            for i, obj in enumerate(sensor_obj_info):
-                if obj and obj["tag"] == "Astronaut":
-                    astronaut_idx = i
-                    break
+            astronaut_idx = self.rc_sensor.first_ray("Astronaut")
 
             if astronaut_idx is None:
                 print("[FaceAstronaut]: No astronaut detected")
                 return False
 
-            if astronaut_idx == 2:
+            if self.rc_sensor.is_centered(astronaut_idx, self.center_tolerance):
                 print("[FaceAstronaut]: Looking towards astronaut")
                 return True
 
             direction = self.turn_direction(astronaut_idx)
             await self.a_agent.send_message("action", "ntm")
-            await DirectedTurn(self.a_agent, direction).run()
-            await asyncio.sleep(0.01)
+            if not await DirectedTurn(self.a_agent, direction).run():
+                return False  # The turn was cancelled or failed
+            await self.a_agent.next_frame()
 
 # =======================
 # GOAL: Walk to Astronaut
@@ -811,28 +714,25 @@ class WalkToAstronaut:
         await self.a_agent.send_message("action", "mf")
 
         while True:
-            sensor_data = self.rc_sensor.sensor_rays[Sensors.RayCastSensor.OBJECT_INFO]
-            astronaut_detected = False
-
-            for obj in sensor_data:
-                if obj and obj["tag"] == "Astronaut":
-                    distance = obj.get("distance", None)
-                    if distance is not None:
-                        print(f"[WalkToAstronaut]: 📡 Distance: {distance:.3f}m")
-                        astronaut_detected = True
-                        self.min_distance = min(self.min_distance, distance)
-
-                        # Case 1: Definitely touching
-                        if distance <= self.touch_threshold:
-                            print("[WalkToAstronaut]: ✅ Astronaut touched!")
-                            await self.a_agent.send_message("action", "ntm")
-                            return True
-
-                        # Case 2: Not moving closer (likely stuck/colliding)
-                        elif (distance >= self.min_distance - 0.2) and (self.min_distance < 0.3):  # Tiny buffer
-                            print("[WalkToAstronaut]: ⚠️ Distance not decreasing. Assuming collision.")
-                            await self.a_agent.send_message("action", "ntm")
-                            return True
+            nearest = self.rc_sensor.nearest_hit("Astronaut")
+            astronaut_detected = nearest is not None
+
+            if astronaut_detected:
+                distance = nearest[1]
+                print(f"[WalkToAstronaut]: 📡 Distance: {distance:.3f}m")
+                self.min_distance = min(self.min_distance, distance)
+
+                # Case 1: Definitely touching
+                if distance <= self.touch_threshold:
+                    print("[WalkToAstronaut]: ✅ Astronaut touched!")
+                    await self.a_agent.send_message("action", "ntm")
+                    return True
+
+                # Case 2: Not moving closer (likely stuck/colliding)
+                elif (distance >= self.min_distance - 0.2) and (self.min_distance < 0.3):  # Tiny buffer
+                    print("[WalkToAstronaut]: ⚠️ Distance not decreasing. Assuming collision.")
+                    await self.a_agent.send_message("action", "ntm")
+                    return True
 
             # Case 3: Astronaut lost (sensor missed it at close range)
             if not astronaut_detected and self.min_distance < 0.5:
@@ -840,7 +740,7 @@ class WalkToAstronaut:
                 await self.a_agent.send_message("action", "ntm")
                 return True
 
-            await asyncio.sleep(0.1)  # Avoid busy-waiting
+            await self.a_agent.next_frame()  # Wait for new sensor data
         
 # =======================
 # GOAL: Retreat
@@ -905,15 +805,11 @@ class EvadeCritter:
             return False
 
     def _detect_critter_position(self):
-        sensor_obj_info = self.rc_sensor.sensor_rays[Sensors.RayCastSensor.OBJECT_INFO]
-        for i, obj in enumerate(sensor_obj_info):
-            if obj and obj["tag"] == "CritterMantaRay":
-                return i
-        return None
+        return self.rc_sensor.first_ray("CritterMantaRay")
 
     async def _turn_away(self, critter_idx):
         """Turn 180° in direction opposite to critter"""
-        turn_direction = "tr" if critter_idx < 2 else "tl"
+        turn_direction = "tr" if self.rc_sensor.side_of(critter_idx) < 0 else "tl"
         
         print(f"[EvadeCritter]: Turning away from critter (180° {turn_direction})")
         await self.a_agent.send_message("action", f"{turn_direction},0.5")
@@ -0,0 +1,251 @@
+import asyncio
+import math
+import bisect
+from array import array
+
+# Optional NumPy, used to write the rays of a frame straight into the buffers. Without it they go through an array
+try:
+    import numpy as np # type: ignore
+except ImportError:
+    np = None
+
+
+class FrameHistory:
+    """
+    Ring buffer with the last 'capacity' sensor frames of an agent: time, pose, rotation, speed and rays.
+    The buffers have room for 2 * capacity frames and each frame is written once, after the previous one. When they
+    are full, the last capacity - 1 frames are moved to the beginning with one slice copy per buffer, so the last k
+    frames are always contiguous and the windows are memoryviews of the buffers (no copies, oldest frame first).
+    Appending a frame is O(1) amortized in the number of frames kept.
+        capacity: <int> Number of frames kept
+        num_rays: <int> Number of rays of the sensor
+        count: <int> Number of frames appended since the creation (the buffer keeps the last 'capacity' ones)
+    Fields: "time", "x", "y", "z" (position), "pitch", "yaw", "roll" (rotation) and "speed"
+    """
+    FIELDS = ("time", "x", "y", "z", "pitch", "yaw", "roll", "speed")
+
+    def __init__(self, capacity, num_rays):
+        self.capacity = capacity
+        self.num_rays = num_rays
+        self.count = 0
+        self.end = 0  # Position where the next frame is written, in [0, 2 * capacity]
+        self.fields = {name: array("d", bytes(8 * 2 * capacity)) for name in self.FIELDS}
+        self.field_list = [self.fields[name] for name in self.FIELDS]
+        self.distances = array("d", bytes(8 * 2 * capacity * num_rays))
+        self.hits = array("b", bytes(2 * capacity * num_rays))
+        if np is not None:
+            # Views [2 * capacity, num_rays] of the ray buffers, so a frame is written with one row assignment
+            self.distance_rows = np.frombuffer(self.distances, dtype=np.float64).reshape(2 * capacity, num_rays)
+            self.hit_rows = np.frombuffer(self.hits, dtype=np.int8).reshape(2 * capacity, num_rays)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, position, rotation, speed, hits, distances):
+        """
+        Adds a frame, overwriting the oldest one if the buffer is full.
+        :param timestamp: Time of the frame (time.monotonic())
+        :param position: Position of the agent (object with x, y and z attributes, see AAgent_BT.Vector3)
+        :param rotation: Rotation of the agent (x - pitch, y - yaw, z - roll)
+        :param speed: Speed of the agent
+        :param hits: Hit flag of each ray (num_rays values, see RayCastSensor.ray_buffers())
+        :param distances: Distance of each ray (num_rays values). NumPy arrays are copied without converting each
+                          value, lists are converted
+        """
+        if self.end == 2 * self.capacity:
+            self.compact()
+        i = self.end
+        for field, value in zip(self.field_list,
+                                (timestamp, position.x, position.y, position.z, rotation.x, rotation.y, rotation.z,
+                                 speed)):
+            field[i] = value
+        if np is not None:
+            self.distance_rows[i] = distances
+            self.hit_rows[i] = hits
+        else:
+            n = self.num_rays
+            self.distances[i * n:(i + 1) * n] = array("d", distances)
+            self.hits[i * n:(i + 1) * n] = array("b", hits)
+        self.end = i + 1
+        self.count += 1
+
+    def compact(self):
+        """
+        Moves the last capacity - 1 frames to the beginning of the buffers, making room for capacity + 1 frames.
+        """
+        k = self.capacity - 1
+        start = self.end - k
+        for field in self.field_list:
+            view = memoryview(field)
+            view[:k] = view[start:self.end]
+        n = self.num_rays
+        for buffer in (self.distances, self.hits):
+            view = memoryview(buffer)
+            view[:k * n] = view[start * n:self.end * n]
+        self.end = k
+
+    def _bounds(self, k):
+        """
+        :return: (start, end) of the last k frames in the buffers
+        """
+        k = min(k, len(self))
+        return self.end - k, self.end
+
+    def window(self, name, k=None):
+        """
+        :param name: Field (see FIELDS)
+        :param k: Number of frames (all the frames kept if None)
+        :return: memoryview with the values of the field in the last k frames, oldest first
+        """
+        start, end = self._bounds(len(self) if k is None else k)
+        return memoryview(self.fields[name])[start:end]
+
+    def ray_window(self, k=None):
+        """
+        :return: memoryview [k, num_rays] with the distances of the rays in the last k frames, oldest first
+        """
+        start, end = self._bounds(len(self) if k is None else k)
+        n = self.num_rays
+        return memoryview(self.distances)[start * n:end * n].cast("B").cast("d", (end - start, n))
+
+    def hit_window(self, k=None):
+        """
+        :return: memoryview [k, num_rays] with the hit flags of the rays in the last k frames, oldest first
+        """
+        start, end = self._bounds(len(self) if k is None else k)
+        n = self.num_rays
+        return memoryview(self.hits)[start * n:end * n].cast("B").cast("b", (end - start, n))
+
+    def frames_since(self, seconds, now=None):
+        """
+        :return: Number of frames received in the last 'seconds' (plus the one just before, so the window covers
+                 the whole interval if the history is long enough)
+        """
+        times = self.window("time")
+        if not len(times):
+            return 0
+        now = times[-1] if now is None else now
+        first = bisect.bisect_left(times, now - seconds)
+        return len(times) - max(first - 1, 0)
+
+    def covers(self, seconds):
+        """
+        :return: True if the frames kept span at least 'seconds'
+        """
+        times = self.window("time")
+        return len(times) > 1 and times[-1] - times[0] >= seconds
+
+    def displacement(self, k):
+        """
+        :return: Distance (x-z plane) between the oldest and the newest of the last k frames
+        """
+        xs = self.window("x", k)
+        zs = self.window("z", k)
+        if len(xs) < 2:
+            return 0.0
+        return math.hypot(xs[-1] - xs[0], zs[-1] - zs[0])
+
+    def velocity(self, k):
+        """
+        :return: (vx, vz) average velocity over the last k frames (units per second)
+        """
+        times = self.window("time", k)
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0, 0.0
+        xs = self.window("x", k)
+        zs = self.window("z", k)
+        elapsed = times[-1] - times[0]
+        return (xs[-1] - xs[0]) / elapsed, (zs[-1] - zs[0]) / elapsed
+
+    def is_stuck(self, seconds, min_distance=0.01):
+        """
+        :return: True if the frames kept span 'seconds' and the agent moved less than 'min_distance' in that time
+        """
+        if not self.covers(seconds):
+            return False
+        return self.displacement(self.frames_since(seconds)) < min_distance
+
+    def mean(self, name, k):
+        """
+        :return: Mean of the field 'name' over the last k frames (smoothing), 0.0 if there are no frames
+        """
+        values = self.window(name, k)
+        return sum(values) / len(values) if len(values) else 0.0
+
+
+class YawTracker:
+    """
+    Integrates the yaw of the agent frame by frame, so the turns can be measured without worrying about the wrap
+    around 0/360 degrees. Updated by the agent on every sensor frame.
+    Assumes the agent turns less than 180 degrees between two frames (the shortest way is taken).
+        yaw: <float> Last yaw received, in [0, 360)
+        heading: <float> Unwrapped yaw relative to the first frame (0 till then): grows when turning right ("tr")
+                 and decreases when turning left ("tl")
+        angular_velocity: <float> Degrees per second between the last two frames (positive turning right)
+        waiters: <list> (start heading, direction, degrees, future) of the coroutines waiting in turned()
+    """
+    def __init__(self):
+        self.yaw = None
+        self.heading = 0.0
+        self.angular_velocity = 0.0
+        self.last_time = None
+        self.waiters = []
+
+    def update(self, timestamp, yaw):
+        """
+        Integrates the yaw of a new frame and wakes up the turned() waiters that reached their angle.
+        The first frame only sets the reference yaw: the heading does not move, so the starts captured before it
+        stay valid.
+        """
+        if self.yaw is None:
+            self.yaw = yaw
+            self.last_time = timestamp
+            return
+        delta = (yaw - self.yaw + 180.0) % 360.0 - 180.0
+        self.heading += delta
+        if timestamp > self.last_time:
+            self.angular_velocity = delta / (timestamp - self.last_time)
+        self.yaw = yaw
+        self.last_time = timestamp
+        if self.waiters:
+            pending = []
+            for waiter in self.waiters:
+                start, direction, degrees, future = waiter
+                if future.done():
+                    continue  # Cancelled or timed out
+                turned = self.turned_since(start, direction)
+                if turned >= degrees:
+                    future.set_result(turned)
+                else:
+                    pending.append(waiter)
+            self.waiters = pending
+
+    def turned_since(self, start, direction=None):
+        """
+        :param start: Heading at the beginning of the turn
+        :param direction: "tl", "tr" or None (any direction)
+        :return: Degrees turned since 'start' in 'direction' (negative if the agent turned the other way)
+        """
+        turned = self.heading - start
+        if direction == "tl":
+            return -turned
+        if direction == "tr":
+            return turned
+        return abs(turned)
+
+    async def turned(self, degrees, direction=None, timeout=None):
+        """
+        Waits till the agent turns 'degrees' from its current heading, and returns on the frame where it happens.
+        :param degrees: Angle to turn (returns right away if it is <= 0)
+        :param direction: "tl", "tr" or None (any direction)
+        :param timeout: Maximum time to wait in seconds (None waits forever)
+        :return: Degrees turned, or None if the timeout expired
+        """
+        if degrees <= 0:
+            return 0.0
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((self.heading, direction, degrees, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
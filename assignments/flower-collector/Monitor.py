@@ -0,0 +1,312 @@
+import math
+import struct
+import asyncio
+
+# Binary snapshot of a sensor frame, sent to the monitor process
+#   Header: <version: uint32> <num_rays: uint16> <isRotatingRight> <isRotatingLeft> <movingForwards>
+#           <movingBackwards> <isFrozen> <onRoute> <nearbyContainerInventory> (bool) <speed: float32>
+#           <position x, y, z: float32> <rotation x, y, z: float32>
+#   Strings: currentNamedLoc, targetNamedLoc
+#   Rays (num_rays): <index: uint16> <hit: uint8> <has_info: bool> <distance: float32> + tag and name strings
+#   Inventories (myInventoryList, nearbyContainerInventoryList): <count: uint16> + count * (name string, amount: int32)
+#   Every string is <length: uint16> <utf-8 bytes>
+SNAPSHOT_HEADER = struct.Struct("<IH7?f3f3f")
+RAY = struct.Struct("<HB?f")
+COUNT = struct.Struct("<H")
+AMOUNT = struct.Struct("<i")
+
+# Time between two snapshots sent to the monitor process (seconds), the refresh period of AAgentInterface
+FEED_PERIOD = 0.1
+# Token the monitor process sends back when it is ready for the next snapshot
+READY = b"r"
+
+
+def pack_string(parts, text):
+    data = (text or "").encode()
+    parts.append(COUNT.pack(len(data)))
+    parts.append(data)
+
+
+def unpack_string(data, offset):
+    length, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    return data[offset:offset + length].decode(), offset + length
+
+
+def encode_snapshot(version, i_state_dict, sensor_info):
+    """
+    :return: Binary snapshot (bytes) of the frame, with the format described at the beginning of the module
+    """
+    position = i_state_dict["position"]
+    rotation = i_state_dict["rotation"]
+    parts = [SNAPSHOT_HEADER.pack(version, len(sensor_info),
+                                  bool(i_state_dict["isRotatingRight"]), bool(i_state_dict["isRotatingLeft"]),
+                                  bool(i_state_dict["movingForwards"]), bool(i_state_dict["movingBackwards"]),
+                                  bool(i_state_dict["isFrozen"]), bool(i_state_dict["onRoute"]),
+                                  bool(i_state_dict["nearbyContainerInventory"]), i_state_dict["speed"],
+                                  position["x"], position["y"], position["z"],
+                                  rotation["x"], rotation["y"], rotation["z"])]
+    pack_string(parts, i_state_dict["currentNamedLoc"])
+    pack_string(parts, i_state_dict["targetNamedLoc"])
+    for index, hit, info in sensor_info:
+        if info is None:
+            parts.append(RAY.pack(index, hit, False, -1.0))
+            pack_string(parts, "")
+            pack_string(parts, "")
+        else:
+            parts.append(RAY.pack(index, hit, True, info["distance"]))
+            pack_string(parts, info["tag"])
+            pack_string(parts, info["name"])
+    for key in ("myInventoryList", "nearbyContainerInventoryList"):
+        items = i_state_dict[key]
+        parts.append(COUNT.pack(len(items)))
+        for item in items:
+            pack_string(parts, item["name"])
+            parts.append(AMOUNT.pack(item["amount"]))
+    return b"".join(parts)
+
+
+def decode_snapshot(data):
+    """
+    :return: (version, i_state_dict, sensor_info) with the same format as the "sensor" messages (the floats keep
+             the precision of a float32)
+    """
+    (version, num_rays, rotating_right, rotating_left, moving_forwards, moving_backwards, frozen, on_route,
+     nearby_container, speed, px, py, pz, rx, ry, rz) = SNAPSHOT_HEADER.unpack_from(data, 0)
+    offset = SNAPSHOT_HEADER.size
+    current_loc, offset = unpack_string(data, offset)
+    target_loc, offset = unpack_string(data, offset)
+    sensor_info = []
+    for _ in range(num_rays):
+        index, hit, has_info, distance = RAY.unpack_from(data, offset)
+        offset += RAY.size
+        tag, offset = unpack_string(data, offset)
+        name, offset = unpack_string(data, offset)
+        sensor_info.append([index, hit, {"name": name, "tag": tag, "distance": distance} if has_info else None])
+    inventories = []
+    for _ in range(2):
+        count, = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        items = []
+        for _ in range(count):
+            name, offset = unpack_string(data, offset)
+            amount, = AMOUNT.unpack_from(data, offset)
+            offset += AMOUNT.size
+            items.append({"name": name, "amount": amount})
+        inventories.append(items)
+    i_state_dict = {
+        "isRotatingRight": rotating_right, "isRotatingLeft": rotating_left,
+        "movingForwards": moving_forwards, "movingBackwards": moving_backwards,
+        "isFrozen": frozen, "speed": speed,
+        "position": {"x": px, "y": py, "z": pz}, "rotation": {"x": rx, "y": ry, "z": rz},
+        "currentNamedLoc": current_loc, "onRoute": on_route, "targetNamedLoc": target_loc,
+        "myInventoryList": inventories[0],
+        "nearbyContainerInventory": nearby_container, "nearbyContainerInventoryList": inventories[1]
+    }
+    return version, i_state_dict, sensor_info
+
+
+async def feed_monitor(snapshot, conn, exit_event):
+    """
+    Sends the frames published in 'snapshot' (AAgent_BT.GuiSnapshot) to the monitor process through the pipe
+    'conn', every FEED_PERIOD seconds at most. A new snapshot is only sent when the monitor has sent READY for the
+    previous one, so the pipe never holds more than one snapshot and sending never waits for the monitor.
+    """
+    ready = True
+    version = None
+    try:
+        while not exit_event.is_set():
+            while conn.poll():
+                conn.recv_bytes()  # READY
+                ready = True
+            frame = snapshot.latest()
+            if ready and frame is not None and frame[0] != version:
+                version = frame[0]
+                conn.send_bytes(encode_snapshot(*frame))
+                ready = False
+            await asyncio.sleep(FEED_PERIOD)
+    except (EOFError, OSError):
+        print("The monitor process was closed")
+    finally:
+        conn.close()
+
+
+def run_monitor_process(aa_name, conn):
+    """
+    Entry point of the monitor process: shows the snapshots received through the pipe 'conn' in an
+    AAgentInterface, and finishes when the agent closes the pipe.
+    """
+    import AAgent_BT
+
+    class ProcessInterface(AAgent_BT.AAgentInterface):
+        def update_values(self):
+            try:
+                data = None
+                while conn.poll():
+                    data = conn.recv_bytes()
+                if data is not None:
+                    AAgent_BT.gui_blackboard.publish(*decode_snapshot(data))
+                    conn.send_bytes(READY)
+            except (EOFError, OSError):
+                self.gui_root.quit()
+                return
+            super(ProcessInterface, self).update_values()
+
+    app = ProcessInterface(aa_name)
+    app.start()
+
+
+# Rows of the pack monitor, sent to the monitor process
+#   <count: uint16> + count * (agent, task and branch strings, <x, z, yaw, frames/s, actions/s: float32>)
+PACK_ROW = struct.Struct("<5f")
+
+# Each agent is sampled once every PACK_SAMPLE_PERIOD seconds, a slice of the agents every PACK_SAMPLE_STEP seconds,
+# and the table is sent to the monitor process at most once every PACK_RENDER_PERIOD seconds
+PACK_SAMPLE_PERIOD = 1.0
+PACK_SAMPLE_STEP = 0.1
+PACK_RENDER_PERIOD = 1.0
+PACK_COLUMNS = ("Agent", "Task", "BT branch", "x", "z", "Yaw", "Frames/s", "Actions/s")
+
+
+def agent_task(agent):
+    """
+    :return: (task, branch) of the agent: "bt:<name>" or "goal:<name>" and, with a behaviour tree, the running
+             branch as "<parent>/<node>"
+    """
+    if agent.currentBT:
+        bt = agent.bts.get(agent.currentBT)
+        tip = bt.behaviour_tree.tip() if bt else None
+        if tip is None:
+            return "bt:" + agent.currentBT, ""
+        parent = tip.parent.name + "/" if tip.parent else ""
+        return "bt:" + agent.currentBT, parent + tip.name
+    if agent.currentGoal:
+        return "goal:" + agent.currentGoal, ""
+    return "", ""
+
+
+class PackSampler:
+    """
+    Samples the agents of a Spawner run for the pack monitor. Each call to step() samples the next slice of agents,
+    so the cost per step is bounded whatever the number of agents.
+        rows: <list> Last row of each agent: (agent, task, branch, x, z, yaw, frames/s, actions/s)
+    """
+    def __init__(self, agents):
+        self.agents = agents
+        self.names = [f"{agent.AgentParameters.get('name', 'AAgent')}-{i}" for i, agent in enumerate(agents)]
+        self.rows = [(name, "", "", 0.0, 0.0, 0.0, 0.0, 0.0) for name in self.names]
+        # (time, frames applied, actions sent) of the last sample of each agent
+        self.last = [None] * len(agents)
+        self.next_agent = 0
+        self.batch = max(1, math.ceil(len(agents) * PACK_SAMPLE_STEP / PACK_SAMPLE_PERIOD))
+
+    def step(self, now):
+        for _ in range(min(self.batch, len(self.agents))):
+            i = self.next_agent
+            self.next_agent = (i + 1) % len(self.agents)
+            agent = self.agents[i]
+            frame_rate = action_rate = 0.0
+            last = self.last[i]
+            if last is not None and now > last[0]:
+                frame_rate = (agent.frames_applied - last[1]) / (now - last[0])
+                action_rate = (agent.actions_sent - last[2]) / (now - last[0])
+            self.last[i] = (now, agent.frames_applied, agent.actions_sent)
+            task, branch = agent_task(agent)
+            position = agent.i_state.position
+            self.rows[i] = (self.names[i], task, branch, position.x, position.z, agent.i_state.rotation.y,
+                            frame_rate, action_rate)
+
+
+def encode_rows(rows):
+    parts = [COUNT.pack(len(rows))]
+    for name, task, branch, *values in rows:
+        pack_string(parts, name)
+        pack_string(parts, task)
+        pack_string(parts, branch)
+        parts.append(PACK_ROW.pack(*values))
+    return b"".join(parts)
+
+
+def decode_rows(data):
+    count, = COUNT.unpack_from(data, 0)
+    offset = COUNT.size
+    rows = []
+    for _ in range(count):
+        name, offset = unpack_string(data, offset)
+        task, offset = unpack_string(data, offset)
+        branch, offset = unpack_string(data, offset)
+        rows.append((name, task, branch) + PACK_ROW.unpack_from(data, offset))
+        offset += PACK_ROW.size
+    return rows
+
+
+async def feed_pack_monitor(agents, conn):
+    """
+    Samples 'agents' with a PackSampler and sends the table to the pack monitor process through the pipe 'conn',
+    with the same READY flow control as feed_monitor(). Runs till it is cancelled or the monitor is closed.
+    """
+    loop = asyncio.get_running_loop()
+    sampler = PackSampler(agents)
+    ready = True
+    next_render = 0.0
+    try:
+        while True:
+            now = loop.time()
+            sampler.step(now)
+            while conn.poll():
+                conn.recv_bytes()  # READY
+                ready = True
+            if ready and now >= next_render:
+                conn.send_bytes(encode_rows(sampler.rows))
+                ready = False
+                next_render = now + PACK_RENDER_PERIOD
+            await asyncio.sleep(PACK_SAMPLE_STEP)
+    except (EOFError, OSError):
+        print("The pack monitor was closed")
+    finally:
+        conn.close()
+
+
+def run_pack_monitor_process(title, conn):
+    """
+    Entry point of the pack monitor process: a table with one row per agent, updated with the rows received through
+    the pipe 'conn'. Only the cells that changed are updated. Finishes when the spawner closes the pipe.
+    """
+    import tkinter as tk
+    from tkinter import ttk
+
+    root = tk.Tk()
+    root.title(title)
+    root.geometry("1000x600")
+    table = ttk.Treeview(root, columns=PACK_COLUMNS, show="headings")
+    for column in PACK_COLUMNS:
+        table.heading(column, text=column)
+        table.column(column, width=220 if column == "BT branch" else 90, anchor="w")
+    scrollbar = ttk.Scrollbar(root, orient="vertical", command=table.yview)
+    table.configure(yscrollcommand=scrollbar.set)
+    scrollbar.pack(side="right", fill="y")
+    table.pack(expand=True, fill="both")
+    shown = {}  # Row id -> values on screen
+
+    def update_table():
+        try:
+            data = None
+            while conn.poll():
+                data = conn.recv_bytes()
+        except (EOFError, OSError):
+            root.quit()
+            return
+        if data is not None:
+            for row in decode_rows(data):
+                values = row[:3] + tuple(f"{value:.1f}" for value in row[3:])
+                iid = row[0]
+                if iid not in shown:
+                    table.insert("", "end", iid=iid, values=values)
+                elif shown[iid] != values:
+                    table.item(iid, values=values)
+                shown[iid] = values
+            conn.send_bytes(READY)
+        root.after(int(PACK_SAMPLE_STEP * 1000), update_table)
+
+    update_table()
+    root.mainloop()
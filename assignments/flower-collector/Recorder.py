@@ -0,0 +1,139 @@
+import sys
+import time
+import bisect
+import struct
+import asyncio
+
+# Binary session log
+#   Header: MAGIC
+#   Records: <direction: uint8> <timestamp: float64> <length: uint32> <message: utf-8 bytes>
+#       direction -> INBOUND (Unity -> agent) or OUTBOUND (agent -> Unity)
+#       timestamp -> time.monotonic() when the message was received or sent
+MAGIC = b"AAREC1\n"
+RECORD_HEADER = struct.Struct("<BdI")
+INBOUND = 0
+OUTBOUND = 1
+
+
+class SessionRecorder:
+    """
+    Appends every message exchanged with Unity to a binary session log.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.records = 0
+
+    def record(self, direction, msg_data):
+        data = msg_data.encode() if isinstance(msg_data, str) else msg_data
+        self.file.write(RECORD_HEADER.pack(direction, time.monotonic(), len(data)))
+        self.file.write(data)
+        self.records += 1
+
+    def record_inbound(self, msg_data):
+        self.record(INBOUND, msg_data)
+
+    def record_outbound(self, msg_data):
+        self.record(OUTBOUND, msg_data)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_session(path):
+    """
+    Reads a session log.
+    :return: Generator of (direction, timestamp, message) tuples, in the order they were recorded
+    """
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a session log: {path}")
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            direction, timestamp, length = RECORD_HEADER.unpack(header)
+            data = file.read(length)
+            if len(data) < length:
+                return  # Last record truncated (the agent was killed while writing it)
+            yield direction, timestamp, data.decode()
+
+
+class ReplaySocket:
+    """
+    Stand-in for the websocket while replaying. Keeps the messages the agent sends and when it sent them.
+    """
+    def __init__(self):
+        self.closed = False
+        self.sent = []
+
+    async def send_str(self, msg_data):
+        self.sent.append((time.perf_counter(), msg_data))
+
+    async def close(self):
+        self.closed = True
+
+
+async def replay(config_file, session_file, real_time=True):
+    """
+    Feeds the inbound messages of a recorded session into a new agent, using process_incoming_message() and
+    running its main loop as usual, and measures how fast it decides.
+    :param config_file: Agent configuration file (the BT to run comes from the recorded agent_control messages)
+    :param session_file: Session log written by SessionRecorder
+    :param real_time: If True, keeps the original timing between messages. Otherwise, goes as fast as possible
+    :return: Dictionary with the statistics of the replay
+    """
+    from AAgent_BT import AAgent
+
+    agent = AAgent(config_file)
+    agent.ws = ReplaySocket()
+    writer_task = asyncio.create_task(agent.send_actions())
+    main_task = asyncio.create_task(agent.main_loop())
+
+    inbound = [(timestamp, msg) for direction, timestamp, msg in read_session(session_file) if direction == INBOUND]
+    first_timestamp = inbound[0][0] if inbound else 0.0
+    fed_times = []
+    start = time.perf_counter()
+    for timestamp, msg in inbound:
+        if real_time:
+            await asyncio.sleep(max(0.0, (timestamp - first_timestamp) - (time.perf_counter() - start)))
+        fed_times.append(time.perf_counter())
+        agent.process_incoming_message(msg)
+        # Give the agent one iteration of the event loop to react, plus one more for the writer task
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+
+    agent.exit_event.set()
+    await asyncio.gather(writer_task, main_task, return_exceptions=True)
+
+    # Decision latency: time from the last message fed to the agent to each action it sent
+    latencies = []
+    for sent_at, _ in agent.ws.sent:
+        i = bisect.bisect_right(fed_times, sent_at)
+        if i > 0:
+            latencies.append(sent_at - fed_times[i - 1])
+    latencies.sort()
+    return {
+        "messages": len(inbound),
+        "frames": agent.frame_count,
+        "actions": len(agent.ws.sent),
+        "elapsed": elapsed,
+        "messages_per_second": len(inbound) / elapsed if elapsed > 0 else 0.0,
+        "mean_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p95_latency": latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python Recorder.py <agent_config.json> <session_log> [--max-speed]")
+    else:
+        stats = asyncio.run(replay(sys.argv[1], sys.argv[2], "--max-speed" not in sys.argv))
+        print(f"Messages: {stats['messages']} ({stats['messages_per_second']:.0f}/s)  "
+              f"Frames: {stats['frames']}  Actions: {stats['actions']}")
+        print(f"Decision latency: mean {stats['mean_latency'] * 1000:.3f} ms, "
+              f"p95 {stats['p95_latency'] * 1000:.3f} ms")
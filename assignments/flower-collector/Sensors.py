@@ -1,3 +1,10 @@
+# Optional NumPy, used by ArrayRayCastSensor. If it is not installed, the plain RayCastSensor is used
+try:
+    import numpy as np # type: ignore
+except ImportError:
+    np = None
+
+
 class RayCastSensor:
     HIT = 0
     DISTANCE = 1
@@ -34,8 +41,14 @@ class RayCastSensor:
                             [-1 for _ in range(self.num_rays)],
                             [None for _ in range(self.num_rays)],
                             [0.0 for _ in range(self.num_rays)]]
+        # Per-frame index of the objects seen, rebuilt by set_perception()
+        # tag_rays -> {tag: [ray indices hitting an object with that tag, from left to right]}
+        # tag_nearest -> {tag: (ray index, distance) of the nearest hit with that tag}
+        self.tag_rays = {}
+        self.tag_nearest = {}
         # Fill the angles of each ray
         angle_between_rays = self.max_ray_degrees / self.rays_per_direction
+        self.angle_between_rays = angle_between_rays
         # Left side rays (negative angles)
         for r in range(self.rays_per_direction):
             self.sensor_rays[RayCastSensor.ANGLE][r] = -((self.rays_per_direction - r) * angle_between_rays)
@@ -44,6 +57,11 @@ class RayCastSensor:
         # Right side rays (positive angles)
         for r in range(self.rays_per_direction+1, (self.rays_per_direction * 2)+1):
             self.sensor_rays[RayCastSensor.ANGLE][r] = ((r - self.rays_per_direction) * angle_between_rays)
+        # Rays on each side, from the angle table (left rays come first)
+        angles = self.sensor_rays[RayCastSensor.ANGLE]
+        self.center_ray = angles.index(0.0)
+        self.left_rays = slice(0, sum(1 for angle in angles if angle < 0))
+        self.right_rays = slice(self.num_rays - sum(1 for angle in angles if angle > 0), self.num_rays)
 
     def set_perception(self, perception):
         """
@@ -62,3 +80,261 @@ class RayCastSensor:
             else:
                 self.sensor_rays[RayCastSensor.DISTANCE][p[0]] = p[2]["distance"]
             self.sensor_rays[RayCastSensor.OBJECT_INFO][p[0]] = p[2]
+        self.build_index()
+
+    def build_index(self):
+        """
+        Rebuilds the index of tagged objects from the current sensor rays, so the queries below are O(1).
+        """
+        tag_rays = {}
+        tag_nearest = {}
+        for i, obj in enumerate(self.sensor_rays[RayCastSensor.OBJECT_INFO]):
+            if obj:
+                tag = obj["tag"]
+                distance = obj["distance"]
+                rays = tag_rays.get(tag)
+                if rays is None:
+                    tag_rays[tag] = [i]
+                    tag_nearest[tag] = (i, distance)
+                else:
+                    rays.append(i)
+                    if distance < tag_nearest[tag][1]:
+                        tag_nearest[tag] = (i, distance)
+        self.tag_rays = tag_rays
+        self.tag_nearest = tag_nearest
+
+    def sees(self, tag):
+        """
+        :return: True if any ray is hitting an object with the tag 'tag'
+        """
+        return tag in self.tag_rays
+
+    def rays_with(self, tag):
+        """
+        :return: Indices of the rays hitting an object with the tag 'tag', from left to right
+        """
+        return self.tag_rays.get(tag, ())
+
+    def first_ray(self, tag):
+        """
+        :return: Index of the leftmost ray hitting an object with the tag 'tag', None if there is none
+        """
+        rays = self.tag_rays.get(tag)
+        return rays[0] if rays else None
+
+    def nearest_hit(self, tag):
+        """
+        :return: (ray index, distance) of the nearest object with the tag 'tag', None if there is none
+        """
+        return self.tag_nearest.get(tag)
+
+    def bearing(self, tag):
+        """
+        :return: Angle (degrees, negative on the left) of the ray hitting the nearest object with the tag 'tag',
+                 None if there is none
+        """
+        nearest = self.tag_nearest.get(tag)
+        if nearest is None:
+            return None
+        return self.sensor_rays[RayCastSensor.ANGLE][nearest[0]]
+
+    def side_of(self, ray):
+        """
+        :return: -1 if the ray 'ray' is on the left, 1 if it is on the right, 0 if it is the center ray
+        """
+        angle = self.sensor_rays[RayCastSensor.ANGLE][ray]
+        return -1 if angle < 0 else (1 if angle > 0 else 0)
+
+    def is_centered(self, ray, tolerance=0.0):
+        """
+        :return: True if the ray 'ray' is at most 'tolerance' degrees from the center
+        """
+        return abs(self.sensor_rays[RayCastSensor.ANGLE][ray]) <= tolerance
+
+    def turn_towards(self, ray):
+        """
+        :return: Rotation action ("tl" or "tr") that brings the ray 'ray' to the center, None if it is centered
+        """
+        side = self.side_of(ray)
+        return "tl" if side < 0 else ("tr" if side > 0 else None)
+
+    def ray_buffers(self):
+        """
+        :return: (hits, distances) of the rays in the form that is cheapest to copy (see History.FrameHistory)
+        """
+        return self.sensor_rays[RayCastSensor.HIT], self.sensor_rays[RayCastSensor.DISTANCE]
+
+    def any_hit(self):
+        """
+        :return: True if any ray is hitting something
+        """
+        return any(self.sensor_rays[RayCastSensor.HIT])
+
+    def hits_on_left(self):
+        """
+        :return: True if any ray on the left is hitting something
+        """
+        return any(self.sensor_rays[RayCastSensor.HIT][self.left_rays])
+
+    def hits_on_right(self):
+        """
+        :return: True if any ray on the right is hitting something
+        """
+        return any(self.sensor_rays[RayCastSensor.HIT][self.right_rays])
+
+    def bearings(self):
+        """
+        :return: {tag: angle of the ray hitting the nearest object with that tag} for every tag in sight
+        """
+        angles = self.sensor_rays[RayCastSensor.ANGLE]
+        return {tag: angles[nearest[0]] for tag, nearest in self.tag_nearest.items()}
+
+    def min_distance_in_sector(self, min_angle, max_angle):
+        """
+        :return: Distance to the nearest hit of the rays with min_angle <= angle <= max_angle (degrees), None if
+                 none of them is hitting anything
+        """
+        min_distance = None
+        for hit, distance, angle in zip(self.sensor_rays[RayCastSensor.HIT], self.sensor_rays[RayCastSensor.DISTANCE],
+                                        self.sensor_rays[RayCastSensor.ANGLE]):
+            if hit and min_angle <= angle <= max_angle and (min_distance is None or distance < min_distance):
+                min_distance = distance
+        return min_distance
+
+    def count_hits_closer_than(self, threshold, min_angle=-180.0, max_angle=180.0):
+        """
+        :return: Number of rays with min_angle <= angle <= max_angle hitting something closer than 'threshold'
+        """
+        count = 0
+        for hit, distance, angle in zip(self.sensor_rays[RayCastSensor.HIT], self.sensor_rays[RayCastSensor.DISTANCE],
+                                        self.sensor_rays[RayCastSensor.ANGLE]):
+            if hit and distance < threshold and min_angle <= angle <= max_angle:
+                count += 1
+        return count
+
+
+class ArrayRayCastSensor(RayCastSensor):
+    """
+    RayCastSensor that also keeps the rays in contiguous NumPy arrays, so the queries are vectorized. Useful with
+    high-resolution sensors (tens or hundreds of rays per side). 'sensor_rays' is still filled, so the code that
+    reads the plain lists keeps working.
+        hit: <np.ndarray bool> Hit ON/OFF of each ray
+        distance: <np.ndarray float32> Distance to the target of each ray (-1 if no hit)
+        angle: <np.ndarray float32> Degrees from the center of each ray (precomputed)
+        tag_code: <np.ndarray int16> Code of the tag of the object hit by each ray (0 if no hit), see TAG_CODES
+    """
+    # Integer codes of the tags (shared by all the sensors). Code 0 means no hit
+    TAG_CODES = {}
+    TAG_NAMES = [None]
+
+    def __init__(self, ray_perception_config):
+        if np is None:
+            raise ImportError("ArrayRayCastSensor needs NumPy")
+        super(ArrayRayCastSensor, self).__init__(ray_perception_config)
+        self.hit = np.zeros(self.num_rays, dtype=bool)
+        self.distance = np.full(self.num_rays, -1.0, dtype=np.float32)
+        self.angle = np.array(self.sensor_rays[RayCastSensor.ANGLE], dtype=np.float32)
+        self.tag_code = np.zeros(self.num_rays, dtype=np.int16)
+        self.all_rays = tuple(range(self.num_rays))
+        # Masks of the angular sectors already queried: (min_angle, max_angle) -> bool array
+        self.sector_masks = {}
+
+    @classmethod
+    def code_of(cls, tag):
+        """
+        :return: Integer code of 'tag', assigning a new one the first time the tag is seen
+        """
+        code = cls.TAG_CODES.get(tag)
+        if code is None:
+            code = len(cls.TAG_NAMES)
+            cls.TAG_CODES[tag] = code
+            cls.TAG_NAMES.append(tag)
+        return code
+
+    def set_perception(self, perception):
+        if not perception:
+            return
+        ray_indices, hits, infos = zip(*perception)
+        tag_codes = self.TAG_CODES
+        distances = [-1 if info is None else info["distance"] for info in infos]
+        codes = [0 if info is None else (tag_codes.get(info["tag"]) or self.code_of(info["tag"])) for info in infos]
+
+        if len(ray_indices) == self.num_rays and ray_indices == self.all_rays:
+            # Usual case: all the rays, in order
+            self.distance[:] = distances
+            self.tag_code[:] = codes
+            self.sensor_rays[RayCastSensor.HIT][:] = hits
+            self.sensor_rays[RayCastSensor.DISTANCE][:] = distances
+            self.sensor_rays[RayCastSensor.OBJECT_INFO][:] = infos
+        else:
+            ray_indices = list(ray_indices)
+            self.distance[ray_indices] = distances
+            self.tag_code[ray_indices] = codes
+            for i, hit, distance, info in zip(ray_indices, hits, distances, infos):
+                self.sensor_rays[RayCastSensor.HIT][i] = hit
+                self.sensor_rays[RayCastSensor.DISTANCE][i] = distance
+                self.sensor_rays[RayCastSensor.OBJECT_INFO][i] = info
+        # A ray hits something iff it has object information
+        np.greater(self.tag_code, 0, out=self.hit)
+        self.build_index()
+
+    def build_index(self):
+        tag_rays = {}
+        tag_nearest = {}
+        distances = self.sensor_rays[RayCastSensor.DISTANCE]
+        codes = self.tag_code
+        present = np.flatnonzero(np.bincount(codes, minlength=len(self.TAG_NAMES))[1:]) + 1
+        for code in present.tolist():
+            rays = np.flatnonzero(codes == code)
+            nearest = int(rays[self.distance[rays].argmin()])
+            tag = self.TAG_NAMES[code]
+            tag_rays[tag] = rays.tolist()
+            tag_nearest[tag] = (nearest, distances[nearest])
+        self.tag_rays = tag_rays
+        self.tag_nearest = tag_nearest
+
+    def ray_buffers(self):
+        return self.hit, self.distance
+
+    def any_hit(self):
+        return bool(self.hit.any())
+
+    def hits_on_left(self):
+        return bool(self.hit[self.left_rays].any())
+
+    def hits_on_right(self):
+        return bool(self.hit[self.right_rays].any())
+
+    def sector_mask(self, min_angle, max_angle):
+        """
+        :return: Boolean array selecting the rays with min_angle <= angle <= max_angle
+        """
+        key = (min_angle, max_angle)
+        mask = self.sector_masks.get(key)
+        if mask is None:
+            mask = (self.angle >= min_angle) & (self.angle <= max_angle)
+            self.sector_masks[key] = mask
+        return mask
+
+    def min_distance_in_sector(self, min_angle, max_angle):
+        rays = np.flatnonzero(self.hit & self.sector_mask(min_angle, max_angle))
+        if not len(rays):
+            return None
+        return self.sensor_rays[RayCastSensor.DISTANCE][int(rays[np.argmin(self.distance[rays])])]
+
+    def count_hits_closer_than(self, threshold, min_angle=-180.0, max_angle=180.0):
+        selected = self.hit & (self.distance < threshold) & self.sector_mask(min_angle, max_angle)
+        return int(np.count_nonzero(selected))
+
+
+def create_ray_sensor(ray_perception_config, arrays=False):
+    """
+    :param ray_perception_config: See RayCastSensor
+    :param arrays: Use the NumPy-backed ArrayRayCastSensor (falls back to RayCastSensor if NumPy is not installed)
+    :return: The ray sensor of an agent
+    """
+    if arrays and np is not None:
+        return ArrayRayCastSensor(ray_perception_config)
+    if arrays:
+        print("NumPy is not installed, using the plain RayCastSensor")
+    return RayCastSensor(ray_perception_config)
@@ -0,0 +1,468 @@
+import sys
+import math
+import json
+import time
+import random
+import asyncio
+import aiohttp # type: ignore
+from aiohttp import web # type: ignore
+import Codec
+
+# ================================
+# Default world configuration
+# ================================
+DEFAULT_WORLD = {
+    "Server": {
+        "host": "127.0.0.1",
+        "port": 4649
+    },
+    "seed": 1,                  # Seed of the random generator, so every run builds the same world
+    "frame_rate": 20,           # Sensor frames per second sent to every agent
+    "size": [80, 80],           # Width (x) and depth (z) of the world, centered at (0, 0)
+    "base": {"name": "Base", "x": 0, "z": 0, "radius": 3},
+    "obstacles": [],            # Fixed obstacles: [{"x": <float>, "z": <float>, "radius": <float>}, ...]
+    "num_obstacles": 25,        # Extra obstacles placed at random positions
+    "num_flowers": 40,          # Flowers in the world. A collected flower is replaced by a new one
+    "num_critters": 0,          # Scripted critters that roam and freeze astronauts (not connected agents)
+    "agent_radius": 0.5,
+    "move_speed": 3.0,          # m/s
+    "turn_speed": 100.0,        # degrees/s
+    "collect_distance": 1.0,    # Max distance between the agent and a flower to collect it
+    "auto_collect": True,       # Astronauts collect the flowers they touch, without a "collect" action
+    "frozen_time": 3.0,         # Seconds an astronaut stays frozen after being touched by a critter
+    "send_start": True          # Send "start" right after "connection_ready"
+}
+
+# Tags reported by the ray sensors
+TAG_OBSTACLE = "Rock"
+TAG_WALL = "Wall"
+TAG_FLOWER = "AlienFlower"
+TAG_ASTRONAUT = "Astronaut"
+TAG_CRITTER = "CritterMantaRay"
+
+# Tag of the bodies of each agent type
+AGENT_TYPE_TAGS = {
+    "AAgentAstronaut": TAG_ASTRONAUT,
+    "AAgentCritterMantaRay": TAG_CRITTER
+}
+
+
+class Body:
+    """
+    Circle in the 2D world (plane x-z). Used for obstacles, flowers and agents.
+        yaw: <float> Rotation around y in degrees. 0 looks towards +z, positive angles turn right
+    """
+    def __init__(self, name, tag, x, z, radius, yaw=0.0):
+        self.name = name
+        self.tag = tag
+        self.x = x
+        self.z = z
+        self.radius = radius
+        self.yaw = yaw
+
+
+class AgentBody(Body):
+    """
+    Body of an agent with the state the simulator reports in the "sensor" messages.
+    """
+    def __init__(self, name, tag, x, z, radius, yaw, ray_config):
+        super().__init__(name, tag, x, z, radius, yaw)
+        self.ws = None
+        # Ray perception: [rays_per_direction, max_ray_degrees, sphere_cast_radius, ray_length]
+        rays_per_direction, max_ray_degrees, sphere_cast_radius, ray_length = ray_config
+        self.sphere_cast_radius = sphere_cast_radius
+        self.ray_length = ray_length
+        num_rays = rays_per_direction * 2 + 1
+        if rays_per_direction > 0:
+            step = max_ray_degrees / rays_per_direction
+            self.ray_angles = [(i - rays_per_direction) * step for i in range(num_rays)]
+        else:
+            self.ray_angles = [0.0]
+        # Movement. move: 1 forwards, -1 backwards, 0 stopped. turn: >0 right, <0 left (the value scales turn_speed)
+        self.move = 0
+        self.turn = 0.0
+        self.speed = 0.0
+        self.route_target = None
+        self.target_name = ""
+        self.frozen_until = 0.0
+        self.inventory = {}
+
+    def inventory_list(self):
+        return [{"name": name, "amount": amount} for name, amount in self.inventory.items() if amount > 0]
+
+
+class World:
+    """
+    Headless stand-in for the Unity simulation. Moves the agents using simple 2D kinematics, casts their rays
+    against the other bodies and applies the actions received from them.
+    """
+    def __init__(self, config):
+        self.config = dict(DEFAULT_WORLD)
+        self.config.update(config)
+        self.random = random.Random(self.config["seed"])
+        self.half_x = self.config["size"][0] / 2
+        self.half_z = self.config["size"][1] / 2
+        self.base = dict(self.config["base"])
+        self.base_inventory = {}
+        self.time = 0.0
+        self.frame = 0
+
+        self.obstacles = []
+        self.obstacles.extend(Body(f"Rock{i}", TAG_OBSTACLE, o["x"], o["z"], o["radius"])
+                              for i, o in enumerate(self.config["obstacles"]))
+        for i in range(self.config["num_obstacles"]):
+            x, z = self.free_position(1.5)
+            self.obstacles.append(Body(f"Rock{len(self.obstacles)}", TAG_OBSTACLE, x, z,
+                                       self.random.uniform(0.5, 1.5)))
+        self.flowers = []
+        self.num_flowers_created = 0
+        for _ in range(self.config["num_flowers"]):
+            self.add_flower()
+        self.agents = []
+        self.critters = []
+        for i in range(self.config["num_critters"]):
+            x, z = self.free_position(self.config["agent_radius"])
+            critter = AgentBody(f"SimCritter{i}", TAG_CRITTER, x, z, self.config["agent_radius"],
+                                self.random.uniform(0, 360), [0, 0, 0, 0])
+            critter.move = 1
+            self.critters.append(critter)
+
+        # Spatial hash used to find the bodies that can be hit by the rays of an agent
+        self.cell_size = 10.0
+        self.grid = {}
+
+    # ---------------------------------------------------------------- World building
+    def free_position(self, radius):
+        """
+        :return: Random position (x, z) that doesn't overlap the base or the obstacles
+        """
+        while True:
+            x = self.random.uniform(-self.half_x + radius, self.half_x - radius)
+            z = self.random.uniform(-self.half_z + radius, self.half_z - radius)
+            if math.hypot(x - self.base["x"], z - self.base["z"]) < self.base["radius"] + radius + 1:
+                continue
+            if any(math.hypot(x - o.x, z - o.z) < o.radius + radius for o in self.obstacles):
+                continue
+            return x, z
+
+    def add_flower(self):
+        x, z = self.free_position(0.3)
+        self.flowers.append(Body(f"AlienFlower{self.num_flowers_created}", TAG_FLOWER, x, z, 0.3))
+        self.num_flowers_created += 1
+
+    def add_agent(self, agent_params):
+        """
+        Creates the body of a new agent using its initial parameters.
+        :param agent_params: Dictionary "AgentParameters" of the agent configuration file
+        """
+        tag = AGENT_TYPE_TAGS.get(agent_params.get("type"), agent_params.get("type", "Agent"))
+        name = f"{agent_params.get('name', 'Agent')}{len(self.agents)}"
+        x, z = self.free_position(self.config["agent_radius"])
+        agent = AgentBody(name, tag, x, z, self.config["agent_radius"], self.random.uniform(0, 360),
+                          agent_params.get("ray_perception_sensor_param", [2, 45, 0, 10]))
+        self.agents.append(agent)
+        return agent
+
+    def remove_agent(self, agent):
+        if agent in self.agents:
+            self.agents.remove(agent)
+
+    # ---------------------------------------------------------------- Actions
+    def apply_action(self, agent, action):
+        """
+        Applies one action received from an agent.
+        :param action: mf | mb | stop | ntm | tl | tr | nt | "tl,<speed>" | "tr,<speed>" | "walk_to,<location>" |
+                       "collect:<item>" | "leave,<item>,<amount>"
+        """
+        if action.startswith("collect:"):
+            self.collect(agent, action.split(":", 1)[1])
+            return
+        parts = action.split(",")
+        command = parts[0]
+        if command == "mf":
+            agent.move = 1
+            agent.route_target = None
+        elif command == "mb":
+            agent.move = -1
+            agent.route_target = None
+        elif command in ("stop", "ntm"):
+            agent.move = 0
+            agent.route_target = None
+        elif command in ("tl", "tr"):
+            factor = float(parts[1]) if len(parts) > 1 else 1.0
+            agent.turn = -factor if command == "tl" else factor
+        elif command == "nt":
+            agent.turn = 0.0
+        elif command == "walk_to" and len(parts) > 1:
+            if parts[1] == self.base["name"]:
+                agent.route_target = (self.base["x"], self.base["z"])
+                agent.target_name = parts[1]
+                agent.move = 0
+            else:
+                print(f"[Simulator]: Unknown location: {parts[1]}")
+        elif command == "leave" and len(parts) > 2:
+            if self.named_location(agent) == self.base["name"]:
+                amount = min(int(parts[2]), agent.inventory.get(parts[1], 0))
+                agent.inventory[parts[1]] = agent.inventory.get(parts[1], 0) - amount
+                self.base_inventory[parts[1]] = self.base_inventory.get(parts[1], 0) + amount
+        else:
+            print(f"[Simulator]: Unknown action: {action}")
+
+    def collect(self, agent, item):
+        """
+        Collects the nearest flower within reach of the agent.
+        """
+        if item != TAG_FLOWER:
+            return
+        for flower in self.flowers:
+            if math.hypot(flower.x - agent.x, flower.z - agent.z) <= agent.radius + flower.radius + \
+                    self.config["collect_distance"]:
+                self.flowers.remove(flower)
+                self.add_flower()
+                agent.inventory[TAG_FLOWER] = agent.inventory.get(TAG_FLOWER, 0) + 1
+                return
+
+    # ---------------------------------------------------------------- Simulation step
+    def step(self, dt):
+        """
+        Advances the simulation 'dt' seconds.
+        """
+        self.time += dt
+        self.frame += 1
+        for critter in self.critters:
+            if self.random.random() < dt * 0.5:
+                critter.turn = self.random.choice([-1.0, 0.0, 1.0])
+        for agent in self.agents + self.critters:
+            self.move_agent(agent, dt)
+        self.check_contacts()
+        self.build_grid()
+
+    def move_agent(self, agent, dt):
+        if agent.frozen_until > self.time:
+            agent.speed = 0.0
+            return
+        agent.yaw = (agent.yaw + agent.turn * self.config["turn_speed"] * dt) % 360
+        if agent.route_target:
+            # NavMesh-like navigation: go straight to the target, ignoring the obstacles
+            tx, tz = agent.route_target
+            dist = math.hypot(tx - agent.x, tz - agent.z)
+            step = self.config["move_speed"] * dt
+            if dist <= step:
+                agent.x, agent.z = tx, tz
+                agent.route_target = None
+                agent.speed = 0.0
+            else:
+                agent.x += (tx - agent.x) / dist * step
+                agent.z += (tz - agent.z) / dist * step
+                agent.yaw = math.degrees(math.atan2(tx - agent.x, tz - agent.z)) % 360
+                agent.speed = self.config["move_speed"]
+            return
+        if agent.move == 0:
+            agent.speed = 0.0
+            return
+        step = agent.move * self.config["move_speed"] * dt
+        yaw = math.radians(agent.yaw)
+        nx = agent.x + math.sin(yaw) * step
+        nz = agent.z + math.cos(yaw) * step
+        blocked = abs(nx) > self.half_x - agent.radius or abs(nz) > self.half_z - agent.radius or \
+            any(math.hypot(nx - o.x, nz - o.z) < o.radius + agent.radius for o in self.obstacles)
+        if blocked:
+            agent.speed = 0.0
+            if agent in self.critters:
+                agent.yaw = (agent.yaw + 180) % 360
+        else:
+            agent.x, agent.z = nx, nz
+            agent.speed = self.config["move_speed"]
+
+    def check_contacts(self):
+        """
+        Flowers touched by astronauts are collected (if auto_collect) and astronauts touched by critters get frozen.
+        """
+        astronauts = [a for a in self.agents if a.tag == TAG_ASTRONAUT]
+        critters = [a for a in self.agents if a.tag == TAG_CRITTER] + self.critters
+        for astronaut in astronauts:
+            if self.config["auto_collect"]:
+                for flower in self.flowers:
+                    if math.hypot(flower.x - astronaut.x, flower.z - astronaut.z) <= astronaut.radius + flower.radius:
+                        self.collect(astronaut, TAG_FLOWER)
+                        break
+            for critter in critters:
+                if math.hypot(critter.x - astronaut.x, critter.z - astronaut.z) <= critter.radius + astronaut.radius:
+                    if astronaut.frozen_until <= self.time:
+                        astronaut.frozen_until = self.time + self.config["frozen_time"]
+
+    def build_grid(self):
+        self.grid = {}
+        for body in self.obstacles + self.flowers + self.agents + self.critters:
+            key = (int(body.x // self.cell_size), int(body.z // self.cell_size))
+            self.grid.setdefault(key, []).append(body)
+
+    def nearby_bodies(self, agent):
+        """
+        :return: Bodies in the grid cells that the rays of 'agent' can reach
+        """
+        reach = agent.ray_length + 2
+        x0, x1 = int((agent.x - reach) // self.cell_size), int((agent.x + reach) // self.cell_size)
+        z0, z1 = int((agent.z - reach) // self.cell_size), int((agent.z + reach) // self.cell_size)
+        bodies = []
+        for cx in range(x0, x1 + 1):
+            for cz in range(z0, z1 + 1):
+                bodies.extend(self.grid.get((cx, cz), ()))
+        return bodies
+
+    # ---------------------------------------------------------------- Perception
+    def named_location(self, agent):
+        if math.hypot(agent.x - self.base["x"], agent.z - self.base["z"]) <= self.base["radius"]:
+            return self.base["name"]
+        return ""
+
+    def cast_rays(self, agent):
+        """
+        :return: Ray perception in the format expected by RayCastSensor.set_perception()
+        """
+        bodies = [b for b in self.nearby_bodies(agent) if b is not agent]
+        perception = []
+        for index, angle in enumerate(agent.ray_angles):
+            yaw = math.radians(agent.yaw + angle)
+            dx, dz = math.sin(yaw), math.cos(yaw)
+            nearest = None
+            nearest_dist = agent.ray_length
+            for body in bodies:
+                # Ray-circle intersection
+                ox, oz = body.x - agent.x, body.z - agent.z
+                proj = ox * dx + oz * dz
+                if proj < 0:
+                    continue
+                radius = body.radius + agent.sphere_cast_radius
+                perp2 = ox * ox + oz * oz - proj * proj
+                if perp2 > radius * radius:
+                    continue
+                dist = max(0.0, proj - math.sqrt(radius * radius - perp2))
+                if dist < nearest_dist:
+                    nearest, nearest_dist = body, dist
+            # Walls of the world
+            wall_dist = min((self.half_x - agent.x) / dx if dx > 1e-9 else math.inf,
+                            (-self.half_x - agent.x) / dx if dx < -1e-9 else math.inf,
+                            (self.half_z - agent.z) / dz if dz > 1e-9 else math.inf,
+                            (-self.half_z - agent.z) / dz if dz < -1e-9 else math.inf)
+            if wall_dist < nearest_dist:
+                perception.append([index, 1, {"name": TAG_WALL, "tag": TAG_WALL, "distance": round(wall_dist, 3)}])
+            elif nearest:
+                perception.append([index, 1, {"name": nearest.name, "tag": nearest.tag,
+                                              "distance": round(nearest_dist, 3)}])
+            else:
+                perception.append([index, 0, None])
+        return perception
+
+    def internal_state(self, agent):
+        """
+        :return: Internal state dictionary in the format expected by InternalState.update_internal_state()
+        """
+        named_loc = self.named_location(agent)
+        at_base = named_loc == self.base["name"]
+        return {
+            "isRotatingRight": agent.turn > 0,
+            "isRotatingLeft": agent.turn < 0,
+            "movingForwards": agent.move > 0,
+            "movingBackwards": agent.move < 0,
+            "isFrozen": agent.frozen_until > self.time,
+            "speed": agent.speed,
+            "position": {"x": agent.x, "y": 0.0, "z": agent.z},
+            "rotation": {"x": 0.0, "y": agent.yaw, "z": 0.0},
+            "currentNamedLoc": named_loc,
+            "onRoute": agent.route_target is not None,
+            "targetNamedLoc": agent.target_name if agent.route_target else "",
+            "myInventoryList": agent.inventory_list(),
+            "nearbyContainerInventory": at_base,
+            "nearbyContainerInventoryList": [{"name": name, "amount": amount}
+                                             for name, amount in self.base_inventory.items()] if at_base else []
+        }
+
+    def sensor_content(self, agent):
+        return [self.cast_rays(agent), self.internal_state(agent)]
+
+
+class Simulator:
+    """
+    Websocket server that speaks the same protocol as the Unity server used by AAgent.
+    """
+    def __init__(self, config):
+        self.world = World(config)
+        self.codec = Codec.default_codec
+        self.frame_rate = self.world.config["frame_rate"]
+
+    async def handle_agent(self, request):
+        """
+        Websocket handler of one agent connection.
+        """
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        agent = None
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                msg_dict = self.codec.loads(msg.data)
+                if msg_dict["type"] == "initial_params":
+                    agent_params = self.codec.loads(msg_dict["content"])
+                    agent = self.world.add_agent(agent_params)
+                    await ws.send_str(self.encode("sim_control", "connection_ready"))
+                    if self.world.config["send_start"]:
+                        await ws.send_str(self.encode("sim_control", "start"))
+                    if agent_params.get("initial_task"):
+                        await ws.send_str(self.encode("agent_control", agent_params["initial_task"]))
+                    agent.ws = ws
+                elif msg_dict["type"] == "action" and agent:
+                    self.world.apply_action(agent, msg_dict["content"])
+        finally:
+            if agent:
+                self.world.remove_agent(agent)
+        return ws
+
+    def encode(self, msg_type, content):
+        """
+        Messages sent to the agents use the keys "Type" and "Content", like Unity.
+        """
+        return self.codec.dumps({"Type": msg_type, "Content": content})
+
+    async def simulation_loop(self):
+        """
+        Advances the world with a fixed time step and sends a sensor frame to every connected agent.
+        """
+        dt = 1.0 / self.frame_rate
+        next_time = time.monotonic()
+        while True:
+            self.world.step(dt)
+            for agent in list(self.world.agents):
+                if agent.ws is not None and not agent.ws.closed:
+                    try:
+                        await agent.ws.send_str(self.encode("sensor", self.world.sensor_content(agent)))
+                    except ConnectionResetError:
+                        pass
+            next_time += dt
+            await asyncio.sleep(max(0.0, next_time - time.monotonic()))
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/", self.handle_agent)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        server = self.world.config["Server"]
+        site = web.TCPSite(runner, server["host"], server["port"])
+        await site.start()
+        print(f"Simulator listening on ws://{server['host']}:{server['port']}/")
+        try:
+            await self.simulation_loop()
+        finally:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    world_config = {}
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r') as file:
+            world_config = json.load(file)
+    try:
+        asyncio.run(Simulator(world_config).start())
+    except KeyboardInterrupt:
+        print("Bye!!!")
@@ -4,8 +4,15 @@ import subprocess
 import signal
 import sys
 import asyncio
+import aiohttp # type: ignore
+import Monitor
 from AAgent_BT import AAgent
 
+# Default values of the connection ramp-up. They can be changed in the spawner configuration file with the keys
+# "connections_per_second" and "max_concurrent_connections"
+CONNECTIONS_PER_SECOND = 20
+MAX_CONCURRENT_CONNECTIONS = 10
+
 
 def load_config(json_file):
     with open(json_file, 'r') as file:
@@ -14,30 +21,65 @@ def load_config(json_file):
 
 def start_agents(config_file):
     config = load_config(config_file)
+    connections_per_second = config.get("connections_per_second", CONNECTIONS_PER_SECOND)
+    max_concurrent_connections = config.get("max_concurrent_connections", MAX_CONCURRENT_CONNECTIONS)
 
-    all_agents = []
-    packs = config.get('packs', [])
-    for pack in packs:
-        agent_config_file = pack.get("agent_config_file", "")
-        num_agents = pack.get("num_agents", 1)
+    # One monitor for all the agents ("monitor": true in the spawner configuration file), in its own process
+    monitor_conn = None
+    monitor_process = None
+    if config.get("monitor", False):
+        monitor_conn, child_conn = multiprocessing.Pipe()
+        monitor_process = multiprocessing.Process(target=Monitor.run_pack_monitor_process,
+                                                  args=("AAGENT PACK: " + config_file, child_conn), daemon=True)
+        monitor_process.start()
+        child_conn.close()
 
-        # Create multiple AAgent instances
-        agents_in_pack = [AAgent(agent_config_file) for _ in range(num_agents)]
+    async def run_all_agents():
+        # One aiohttp session (and connector, with its DNS cache) shared by all the agents, instead of one per agent.
+        # The connector has no limit because every agent keeps its websocket connection open till the end
+        connector = aiohttp.TCPConnector(limit=0, use_dns_cache=True, ttl_dns_cache=None)
+        session = aiohttp.ClientSession(connector=connector)
+        # Limits the number of websocket handshakes running at the same time
+        connect_semaphore = asyncio.Semaphore(max_concurrent_connections)
 
-        all_agents.extend(agents_in_pack)
+        all_agents = []
+        packs = config.get('packs', [])
+        for pack in packs:
+            agent_config_file = pack.get("agent_config_file", "")
+            num_agents = pack.get("num_agents", 1)
 
-    async def run_all_agents():
-        tasks = []
-        for agent in all_agents:
-            task = asyncio.create_task(agent.run())
-            tasks.append(task)
+            # Create multiple AAgent instances
+            agents_in_pack = [AAgent(agent_config_file, session, connect_semaphore) for _ in range(num_agents)]
+
+            all_agents.extend(agents_in_pack)
+
+        monitor_task = None
+        if monitor_conn:
+            monitor_task = asyncio.create_task(Monitor.feed_pack_monitor(all_agents, monitor_conn))
+
+        try:
+            tasks = []
+            for agent in all_agents:
+                task = asyncio.create_task(agent.run())
+                tasks.append(task)
+                # Ramp-up: start the agents progressively so we don't flood Unity with simultaneous handshakes
+                if connections_per_second > 0:
+                    await asyncio.sleep(1 / connections_per_second)
 
-        await asyncio.wait(tasks, return_when=asyncio.ALL_COMPLETED)
+            await asyncio.wait(tasks, return_when=asyncio.ALL_COMPLETED)
+        finally:
+            if monitor_task:
+                monitor_task.cancel()
+            await session.close()
 
     try:
         asyncio.run(run_all_agents())
     except KeyboardInterrupt:
         print("Shutting down...")
+    finally:
+        if monitor_process:
+            monitor_conn.close()  # The monitor process finishes when the pipe is closed
+            monitor_process.join(2.0)
 
     print("Bye!!!")
 